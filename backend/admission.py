@@ -0,0 +1,194 @@
+"""
+Controle de admissão: quando o banco fica lento, as requisições se acumulam no worker e
+a latência cresce até os clientes desistirem. Aqui cada classe de rota (auth, leituras,
+escritas, dashboard e leituras em cache) tem um limite de requisições simultâneas que
+se ajusta sozinho pela latência:
+
+- `short` é a média recente do tempo até o início da resposta e `long` a de longo
+  prazo. Enquanto `short` fica perto de `long` o limite cresce; quando passa de
+  `ADMISSION_LATENCY_TOLERANCE` vezes `long`, o limite encolhe na proporção
+  (algoritmo de gradiente, como o Gradient2 do concurrency-limits da Netflix).
+- Acima do limite a requisição espera numa fila por até `ADMISSION_MAX_QUEUE_WAIT_MS`;
+  se não houver vaga, recebe 503 com Retry-After, sem chegar ao banco.
+
+`/`, `/auth/health`, `/stats` e o stream `/eventos/` nunca passam pelo controle, e as
+leituras servidas do cache (temas, lista de esboços, indicadores, bíblia, autocomplete,
+catálogo público) têm uma classe própria: mesmo com as outras rejeitando, a capacidade
+delas continua reservada.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+# O stream de eventos fica aberto por horas: ocuparia uma vaga e distorceria a latência
+UNLIMITED_PATHS = ("/", "/auth/health", "/stats", "/eventos/")
+# Leituras que normalmente saem do cache (ou de memória/mmap) sem consultar o banco
+CACHED_READ_PATHS = ("/temas/", "/esbocos/", "/dashboard/indicators", "/dashboard/facets")
+CACHED_READ_PREFIXES = ("/biblia", "/autocomplete", "/publico")
+
+
+def route_class(scope: Scope) -> Optional[str]:
+    """Classe de admissão da requisição (None: sempre admitida)."""
+    path, method = scope["path"], scope["method"]
+    if path in UNLIMITED_PATHS or method == "OPTIONS":
+        return None
+    if path.startswith("/auth/"):
+        return "auth"
+    if method not in SAFE_METHODS:
+        return "writes"
+    # A listagem de esboços só vem do cache sem parâmetros (ver esbocos.read_esbocos)
+    if (path in CACHED_READ_PATHS and not (path == "/esbocos/" and scope.get("query_string"))) or path.startswith(CACHED_READ_PREFIXES):
+        return "cached"
+    if path.startswith("/dashboard"):
+        return "dashboard"
+    return "reads"
+
+
+class AdaptiveLimiter:
+    """Limite de concorrência de uma classe de rota, com fila de espera curta."""
+
+    def __init__(self, initial: int, minimum: int, maximum: int, tolerance: float, max_wait: float):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.max_wait = max_wait
+        self.inflight = 0
+        self.short_rtt: Optional[float] = None
+        self.long_rtt: Optional[float] = None
+        self.queue_wait = 0.0  # média da espera na fila (s)
+        self.rejected = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> bool:
+        """Ocupa uma vaga, esperando no máximo `max_wait`; False se não conseguiu."""
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return True
+
+        # Fila maior que o limite não vai andar a tempo: rejeita já
+        if len(self._waiters) >= max(1, int(self.limit)) or self.max_wait <= 0:
+            self.rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # A vaga chegou junto com o timeout (ou o cliente desistiu): passa para o próximo
+                self.release()
+            else:
+                waiter.cancel()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected += 1
+            return False
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self.queue_wait = self.queue_wait * 0.9 + (time.monotonic() - start) * 0.1
+        return True
+
+    def release(self):
+        # A vaga passa direto para quem espera (inflight não muda) ou é liberada
+        while self._waiters and self.inflight <= int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.inflight -= 1
+
+    def record(self, rtt: float, inflight: int):
+        """Ajusta o limite com o tempo até o início da resposta de uma requisição."""
+        if self.short_rtt is None:
+            self.short_rtt = self.long_rtt = rtt
+            return
+        self.short_rtt = self.short_rtt * 0.9 + rtt * 0.1
+        self.long_rtt = self.long_rtt * 0.99 + rtt * 0.01
+        # Depois de um período lento a referência de longo prazo volta aos poucos
+        if self.long_rtt > self.short_rtt * 2:
+            self.long_rtt *= 0.95
+
+        # Com pouca carga a latência não diz nada sobre o limite
+        if inflight < self.limit / 2:
+            return
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / self.short_rtt))
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        self.limit = max(self.minimum, min(self.maximum, self.limit * 0.8 + new_limit * 0.2))
+
+    def retry_after(self) -> int:
+        """Segundos sugeridos ao cliente: o tempo para escoar o que está na frente."""
+        rtt = self.short_rtt or 1.0
+        return max(1, math.ceil((self.inflight + len(self._waiters)) / max(self.limit, 1) * rtt))
+
+    def snapshot(self) -> Dict:
+        return {
+            "limit": round(self.limit, 1),
+            "inflight": self.inflight,
+            "queued": len(self._waiters),
+            "queue_wait_ms": round(self.queue_wait * 1000, 1),
+            "latency_ms": round((self.short_rtt or 0) * 1000, 1),
+            "rejected": self.rejected,
+        }
+
+
+class AdmissionControlMiddleware:
+    """Rejeita com 503 + Retry-After o que passa do limite adaptativo de cada classe de rota."""
+
+    CLASSES = ("auth", "reads", "writes", "dashboard", "cached")
+
+    def __init__(self, app: ASGIApp, initial_limit: int, min_limit: int, max_limit: int, tolerance: float, max_queue_wait_ms: float):
+        self.app = app
+        self.limiters = {
+            name: AdaptiveLimiter(initial_limit, min_limit, max_limit, tolerance, max_queue_wait_ms / 1000)
+            for name in self.CLASSES
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        name = route_class(scope) if scope["type"] == "http" else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiters[name]
+        if not await limiter.acquire():
+            logger.warning("Requisição rejeitada pelo controle de admissão (%s)", name, extra={"admission": limiter.snapshot()})
+            response = JSONResponse(
+                {"detail": "Servidor sobrecarregado. Tente novamente em instantes."},
+                status_code=503,
+                headers={"Retry-After": str(limiter.retry_after())},
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.monotonic()
+        inflight = limiter.inflight
+        first_byte = None
+
+        async def send_timed(message: Message):
+            nonlocal first_byte
+            if first_byte is None and message["type"] == "http.response.start":
+                # Só o tempo até o início da resposta: downloads longos não contam como lentidão
+                first_byte = time.monotonic() - start
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            limiter.release()
+            if first_byte is not None:
+                limiter.record(first_byte, inflight)
+
+    def snapshot(self) -> Dict:
+        return {name: limiter.snapshot() for name, limiter in self.limiters.items()}
@@ -0,0 +1,73 @@
+"""
+Aquecimento do cache no login.
+
+Logo depois de `/auth/login` ou do callback do Google o frontend pede, quase juntos,
+o usuário, os indicadores do dashboard, os temas e a lista de esboços; sem isso todos
+erram o cache e vão ao banco ao mesmo tempo. O login agenda `aquecer_usuario` como
+background task, que carrega o principal, os indicadores/facets (a árvore de temas e
+subtemas com as contagens), a listagem de temas e a de esboços no `cache`, cada um só
+se ainda não estiver lá.
+
+Cada aquecimento usa uma única sessão (uma conexão) e no máximo
+`WARMUP_MAX_CONCURRENCY` rodam ao mesmo tempo, então uma rajada de logins não
+sobrecarrega o banco. Acima de `WARMUP_MAX_PENDING` na fila o aquecimento é
+descartado: as próprias requisições do usuário vão preencher o cache.
+"""
+import asyncio
+import logging
+from typing import Optional
+from config import settings
+from compression import warm_cached_response
+from database import ReadSessionLocal
+from dashboard import aquecer_dashboard
+from esbocos import ESBOCOS_CACHE_SECONDS, esbocos_cache_key, listar_esbocos_json
+from security import carregar_principal
+from sharding import user_shard
+from temas import TEMAS_CACHE_SECONDS, listar_temas_json, temas_cache_key
+
+logger = logging.getLogger(__name__)
+
+
+class Aquecimento:
+    def __init__(self, max_concorrencia: int, max_pendentes: int):
+        self.max_concorrencia = max_concorrencia
+        self.max_pendentes = max_pendentes
+        self.pendentes = 0
+        self._limite: Optional[asyncio.Semaphore] = None
+
+    async def aquecer_usuario(self, email: str, accept_encoding: str = ""):
+        """Preenche o cache do usuário; falhas só são registradas (o login já respondeu)."""
+        if self.pendentes >= self.max_pendentes:
+            return
+        # Criado no primeiro uso, dentro do event loop do worker
+        if self._limite is None:
+            self._limite = asyncio.Semaphore(self.max_concorrencia)
+
+        self.pendentes += 1
+        try:
+            async with self._limite:
+                await self._aquecer(email, accept_encoding)
+        except Exception as e:
+            logger.warning("Erro no aquecimento do cache de %s: %s", email, e)
+        finally:
+            self.pendentes -= 1
+
+    async def _aquecer(self, email: str, accept_encoding: str):
+        async with ReadSessionLocal() as db:
+            user = await carregar_principal(db, email)
+            # As demais rotas exigem usuário ativo e com perfil completo
+            if user is None or user.ativo != "S" or user.is_profile_complete != "S":
+                return
+            user_id = user.id
+
+            with user_shard(user_id):
+                await aquecer_dashboard(db, user_id, accept_encoding)
+                await warm_cached_response(
+                    temas_cache_key(user_id), lambda: listar_temas_json(db, user_id), accept_encoding, ex=TEMAS_CACHE_SECONDS
+                )
+                await warm_cached_response(
+                    esbocos_cache_key(user_id), lambda: listar_esbocos_json(db, user_id), accept_encoding, ex=ESBOCOS_CACHE_SECONDS
+                )
+
+
+aquecimento = Aquecimento(settings.WARMUP_MAX_CONCURRENCY, settings.WARMUP_MAX_PENDING)
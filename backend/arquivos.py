@@ -0,0 +1,304 @@
+"""
+Upload e download de arquivos de sermões (PDFs, áudios, etc.).
+
+O conteúdo é gravado em disco endereçado pelo SHA-256 (`<STORAGE_DIR>/blobs/ab/cd/abcd...`),
+então arquivos idênticos ficam uma vez só, mesmo vindos de usuários diferentes; a
+tabela `arquivo` guarda o nome, o tipo e o dono de cada envio. O upload é o corpo
+cru da requisição, lido em pedaços e gravado enquanto chega (o hash e a escrita rodam
+fora do event loop), sem carregar o arquivo inteiro na memória.
+
+O download usa FileResponse (Range/206 e If-Range) ou, atrás do nginx, X-Accel-Redirect
+para o próprio nginx servir o blob com sendfile. Blobs sem nenhuma linha em `arquivo`
+são removidos pelo coletor:
+
+    python arquivos.py coletar [--carencia-horas 24] [--simular]
+"""
+import argparse
+import asyncio
+import hashlib
+import mimetypes
+import os
+import tempfile
+import time
+from typing import AsyncIterator, List, Set, Tuple
+from urllib.parse import quote
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import FileResponse
+from sqlalchemy import delete, distinct, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config import settings
+from database import get_db, get_read_db
+from models import Arquivo, Usuario
+from schemas import Arquivo as ArquivoSchema, ArquivoUso
+from security import get_current_complete_user
+
+# Os pedaços do corpo são juntados até este tamanho antes de cada escrita em disco
+BLOCO_ESCRITA = 1024 * 1024
+
+
+class ArmazenamentoBlobs:
+    """Blobs imutáveis endereçados por SHA-256 em um diretório local."""
+
+    def __init__(self, diretorio: str):
+        self.diretorio = diretorio
+        self.blobs = os.path.join(diretorio, "blobs")
+        self.temporarios = os.path.join(diretorio, "tmp")
+
+    def relativo(self, sha256: str) -> str:
+        return f"{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+    def caminho(self, sha256: str) -> str:
+        return os.path.join(self.blobs, sha256[:2], sha256[2:4], sha256)
+
+    async def receber(self, pedacos: AsyncIterator[bytes], limite: int) -> Tuple[str, int]:
+        """Grava o stream em um temporário calculando o hash e o move para o blob (se ainda não existir)."""
+        os.makedirs(self.temporarios, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=self.temporarios)
+        hasher = hashlib.sha256()
+        tamanho = 0
+
+        try:
+            with os.fdopen(fd, "wb") as saida:
+                def gravar(bloco: bytes):
+                    # hashlib e write liberam o GIL: roda em thread sem travar o event loop
+                    hasher.update(bloco)
+                    saida.write(bloco)
+
+                pendentes: List[bytes] = []
+                acumulado = 0
+                async for pedaco in pedacos:
+                    tamanho += len(pedaco)
+                    if tamanho > limite:
+                        raise HTTPException(
+                            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail="Arquivo excede o tamanho máximo ou a quota disponível"
+                        )
+                    pendentes.append(pedaco)
+                    acumulado += len(pedaco)
+                    if acumulado >= BLOCO_ESCRITA:
+                        await asyncio.to_thread(gravar, b"".join(pendentes))
+                        pendentes, acumulado = [], 0
+                if pendentes:
+                    await asyncio.to_thread(gravar, b"".join(pendentes))
+                await asyncio.to_thread(os.fsync, saida.fileno())
+
+            if tamanho == 0:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Arquivo vazio")
+
+            sha256 = hasher.hexdigest()
+            destino = self.caminho(sha256)
+            if os.path.exists(destino):
+                # Conteúdo repetido: mantém o blob existente e renova o mtime para o coletor
+                os.utime(destino)
+                os.unlink(temporario)
+            else:
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                os.replace(temporario, destino)
+            return sha256, tamanho
+        except BaseException:
+            if os.path.exists(temporario):
+                os.unlink(temporario)
+            raise
+
+    def coletar(self, referenciados: Set[str], carencia_segundos: float, simular: bool = False) -> Tuple[int, int]:
+        """
+        Remove blobs sem referência e temporários abandonados mais antigos que a carência.
+
+        A carência cobre o intervalo entre gravar o blob e fazer o commit da linha em
+        `arquivo` (e uploads que reaproveitam um blob antigo, que renovam o mtime).
+        """
+        limite = time.time() - carencia_segundos
+        removidos, liberados = 0, 0
+        for raiz, _, nomes in os.walk(self.diretorio):
+            for nome in nomes:
+                if raiz.startswith(self.blobs) and nome in referenciados:
+                    continue
+                caminho = os.path.join(raiz, nome)
+                try:
+                    info = os.stat(caminho)
+                    if info.st_mtime > limite:
+                        continue
+                    if not simular:
+                        os.unlink(caminho)
+                except FileNotFoundError:
+                    continue
+                removidos += 1
+                liberados += info.st_size
+        return removidos, liberados
+
+
+armazenamento = ArmazenamentoBlobs(settings.STORAGE_DIR)
+
+
+async def uso_do_usuario(db: AsyncSession, usuario_id: int) -> int:
+    result = await db.execute(select(func.coalesce(func.sum(Arquivo.tamanho), 0)).filter(Arquivo.usuario_id == usuario_id))
+    return int(result.scalar_one())
+
+
+def _para_schema(arquivo: Arquivo) -> dict:
+    return {
+        "id": arquivo.id,
+        "nome": arquivo.nome,
+        "content_type": arquivo.content_type,
+        "tamanho": arquivo.tamanho,
+        "sha256": arquivo.sha256,
+        "created_at": arquivo.created_at,
+        "url": f"{router.prefix}/{arquivo.id}",
+    }
+
+# --- Rotas ---
+
+router = APIRouter(
+    prefix="/arquivos",
+    tags=["arquivos"],
+    dependencies=[Depends(get_current_complete_user)]
+)
+
+@router.post("/", response_model=ArquivoSchema, status_code=status.HTTP_201_CREATED)
+async def upload_arquivo(
+    request: Request,
+    nome: str = Query(..., min_length=1, max_length=255, description="Nome original do arquivo"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_complete_user)
+):
+    """
+    Envia um arquivo. O corpo da requisição é o próprio conteúdo (não multipart),
+    com o Content-Type do arquivo, ex: `curl --data-binary @sermao.pdf -H "Content-Type: application/pdf"`.
+    """
+    usuario_id = current_user.id
+    disponivel = settings.STORAGE_QUOTA_BYTES - await uso_do_usuario(db, usuario_id)
+    limite = min(settings.STORAGE_MAX_FILE_BYTES, disponivel)
+    # Devolve a conexão ao pool enquanto o upload (possivelmente longo) chega
+    await db.rollback()
+
+    declarado = request.headers.get("content-length")
+    if declarado and declarado.isdigit() and int(declarado) > limite:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Arquivo excede o tamanho máximo ou a quota disponível"
+        )
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if not content_type or content_type.startswith("multipart/"):
+        content_type = mimetypes.guess_type(nome)[0] or "application/octet-stream"
+
+    sha256, tamanho = await armazenamento.receber(request.stream(), limite)
+
+    # Confere a quota de novo na transação que grava a linha: uploads simultâneos do mesmo
+    # usuário passaram todos pela conta acima com o mesmo uso. No Postgres a linha do usuário
+    # fica travada até o commit (FOR UPDATE); no SQLite o escritor já é uma conexão só.
+    await db.execute(select(Usuario.id).filter(Usuario.id == usuario_id).with_for_update())
+    if await uso_do_usuario(db, usuario_id) + tamanho > settings.STORAGE_QUOTA_BYTES:
+        await db.rollback()
+        # Sem a linha em `arquivo` o blob fica sem referência e o coletor o remove
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Arquivo excede o tamanho máximo ou a quota disponível"
+        )
+
+    novo_arquivo = Arquivo(
+        usuario_id=usuario_id,
+        sha256=sha256,
+        nome=os.path.basename(nome),
+        content_type=content_type,
+        tamanho=tamanho
+    )
+    db.add(novo_arquivo)
+    await db.commit()
+    await db.refresh(novo_arquivo)
+    return _para_schema(novo_arquivo)
+
+@router.get("/", response_model=List[ArquivoSchema])
+async def listar_arquivos(db: AsyncSession = Depends(get_read_db), current_user: Usuario = Depends(get_current_complete_user)):
+    """Lista os arquivos do usuário."""
+    result = await db.execute(
+        select(Arquivo).filter(Arquivo.usuario_id == current_user.id).order_by(Arquivo.created_at.desc())
+    )
+    return [_para_schema(arquivo) for arquivo in result.scalars().all()]
+
+@router.get("/uso", response_model=ArquivoUso)
+async def uso_arquivos(db: AsyncSession = Depends(get_read_db), current_user: Usuario = Depends(get_current_complete_user)):
+    """Espaço usado e disponível na quota do usuário."""
+    usado = await uso_do_usuario(db, current_user.id)
+    quota = settings.STORAGE_QUOTA_BYTES
+    return {"usado": usado, "quota": quota, "disponivel": max(quota - usado, 0)}
+
+@router.get("/{arquivo_id}")
+async def download_arquivo(
+    arquivo_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Usuario = Depends(get_current_complete_user)
+):
+    """Baixa o arquivo (suporta Range para retomar downloads e tocar áudio/vídeo)."""
+    result = await db.execute(select(Arquivo).filter(Arquivo.id == arquivo_id, Arquivo.usuario_id == current_user.id))
+    arquivo = result.scalars().first()
+    if not arquivo:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Arquivo não encontrado ou não pertence ao usuário")
+
+    # O blob nunca muda: o hash serve de ETag e o cliente pode guardar para sempre
+    etag = f'"{arquivo.sha256}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if settings.STORAGE_ACCEL_REDIRECT_PREFIX:
+        headers["X-Accel-Redirect"] = f"{settings.STORAGE_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{armazenamento.relativo(arquivo.sha256)}"
+        headers["Content-Disposition"] = f"inline; filename*=utf-8''{quote(arquivo.nome)}"
+        return Response(media_type=arquivo.content_type, headers=headers)
+
+    caminho = armazenamento.caminho(arquivo.sha256)
+    if not os.path.exists(caminho):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conteúdo do arquivo não encontrado no armazenamento")
+    return FileResponse(
+        caminho,
+        media_type=arquivo.content_type,
+        filename=arquivo.nome,
+        content_disposition_type="inline",
+        headers=headers
+    )
+
+@router.delete("/{arquivo_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_arquivo(arquivo_id: int, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
+    """Remove o arquivo do usuário (o blob é apagado pelo coletor se ninguém mais o usar)."""
+    stmt = delete(Arquivo).where(Arquivo.id == arquivo_id, Arquivo.usuario_id == current_user.id)
+    result = await db.execute(stmt)
+
+    if result.rowcount == 0:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Arquivo não encontrado ou não pertence ao usuário")
+
+    await db.commit()
+    return {"message": "Arquivo deletado com sucesso"}
+
+# --- Coletor de blobs ---
+
+async def _coletar_cli(carencia_horas: float, simular: bool) -> Tuple[int, int]:
+    from database import AsyncSessionLocal, dispose_engines, init_db
+    from sharding import pinned_shard, shard_names
+
+    await init_db()
+    referenciados = set()
+    try:
+        # Os blobs são compartilhados: vale a referência de qualquer shard
+        for shard in shard_names():
+            with pinned_shard(shard):
+                async with AsyncSessionLocal() as db:
+                    result = await db.execute(select(distinct(Arquivo.sha256)))
+                    referenciados.update(result.scalars().all())
+    finally:
+        await dispose_engines()
+    return armazenamento.coletar(referenciados, carencia_horas * 3600, simular)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenção do armazenamento de arquivos")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    cmd = sub.add_parser("coletar", help="Remove blobs que nenhum arquivo referencia")
+    cmd.add_argument("--carencia-horas", type=float, default=24, help="Só remove o que não foi tocado neste intervalo")
+    cmd.add_argument("--simular", action="store_true", help="Só mostra quanto seria removido")
+    args = parser.parse_args()
+
+    removidos, liberados = asyncio.run(_coletar_cli(args.carencia_horas, args.simular))
+    acao = "seriam removidos" if args.simular else "removidos"
+    print(f"{removidos} blobs/temporários {acao} ({liberados / 1024 / 1024:.1f} MB)")
@@ -0,0 +1,158 @@
+"""
+Resumo de atividade (esboços e versículos criados por dia) para os gráficos do dashboard.
+
+A tabela atividade_resumo guarda uma linha por (usuario_id, periodo, entidade) com a
+quantidade criada naquele dia (UTC). As rotas de criação e deleção ajustam a linha do
+dia na mesma transação da escrita, e o dashboard agrupa os dias em semanas ou meses,
+então qualquer intervalo de datas é lido sem varrer catalogo_esbocos/versiculo_tema.
+
+Para preencher a tabela com os dados já existentes (ou corrigi-la):
+
+    python atividade.py reconstruir [--usuario ID]
+"""
+import argparse
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Union
+from sqlalchemy import delete, func, insert, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from models import AtividadeResumo, CatalogoEsbocos, VersiculoTema
+
+ENTIDADES = {"esboco": CatalogoEsbocos, "versiculo": VersiculoTema}
+# Nome do campo de cada entidade na série devolvida pelo dashboard
+CAMPOS_SERIE = {"esboco": "esbocos", "versiculo": "versiculos"}
+GRANULARIDADES = ("day", "week", "month")
+
+
+def _dia(quando: Union[date, datetime, None]) -> date:
+    """Dia (UTC) do registro; sem data, o dia de hoje."""
+    if quando is None:
+        return datetime.now(timezone.utc).date()
+    if isinstance(quando, datetime):
+        if quando.tzinfo is not None:
+            quando = quando.astimezone(timezone.utc)
+        return quando.date()
+    return quando
+
+
+async def registrar_atividade(
+    db: AsyncSession,
+    usuario_id: int,
+    entidade: str,
+    delta: int = 1,
+    quando: Union[date, datetime, None] = None,
+):
+    """Soma `delta` na linha do dia (upsert). Deve rodar antes do commit da escrita."""
+    insert_dialeto = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+    stmt = insert_dialeto(AtividadeResumo).values(
+        usuario_id=usuario_id,
+        periodo=_dia(quando),
+        entidade=entidade,
+        quantidade=delta,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[AtividadeResumo.usuario_id, AtividadeResumo.periodo, AtividadeResumo.entidade],
+        set_={"quantidade": AtividadeResumo.quantidade + stmt.excluded.quantidade},
+    )
+    await db.execute(stmt)
+
+
+def inicio_do_periodo(dia: date, granularidade: str) -> date:
+    if granularidade == "week":
+        return dia - timedelta(days=dia.weekday())  # segunda-feira
+    if granularidade == "month":
+        return dia.replace(day=1)
+    return dia
+
+
+def _proximo_periodo(periodo: date, granularidade: str) -> date:
+    if granularidade == "week":
+        return periodo + timedelta(days=7)
+    if granularidade == "month":
+        return (periodo.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return periodo + timedelta(days=1)
+
+
+async def serie_atividade(
+    db: AsyncSession,
+    usuario_id: int,
+    inicio: date,
+    fim: date,
+    granularidade: str,
+) -> List[Dict]:
+    """Série contínua (períodos sem atividade vêm com zero) entre `inicio` e `fim`."""
+    result = await db.execute(
+        select(AtividadeResumo.periodo, AtividadeResumo.entidade, AtividadeResumo.quantidade).filter(
+            AtividadeResumo.usuario_id == usuario_id,
+            AtividadeResumo.periodo.between(inicio, fim),
+        )
+    )
+
+    serie: Dict[date, Dict] = {}
+    periodo = inicio_do_periodo(inicio, granularidade)
+    while periodo <= fim:
+        serie[periodo] = {"periodo": periodo.isoformat(), **{campo: 0 for campo in CAMPOS_SERIE.values()}}
+        periodo = _proximo_periodo(periodo, granularidade)
+
+    for dia, entidade, quantidade in result.all():
+        campo = CAMPOS_SERIE.get(entidade)
+        if campo is not None:
+            serie[inicio_do_periodo(dia, granularidade)][campo] += quantidade
+    return list(serie.values())
+
+
+async def reconstruir(db: AsyncSession, usuario_id: Optional[int] = None) -> int:
+    """Recalcula o resumo a partir do created_at (de um usuário ou de todos) no próprio banco."""
+    limpar = delete(AtividadeResumo)
+    if usuario_id is not None:
+        limpar = limpar.where(AtividadeResumo.usuario_id == usuario_id)
+    await db.execute(limpar)
+
+    postgres = db.bind.dialect.name == "postgresql"
+    for entidade, modelo in ENTIDADES.items():
+        # Mesmo dia (UTC) que o caminho incremental usa: no Postgres, date() de um
+        # timestamptz seguiria o fuso da sessão; no SQLite o texto já está em UTC
+        dia = func.date(func.timezone("UTC", modelo.created_at) if postgres else modelo.created_at)
+        contagem = select(modelo.usuario_id, dia, literal(entidade), func.count()).group_by(modelo.usuario_id, dia)
+        if usuario_id is not None:
+            contagem = contagem.filter(modelo.usuario_id == usuario_id)
+        await db.execute(
+            insert(AtividadeResumo).from_select(["usuario_id", "periodo", "entidade", "quantidade"], contagem)
+        )
+    await db.commit()
+
+    total = select(func.count()).select_from(AtividadeResumo)
+    if usuario_id is not None:
+        total = total.filter(AtividadeResumo.usuario_id == usuario_id)
+    return (await db.execute(total)).scalar_one()
+
+
+async def _reconstruir_cli(usuario_id: Optional[int]) -> int:
+    from database import AsyncSessionLocal, dispose_engines, init_db
+    from sharding import pinned_shard, shard_map, shard_names
+
+    await init_db()
+    # Um usuário: só o shard dele; todos: cada shard recalcula os seus
+    shards = shard_names() if usuario_id is None or not shard_map.enabled else [shard_map.shard_for(usuario_id)]
+    linhas = 0
+    try:
+        for shard in shards:
+            with pinned_shard(shard):
+                async with AsyncSessionLocal() as db:
+                    linhas += await reconstruir(db, usuario_id)
+        return linhas
+    finally:
+        await dispose_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenção do resumo de atividade do dashboard")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    cmd = sub.add_parser("reconstruir", help="Recalcula o resumo a partir dos esboços e versículos")
+    cmd.add_argument("--usuario", type=int, default=None, help="Só este usuário (padrão: todos)")
+    args = parser.parse_args()
+
+    linhas = asyncio.run(_reconstruir_cli(args.usuario))
+    print(f"{linhas} linhas no resumo de atividade")
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
 from fastapi.responses import RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
@@ -8,7 +8,8 @@ from config import settings
 from database import get_db
 from models import Usuario
 from schemas import Token, UsuarioLogin, UsuarioRegister
-from security import create_access_token, get_password_hash, verify_password
+from security import create_access_token, descartar_principal, get_password_hash, verify_password
+from aquecimento import aquecimento
 
 router = APIRouter(
     prefix="/auth",
@@ -41,7 +42,7 @@ async def google_login():
     return RedirectResponse(f"{GOOGLE_AUTH_URL}?{query_string}", status_code=status.HTTP_302_FOUND)
 
 @router.get("/google/callback")
-async def google_callback(code: str, db: AsyncSession = Depends(get_db)):
+async def google_callback(code: str, request: Request, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
     """Recebe o código de autorização do Google e troca por um token JWT."""
     
     token_data = {
@@ -103,6 +104,7 @@ async def google_callback(code: str, db: AsyncSession = Depends(get_db)):
         user = new_user
 
     await db.commit()
+    await descartar_principal(user.email)
     await db.refresh(user)
 
     # Cria o token JWT
@@ -111,6 +113,9 @@ async def google_callback(code: str, db: AsyncSession = Depends(get_db)):
         data={"sub": user.email}, expires_delta=access_token_expires
     )
     
+    # Prepara o cache das primeiras telas enquanto o navegador segue o redirecionamento
+    background_tasks.add_task(aquecimento.aquecer_usuario, user.email, request.headers.get("accept-encoding", ""))
+
     # Redireciona para o frontend com o token
     frontend_url = settings.cors_origins_list[0] if settings.cors_origins_list else "http://localhost:5173"
     return RedirectResponse(
@@ -205,7 +210,7 @@ async def register(user_data: UsuarioRegister, db: AsyncSession = Depends(get_db
     return Token(access_token=access_token, token_type="bearer")
 
 @router.post("/login", response_model=Token)
-async def login(credentials: UsuarioLogin, db: AsyncSession = Depends(get_db)):
+async def login(credentials: UsuarioLogin, request: Request, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
     """
     Login manual com email e senha.
     
@@ -254,6 +259,9 @@ async def login(credentials: UsuarioLogin, db: AsyncSession = Depends(get_db)):
         data={"sub": user.email}, expires_delta=access_token_expires
     )
     
+    # Prepara o cache das primeiras telas (dashboard, temas, esboços) depois da resposta
+    background_tasks.add_task(aquecimento.aquecer_usuario, user.email, request.headers.get("accept-encoding", ""))
+    
     return Token(access_token=access_token, token_type="bearer")
 
 @router.get("/health")
@@ -0,0 +1,225 @@
+"""
+Autocomplete de temas, subtemas e referências de versículos.
+
+Cada usuário tem, em memória, um índice ordenado por texto sem acentos; a busca
+por prefixo é um bisect seguido de uma varredura curta, então as páginas não
+precisam baixar todos os temas/versículos só para preencher os campos.
+
+O índice é montado do primário na primeira busca do usuário (uma réplica
+atrasada deixaria o índice sem as últimas escritas), atualizado pelas rotas de
+escrita e descartado nos outros workers via invalidação do cache (pub/sub),
+para ser remontado lá na próxima busca. Ele fica no processo, e não no Redis,
+porque cada tecla consulta o índice inteiro: trazê-lo do cache a cada busca
+custaria mais do que remontá-lo. Como uma invalidação perdida (Redis fora do
+ar) deixaria a cópia do worker velha para sempre, ela expira após
+`AUTOCOMPLETE_TTL_SECONDS`.
+"""
+import bisect
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.future import select
+from cache import cache
+from config import settings
+from database import ReadSessionLocal
+from models import Tema, Subtema, VersiculoTema, Usuario
+from security import get_current_complete_user
+
+MAX_USUARIOS_EM_MEMORIA = 1000
+
+
+def fold(texto: str) -> str:
+    """Minúsculas e sem acentos, para comparar prefixos."""
+    return unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii").lower().strip()
+
+
+class IndicePrefixos:
+    """Lista ordenada de (texto sem acento, id) com os itens por id."""
+
+    def __init__(self):
+        self._ordenado: List[Tuple[str, int]] = []
+        self._itens: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+
+    def adicionar(self, item_id: int, texto: str, item: Dict[str, Any]):
+        self.remover(item_id)
+        dobrado = fold(texto)
+        bisect.insort(self._ordenado, (dobrado, item_id))
+        self._itens[item_id] = (dobrado, item)
+
+    def remover(self, item_id: int):
+        atual = self._itens.pop(item_id, None)
+        if atual is None:
+            return
+        posicao = bisect.bisect_left(self._ordenado, (atual[0], item_id))
+        if posicao < len(self._ordenado) and self._ordenado[posicao] == (atual[0], item_id):
+            del self._ordenado[posicao]
+
+    def remover_se(self, condicao):
+        for item_id in [item_id for item_id, (_, item) in self._itens.items() if condicao(item)]:
+            self.remover(item_id)
+
+    def buscar(self, prefixo: str, limite: int, filtro=None, distintos: bool = False) -> List[Dict[str, Any]]:
+        dobrado = fold(prefixo)
+        resultado: List[Dict[str, Any]] = []
+        vistos = set()
+        posicao = bisect.bisect_left(self._ordenado, (dobrado, -1))
+        while posicao < len(self._ordenado) and len(resultado) < limite:
+            texto, item_id = self._ordenado[posicao]
+            posicao += 1
+            if not texto.startswith(dobrado):
+                break
+            item = self._itens[item_id][1]
+            if filtro is not None and not filtro(item):
+                continue
+            if distintos:
+                if texto in vistos:
+                    continue
+                vistos.add(texto)
+            resultado.append(item)
+        return resultado
+
+
+class IndiceUsuario:
+    def __init__(self):
+        self.montado_em = time.monotonic()
+        self.temas = IndicePrefixos()
+        self.subtemas = IndicePrefixos()
+        self.versiculos = IndicePrefixos()
+
+
+class Autocomplete:
+    """Índices por usuário em um LRU em memória, invalidados junto com o cache."""
+
+    def __init__(self, max_usuarios: int = MAX_USUARIOS_EM_MEMORIA, ttl: Optional[float] = None):
+        self.max_usuarios = max_usuarios
+        self.ttl = settings.AUTOCOMPLETE_TTL_SECONDS if ttl is None else ttl
+        self._usuarios: "OrderedDict[int, IndiceUsuario]" = OrderedDict()
+        cache.add_invalidation_listener(self._on_invalidation)
+
+    @staticmethod
+    def cache_key(usuario_id: int) -> str:
+        return f"autocomplete:{usuario_id}"
+
+    def _on_invalidation(self, key: Optional[str]):
+        if key is None:
+            self._usuarios.clear()
+        elif key.startswith("autocomplete:"):
+            self._usuarios.pop(int(key.split(":", 1)[1]), None)
+
+    def carregado(self, usuario_id: int) -> Optional[IndiceUsuario]:
+        indice = self._usuarios.get(usuario_id)
+        if indice is None:
+            return None
+        if time.monotonic() - indice.montado_em > self.ttl:
+            del self._usuarios[usuario_id]
+            return None
+        self._usuarios.move_to_end(usuario_id)
+        return indice
+
+    async def obter(self, usuario_id: int) -> IndiceUsuario:
+        indice = self.carregado(usuario_id)
+        if indice is not None:
+            return indice
+
+        indice = IndiceUsuario()
+        async with ReadSessionLocal() as db:
+            result = await db.execute(select(Tema.id, Tema.descricao, Tema.ativo).filter(Tema.usuario_id == usuario_id))
+            for tema_id, descricao, ativo in result.all():
+                indice.temas.adicionar(tema_id, descricao, {"id": tema_id, "descricao": descricao, "ativo": ativo})
+
+            result = await db.execute(
+                select(Subtema.id, Subtema.descricao, Subtema.tema_id, Subtema.ativo).join(Tema).filter(Tema.usuario_id == usuario_id)
+            )
+            for subtema_id, descricao, tema_id, ativo in result.all():
+                indice.subtemas.adicionar(subtema_id, descricao, {"id": subtema_id, "descricao": descricao, "tema_id": tema_id, "ativo": ativo})
+
+            result = await db.execute(select(VersiculoTema.id, VersiculoTema.versiculo).filter(VersiculoTema.usuario_id == usuario_id))
+            for versiculo_id, versiculo in result.all():
+                indice.versiculos.adicionar(versiculo_id, versiculo, {"versiculo": versiculo})
+
+        self._usuarios[usuario_id] = indice
+        while len(self._usuarios) > self.max_usuarios:
+            self._usuarios.popitem(last=False)
+        return indice
+
+    # --- Atualizações vindas das rotas de escrita ---
+
+    async def descartar(self, usuario_id: int):
+        """Descarta o índice do usuário em todos os workers (remontado na próxima busca)."""
+        await cache.delete(self.cache_key(usuario_id))
+
+    async def _alterar(self, usuario_id: int, alteracao):
+        indice = self.carregado(usuario_id)
+        if indice is not None:
+            alteracao(indice)
+        # Os outros workers descartam a cópia deles e remontam na próxima busca
+        await cache.invalidate_other_workers(self.cache_key(usuario_id))
+
+    async def registrar_tema(self, usuario_id: int, tema):
+        item = {"id": tema.id, "descricao": tema.descricao, "ativo": tema.ativo}
+        await self._alterar(usuario_id, lambda indice: indice.temas.adicionar(tema.id, tema.descricao, item))
+
+    async def remover_tema(self, usuario_id: int, tema_id: int):
+        def alteracao(indice: IndiceUsuario):
+            indice.temas.remover(tema_id)
+            indice.subtemas.remover_se(lambda item: item["tema_id"] == tema_id)
+        await self._alterar(usuario_id, alteracao)
+
+    async def registrar_subtema(self, usuario_id: int, subtema):
+        item = {"id": subtema.id, "descricao": subtema.descricao, "tema_id": subtema.tema_id, "ativo": subtema.ativo}
+        await self._alterar(usuario_id, lambda indice: indice.subtemas.adicionar(subtema.id, subtema.descricao, item))
+
+    async def remover_subtema(self, usuario_id: int, subtema_id: int):
+        await self._alterar(usuario_id, lambda indice: indice.subtemas.remover(subtema_id))
+
+    async def registrar_versiculo(self, usuario_id: int, versiculo):
+        item = {"versiculo": versiculo.versiculo}
+        await self._alterar(usuario_id, lambda indice: indice.versiculos.adicionar(versiculo.id, versiculo.versiculo, item))
+
+    async def remover_versiculo(self, usuario_id: int, versiculo_id: int):
+        await self._alterar(usuario_id, lambda indice: indice.versiculos.remover(versiculo_id))
+
+
+autocomplete = Autocomplete()
+
+# --- Rotas ---
+
+router = APIRouter(
+    prefix="/autocomplete",
+    tags=["autocomplete"],
+    dependencies=[Depends(get_current_complete_user)]
+)
+
+@router.get("/temas")
+async def autocomplete_temas(
+    q: str = Query("", max_length=200, description="Início da descrição (sem diferenciar acentos/maiúsculas)"),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: Usuario = Depends(get_current_complete_user)
+):
+    """Sugere temas do usuário pelo início da descrição."""
+    indice = await autocomplete.obter(current_user.id)
+    return indice.temas.buscar(q, limit)
+
+@router.get("/subtemas")
+async def autocomplete_subtemas(
+    q: str = Query("", max_length=200),
+    tema_id: Optional[int] = Query(None, description="Restringe aos subtemas de um tema"),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: Usuario = Depends(get_current_complete_user)
+):
+    """Sugere subtemas do usuário pelo início da descrição."""
+    indice = await autocomplete.obter(current_user.id)
+    filtro = (lambda item: item["tema_id"] == tema_id) if tema_id is not None else None
+    return indice.subtemas.buscar(q, limit, filtro=filtro)
+
+@router.get("/versiculos")
+async def autocomplete_versiculos(
+    q: str = Query("", max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: Usuario = Depends(get_current_complete_user)
+):
+    """Sugere referências já cadastradas pelo usuário (sem repetição)."""
+    indice = await autocomplete.obter(current_user.id)
+    return indice.versiculos.buscar(q, limit, distintos=True)
@@ -0,0 +1,638 @@
+"""
+Backup binário do banco inteiro (principal e shards) e restauração em paralelo.
+
+    python backup.py exportar backup.ampb
+    python backup.py verificar backup.ampb
+    python backup.py restaurar backup.ampb [--processos 4] [--substituir]
+    python backup.py restaurar backup.ampb --secao principal=postgresql+asyncpg://.../novo
+
+Cada banco vira uma seção do arquivo (`principal` e uma por shard de `SHARD_URLS`) e cada
+tabela é lida em blocos pela chave primária (`WHERE pk > último ORDER BY pk LIMIT n`, sem
+OFFSET), dentro de uma única transação de leitura por banco. O arquivo é uma sequência
+de quadros
+
+    tipo (1 byte) | tamanho (u32) | crc32 do conteúdo (u32) | conteúdo
+
+com o conteúdo num subconjunto do MessagePack (nil, bool, int, float, str, bin, array,
+map, o timestamp -1 e `date` como extensão 1); os blocos de linhas são comprimidos com
+zstd (ou zlib, sem o pacote zstandard). No fim, um índice aponta o início de cada
+tabela, então cada processo da restauração lê só a sua parte do arquivo.
+
+A restauração cria as tabelas sem índices (e, no PostgreSQL, sem foreign keys), carrega
+cada tabela numa transação — `COPY` no asyncpg, INSERTs em lote no SQLite —, e só então
+cria os índices e as foreign keys e acerta as sequências dos ids. O formato não depende
+do banco: o mesmo arquivo passa um banco do SQLite para o PostgreSQL e vice-versa. O
+SQLite aceita um escritor por vez, então lá as tabelas são carregadas uma a uma.
+
+Cada seção vai para o banco de mesmo nome na configuração atual (`principal` para
+`DATABASE_URL`, os shards pelos nomes em `SHARD_URLS`); `--secao nome=url` muda o destino.
+Tabelas do destino que já têm linhas só são substituídas com `--substituir`.
+"""
+import argparse
+import asyncio
+import datetime
+import multiprocessing
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import MetaData, Table, insert, inspect, literal, select, text, tuple_
+from sqlalchemy.schema import AddConstraint
+
+# zstandard é opcional: sem ele os blocos saem em zlib (e backups em zstd não abrem)
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+MAGIC = b"AMPB\x00\x01"
+FRAME = struct.Struct(">cII")
+# Fim do arquivo: posição do quadro de índice e a assinatura (falta dela = arquivo incompleto)
+FOOTER = struct.Struct(">Q4s")
+PRINCIPAL = "principal"
+CHUNK_ROWS = 5000
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Tipos de quadro
+CABECALHO, TABELA, LINHAS, FIM_TABELA, INDICE = b"H", b"T", b"D", b"E", b"I"
+
+# --- Codificação (subconjunto do MessagePack) ---
+
+_PACK_I32 = struct.Struct(">Bi").pack
+_PACK_I64 = struct.Struct(">Bq").pack
+_PACK_U64 = struct.Struct(">BQ").pack
+_PACK_F64 = struct.Struct(">Bd").pack
+_PACK_LEN16 = struct.Struct(">BH").pack
+_PACK_LEN32 = struct.Struct(">BI").pack
+_PACK_TIMESTAMP = struct.Struct(">BBbIq").pack
+_PACK_DATE = struct.Struct(">Bbi").pack
+
+
+def _pack(value, out: bytearray):
+    if value is None:
+        out.append(0xC0)
+    elif value is True:
+        out.append(0xC3)
+    elif value is False:
+        out.append(0xC2)
+    elif isinstance(value, int):
+        if -32 <= value < 128:
+            out.append(value & 0xFF)
+        elif -2**31 <= value < 2**31:
+            out += _PACK_I32(0xD2, value)
+        elif -2**63 <= value < 2**63:
+            out += _PACK_I64(0xD3, value)
+        else:
+            out += _PACK_U64(0xCF, value)
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+        size = len(data)
+        if size < 32:
+            out.append(0xA0 | size)
+        elif size < 0x100:
+            out += bytes((0xD9, size))
+        elif size < 0x10000:
+            out += _PACK_LEN16(0xDA, size)
+        else:
+            out += _PACK_LEN32(0xDB, size)
+        out += data
+    elif isinstance(value, float):
+        out += _PACK_F64(0xCB, value)
+    elif isinstance(value, datetime.datetime):
+        # Timestamp do MessagePack (UTC); datetimes sem fuso já são UTC neste banco
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        delta = value - EPOCH
+        out += _PACK_TIMESTAMP(0xC7, 12, -1, delta.microseconds * 1000, delta.days * 86400 + delta.seconds)
+    elif isinstance(value, datetime.date):
+        out += _PACK_DATE(0xD6, 1, value.toordinal())
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        size = len(data)
+        if size < 0x100:
+            out += bytes((0xC4, size))
+        elif size < 0x10000:
+            out += _PACK_LEN16(0xC5, size)
+        else:
+            out += _PACK_LEN32(0xC6, size)
+        out += data
+    elif isinstance(value, (list, tuple)):
+        size = len(value)
+        if size < 16:
+            out.append(0x90 | size)
+        elif size < 0x10000:
+            out += _PACK_LEN16(0xDC, size)
+        else:
+            out += _PACK_LEN32(0xDD, size)
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, dict):
+        size = len(value)
+        if size < 16:
+            out.append(0x80 | size)
+        elif size < 0x10000:
+            out += _PACK_LEN16(0xDE, size)
+        else:
+            out += _PACK_LEN32(0xDF, size)
+        for key, item in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    else:
+        raise TypeError(f"Tipo não suportado no backup: {type(value).__name__}")
+
+
+def packb(value) -> bytes:
+    out = bytearray()
+    _pack(value, out)
+    return bytes(out)
+
+
+_UNPACK_FIXED = {
+    0xCA: struct.Struct(">f"), 0xCB: struct.Struct(">d"),
+    0xCC: struct.Struct(">B"), 0xCD: struct.Struct(">H"), 0xCE: struct.Struct(">I"), 0xCF: struct.Struct(">Q"),
+    0xD0: struct.Struct(">b"), 0xD1: struct.Struct(">h"), 0xD2: struct.Struct(">i"), 0xD3: struct.Struct(">q"),
+}
+_UNPACK_LEN = {
+    0xC4: (struct.Struct(">B"), "bin"), 0xC5: (struct.Struct(">H"), "bin"), 0xC6: (struct.Struct(">I"), "bin"),
+    0xD9: (struct.Struct(">B"), "str"), 0xDA: (struct.Struct(">H"), "str"), 0xDB: (struct.Struct(">I"), "str"),
+    0xDC: (struct.Struct(">H"), "array"), 0xDD: (struct.Struct(">I"), "array"),
+    0xDE: (struct.Struct(">H"), "map"), 0xDF: (struct.Struct(">I"), "map"),
+}
+_UNPACK_TIMESTAMP = struct.Struct(">Iq")
+_UNPACK_DATE = struct.Struct(">i")
+
+
+def _unpack(data: bytes, pos: int):
+    byte = data[pos]
+    pos += 1
+    if byte < 0x80:
+        return byte, pos
+    if byte >= 0xE0:
+        return byte - 0x100, pos
+    if byte >= 0xA0 and byte < 0xC0:
+        end = pos + (byte & 0x1F)
+        return data[pos:end].decode("utf-8"), end
+    if byte >= 0x90 and byte < 0xA0:
+        return _unpack_array(data, pos, byte & 0x0F)
+    if byte < 0x90:
+        return _unpack_map(data, pos, byte & 0x0F)
+    if byte == 0xC0:
+        return None, pos
+    if byte == 0xC2:
+        return False, pos
+    if byte == 0xC3:
+        return True, pos
+    fixed = _UNPACK_FIXED.get(byte)
+    if fixed is not None:
+        return fixed.unpack_from(data, pos)[0], pos + fixed.size
+    if byte in _UNPACK_LEN:
+        size_struct, kind = _UNPACK_LEN[byte]
+        size = size_struct.unpack_from(data, pos)[0]
+        pos += size_struct.size
+        if kind == "array":
+            return _unpack_array(data, pos, size)
+        if kind == "map":
+            return _unpack_map(data, pos, size)
+        end = pos + size
+        return (data[pos:end].decode("utf-8") if kind == "str" else data[pos:end]), end
+    if byte == 0xC7 and data[pos] == 12 and data[pos + 1] == 0xFF:
+        nanoseconds, seconds = _UNPACK_TIMESTAMP.unpack_from(data, pos + 2)
+        return EPOCH + datetime.timedelta(seconds=seconds, microseconds=nanoseconds // 1000), pos + 14
+    if byte == 0xD6 and data[pos] == 1:
+        return datetime.date.fromordinal(_UNPACK_DATE.unpack_from(data, pos + 1)[0]), pos + 5
+    raise ValueError(f"Código 0x{byte:02x} inválido no backup")
+
+
+def _unpack_array(data: bytes, pos: int, size: int):
+    items = []
+    for _ in range(size):
+        item, pos = _unpack(data, pos)
+        items.append(item)
+    return items, pos
+
+
+def _unpack_map(data: bytes, pos: int, size: int):
+    items = {}
+    for _ in range(size):
+        key, pos = _unpack(data, pos)
+        items[key], pos = _unpack(data, pos)
+    return items, pos
+
+
+def unpackb(data: bytes):
+    value, pos = _unpack(data, 0)
+    if pos != len(data):
+        raise ValueError("Dados sobrando depois do valor no backup")
+    return value
+
+# --- Arquivo ---
+
+def _compressor(codec: str):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress
+    return lambda data: zlib.compress(data, 6)
+
+
+def _decompressor(codec: str):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("Backup comprimido com zstd: instale o pacote zstandard")
+        return zstandard.ZstdDecompressor().decompress
+    return zlib.decompress
+
+
+class BackupWriter:
+    """Grava o backup em `<caminho>.tmp` e só o renomeia para o nome final em `close()`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.codec = "zstd" if zstandard else "zlib"
+        self._compress = _compressor(self.codec)
+        self._file = open(f"{path}.tmp", "wb")
+        self._file.write(MAGIC)
+        self._frame(CABECALHO, packb({"versao": 1, "codec": self.codec, "criado_em": datetime.datetime.now(datetime.timezone.utc)}))
+        self._index: List[dict] = []
+        self._table: Optional[dict] = None
+
+    def _frame(self, kind: bytes, payload: bytes) -> int:
+        position = self._file.tell()
+        self._file.write(FRAME.pack(kind, len(payload), zlib.crc32(payload)))
+        self._file.write(payload)
+        return position
+
+    def begin_table(self, section: str, table: str, columns: List[str], dialect: str):
+        entry = {"secao": section, "tabela": table, "colunas": columns, "dialeto": dialect}
+        self._table = {**entry, "posicao": self._frame(TABELA, packb(entry)), "linhas": 0}
+
+    def write_rows(self, rows: List[tuple]):
+        self._frame(LINHAS, self._compress(packb(rows)))
+        self._table["linhas"] += len(rows)
+
+    def end_table(self) -> int:
+        table, self._table = self._table, None
+        self._frame(FIM_TABELA, packb({"linhas": table["linhas"]}))
+        self._index.append(table)
+        return table["linhas"]
+
+    def close(self):
+        position = self._frame(INDICE, packb(self._index))
+        self._file.write(FOOTER.pack(position, MAGIC[:4]))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def abort(self):
+        self._file.close()
+        os.unlink(f"{self.path}.tmp")
+
+
+class BackupReader:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as source:
+            if source.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} não é um backup (ou é de outra versão do formato)")
+            header = unpackb(_read_frame(source, CABECALHO))
+            source.seek(0, os.SEEK_END)
+            if source.tell() < len(MAGIC) + FOOTER.size:
+                raise ValueError(f"{path} está incompleto (sem índice)")
+            source.seek(-FOOTER.size, os.SEEK_END)
+            position, signature = FOOTER.unpack(source.read(FOOTER.size))
+            if signature != MAGIC[:4]:
+                raise ValueError(f"{path} está incompleto (sem índice)")
+            source.seek(position)
+            self.index: List[dict] = unpackb(_read_frame(source, INDICE))
+        self.created_at = header["criado_em"]
+        self._decompress = _decompressor(header["codec"])
+
+    def sections(self) -> Dict[str, List[dict]]:
+        sections: Dict[str, List[dict]] = {}
+        for entry in self.index:
+            sections.setdefault(entry["secao"], []).append(entry)
+        return sections
+
+    def read_table(self, position: int) -> Iterator[List[list]]:
+        """Blocos de linhas da tabela que começa em `position` (confere crc e contagem)."""
+        with open(self.path, "rb") as source:
+            source.seek(position)
+            _read_frame(source, TABELA)
+            rows = 0
+            while True:
+                kind, payload = _read_any_frame(source)
+                if kind == FIM_TABELA:
+                    expected = unpackb(payload)["linhas"]
+                    if rows != expected:
+                        raise ValueError(f"Tabela com {rows} linhas no backup, esperadas {expected}")
+                    return
+                if kind != LINHAS:
+                    raise ValueError(f"Quadro {kind!r} inesperado dentro de uma tabela")
+                chunk = unpackb(self._decompress(payload))
+                rows += len(chunk)
+                yield chunk
+
+
+def _read_any_frame(source) -> Tuple[bytes, bytes]:
+    header = source.read(FRAME.size)
+    if len(header) < FRAME.size:
+        raise ValueError("Backup truncado")
+    kind, size, checksum = FRAME.unpack(header)
+    payload = source.read(size)
+    if len(payload) < size:
+        raise ValueError("Backup truncado")
+    if zlib.crc32(payload) != checksum:
+        raise ValueError(f"Checksum inválido no quadro da posição {source.tell() - size - FRAME.size}")
+    return kind, payload
+
+
+def _read_frame(source, expected: bytes) -> bytes:
+    kind, payload = _read_any_frame(source)
+    if kind != expected:
+        raise ValueError(f"Quadro {kind!r} encontrado onde se esperava {expected!r}")
+    return payload
+
+# --- Exportação ---
+
+def section_metadata(section: str) -> MetaData:
+    """Tabelas da seção: todas no principal, só as de conteúdo (sem FKs para `usuario`) nos shards."""
+    import models
+    from sharding import shard_metadata
+    return models.Base.metadata if section == PRINCIPAL else shard_metadata(models.Base.metadata)
+
+
+def _existing_columns(sync_conn, metadata: MetaData) -> Dict[str, List[str]]:
+    inspector = inspect(sync_conn)
+    return {
+        table.key: [column["name"] for column in inspector.get_columns(table.name, schema=table.schema)]
+        for table in metadata.sorted_tables
+        if inspector.has_table(table.name, schema=table.schema)
+    }
+
+
+async def export_section(writer: BackupWriter, section: str, engine, chunk_rows: int) -> int:
+    """Grava todas as tabelas da seção; a leitura toda vê um único snapshot do banco."""
+    metadata = section_metadata(section)
+    total = 0
+    async with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn = await conn.execution_options(isolation_level="REPEATABLE READ")
+        elif conn.dialect.name == "sqlite":
+            # O pysqlite não abre transação para SELECTs: sem o BEGIN cada bloco veria outro estado
+            await conn.exec_driver_sql("BEGIN")
+        existing = await conn.run_sync(_existing_columns, metadata)
+        for table in metadata.sorted_tables:
+            if table.key not in existing:
+                continue
+            columns = [column for column in table.columns if column.name in existing[table.key]]
+            primary_key = list(table.primary_key.columns)
+            key_positions = [columns.index(column) for column in primary_key]
+            query = select(*columns).order_by(*primary_key).limit(chunk_rows)
+
+            writer.begin_table(section, table.key, [column.name for column in columns], conn.dialect.name)
+            last = None
+            while True:
+                chunk_query = query
+                if last is not None:
+                    bounds = [literal(value, column.type) for value, column in zip(last, primary_key)]
+                    chunk_query = query.where(primary_key[0] > bounds[0] if len(bounds) == 1 else tuple_(*primary_key) > tuple_(*bounds))
+                rows = [tuple(row) for row in await conn.execute(chunk_query)]
+                if rows:
+                    writer.write_rows(rows)
+                    last = [rows[-1][position] for position in key_positions]
+                if len(rows) < chunk_rows:
+                    break
+            linhas = writer.end_table()
+            total += linhas
+            print(f"{section}.{table.name}: {linhas} linhas")
+        await conn.rollback()
+    return total
+
+
+async def _exportar_cli(path: str, chunk_rows: int) -> int:
+    from database import SQLALCHEMY_DATABASE_URL, dispose_engines, read_engine, shard_engines
+    from sharding import shard_map
+
+    # Leitores: no SQLite em WAL, conexões só de leitura que não disputam com as escritas
+    engines = {PRINCIPAL: read_engine}
+    for name, (_, reader) in shard_engines.items():
+        # Shard no mesmo banco do principal: o conteúdo já sai na seção principal
+        if shard_map.urls[name] != SQLALCHEMY_DATABASE_URL:
+            engines[name] = reader
+
+    writer = BackupWriter(path)
+    try:
+        total = 0
+        for section, engine in engines.items():
+            total += await export_section(writer, section, engine, chunk_rows)
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        await dispose_engines()
+    return total
+
+# --- Restauração ---
+
+def _bare_metadata(metadata: MetaData, keep_foreign_keys: bool) -> MetaData:
+    """Cópia das tabelas sem índices (e sem FKs), para a carga; eles são criados no fim."""
+    copy = MetaData(schema=metadata.schema)
+    for table in metadata.sorted_tables:
+        bare = table.to_metadata(copy)
+        bare.indexes.clear()
+        if not keep_foreign_keys:
+            for constraint in list(bare.foreign_key_constraints):
+                bare.constraints.discard(constraint)
+                for foreign_key in constraint.elements:
+                    bare.foreign_keys.discard(foreign_key)
+                    foreign_key.parent.foreign_keys.discard(foreign_key)
+    return copy
+
+
+def _prepare_target(sync_conn, metadata: MetaData, replace: bool):
+    inspector = inspect(sync_conn)
+    existing = [table for table in metadata.sorted_tables if inspector.has_table(table.name, schema=table.schema)]
+    if not replace:
+        filled = [table.name for table in existing if sync_conn.execute(select(literal(1)).select_from(table).limit(1)).first()]
+        if filled:
+            raise SystemExit(f"As tabelas {', '.join(filled)} do destino já têm linhas (use --substituir)")
+    metadata.drop_all(sync_conn, tables=existing)
+    # O SQLite não adiciona FKs depois (e só as verifica com PRAGMA foreign_keys): ficam na tabela
+    _bare_metadata(metadata, keep_foreign_keys=sync_conn.dialect.name == "sqlite").create_all(sync_conn)
+
+
+def _finish_target(sync_conn, metadata: MetaData):
+    dialect = sync_conn.dialect.name
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn)
+        if dialect == "sqlite":
+            continue
+        for constraint in table.foreign_key_constraints:
+            sync_conn.execute(AddConstraint(constraint))
+        if dialect == "postgresql" and "id" in table.c and list(table.primary_key.columns) == [table.c.id]:
+            # Os ids vieram do backup: a sequência continua depois do maior
+            sync_conn.execute(
+                text(
+                    f"SELECT setval(pg_get_serial_sequence(:tabela, 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) "
+                    f"FROM {table.schema}.{table.name}"
+                ),
+                {"tabela": f"{table.schema}.{table.name}"},
+            )
+
+
+async def restore_table(conn, table: Table, reader: BackupReader, entry: dict) -> int:
+    """Carrega uma tabela numa transação: COPY no asyncpg, executemany nos outros drivers."""
+    columns = entry["colunas"]
+    # Colunas que o modelo não tem mais ficam de fora; as novas recebem o default
+    keep = [position for position, name in enumerate(columns) if name in table.c]
+    names = [columns[position] for position in keep]
+    rows_total = 0
+    async with conn.begin():
+        if conn.dialect.driver == "asyncpg":
+            await conn.execute(text("SET LOCAL synchronous_commit = off"))
+            raw = (await conn.get_raw_connection()).driver_connection
+        for rows in reader.read_table(entry["posicao"]):
+            if len(keep) != len(columns):
+                rows = [[row[position] for position in keep] for row in rows]
+            if conn.dialect.driver == "asyncpg":
+                await raw.copy_records_to_table(table.name, schema_name=table.schema, columns=names, records=rows)
+            else:
+                await conn.execute(insert(table), [dict(zip(names, row)) for row in rows])
+            rows_total += len(rows)
+    return rows_total
+
+
+def _restore_table_process(url: str, path: str, section: str, entry: dict) -> int:
+    """Executada nos processos da restauração paralela (um engine próprio por processo)."""
+    return asyncio.run(_restore_table_alone(url, path, section, entry))
+
+
+async def _restore_table_alone(url: str, path: str, section: str, entry: dict) -> int:
+    from database import create_engine_for
+    engine = create_engine_for(url)
+    try:
+        async with engine.connect() as conn:
+            return await restore_table(conn, section_metadata(section).tables[entry["tabela"]], BackupReader(path), entry)
+    finally:
+        await engine.dispose()
+
+
+async def restore_section(reader: BackupReader, section: str, entries: List[dict], url: str, processes: int, replace: bool) -> int:
+    from database import create_engine_for
+
+    metadata = section_metadata(section)
+    for entry in entries:
+        if entry["tabela"] not in metadata.tables:
+            print(f"{section}.{entry['tabela']}: tabela não existe mais nos modelos, ignorada")
+    entries = [entry for entry in entries if entry["tabela"] in metadata.tables]
+
+    engine = create_engine_for(url)
+    total = 0
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(_prepare_target, metadata, replace)
+
+        if engine.dialect.name == "sqlite" or processes <= 1:
+            async with engine.connect() as conn:
+                if engine.dialect.name == "sqlite":
+                    # Carga de um banco novo: se cair no meio, restaura-se de novo
+                    schema = metadata.schema
+                    await conn.exec_driver_sql(f"PRAGMA {schema}.synchronous = OFF" if schema else "PRAGMA synchronous = OFF")
+                    await conn.commit()
+                for entry in entries:
+                    linhas = await restore_table(conn, metadata.tables[entry["tabela"]], reader, entry)
+                    print(f"{section}.{metadata.tables[entry['tabela']].name}: {linhas} linhas")
+                    total += linhas
+        else:
+            loop = asyncio.get_running_loop()
+            # "spawn": processos limpos, cada um com seu engine e seu event loop
+            with ProcessPoolExecutor(max_workers=min(processes, len(entries)), mp_context=multiprocessing.get_context("spawn")) as pool:
+                # As maiores primeiro, para nenhuma ficar sozinha no fim
+                ordered = sorted(entries, key=lambda entry: entry["linhas"], reverse=True)
+                tasks = [loop.run_in_executor(pool, _restore_table_process, url, reader.path, section, entry) for entry in ordered]
+                for entry, linhas in zip(ordered, await asyncio.gather(*tasks)):
+                    print(f"{section}.{metadata.tables[entry['tabela']].name}: {linhas} linhas")
+                    total += linhas
+
+        async with engine.begin() as conn:
+            await conn.run_sync(_finish_target, metadata)
+    finally:
+        await engine.dispose()
+    return total
+
+
+async def _restaurar_cli(path: str, targets: Dict[str, str], processes: int, replace: bool) -> int:
+    from database import SQLALCHEMY_DATABASE_URL
+    from sharding import shard_map
+
+    reader = BackupReader(path)
+    sections = reader.sections()
+    urls = {}
+    for section in sections:
+        url = targets.get(section) or (SQLALCHEMY_DATABASE_URL if section == PRINCIPAL else shard_map.urls.get(section))
+        if url is None:
+            raise SystemExit(f"O shard {section} do backup não está em SHARD_URLS (use --secao {section}=URL)")
+        urls[section] = url
+    shard_urls = [url for section, url in urls.items() if section != PRINCIPAL]
+    if len(set(shard_urls)) != len(shard_urls):
+        raise SystemExit("Duas seções do backup iriam para o mesmo banco")
+
+    total = 0
+    # O principal antes: um shard no mesmo banco substitui as tabelas (vazias) de conteúdo dele
+    for section in sorted(sections, key=lambda name: name != PRINCIPAL):
+        total += await restore_section(reader, section, sections[section], urls[section], processes, replace)
+    return total
+
+
+def _verificar(path: str) -> int:
+    reader = BackupReader(path)
+    total = 0
+    for entry in reader.index:
+        linhas = sum(len(rows) for rows in reader.read_table(entry["posicao"]))
+        print(f"{entry['secao']}.{entry['tabela'].split('.')[-1]}: {linhas} linhas ({entry['dialeto']})")
+        total += linhas
+    print(f"Backup de {reader.created_at:%Y-%m-%d %H:%M:%S} UTC íntegro")
+    return total
+
+
+def _parse_targets(items: List[str]) -> Dict[str, str]:
+    targets = {}
+    for item in items:
+        name, sep, url = item.partition("=")
+        if not sep or not url:
+            raise SystemExit(f"--secao espera nome=url, recebeu {item!r}")
+        targets[name.strip()] = url.strip()
+    return targets
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backup e restauração do banco (principal e shards)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    cmd = sub.add_parser("exportar", help="Grava o conteúdo de todas as tabelas no arquivo")
+    cmd.add_argument("arquivo")
+    cmd.add_argument("--bloco", type=int, default=CHUNK_ROWS, help="Linhas lidas por consulta")
+    cmd = sub.add_parser("verificar", help="Confere checksums e contagens sem tocar no banco")
+    cmd.add_argument("arquivo")
+    cmd = sub.add_parser("restaurar", help="Recria as tabelas a partir do arquivo")
+    cmd.add_argument("arquivo")
+    cmd.add_argument("--processos", type=int, default=min(4, os.cpu_count() or 1), help="Tabelas carregadas em paralelo (PostgreSQL)")
+    cmd.add_argument("--secao", action="append", default=[], help="Destino de uma seção: nome=url")
+    cmd.add_argument("--substituir", action="store_true", help="Apaga as tabelas do destino mesmo se tiverem linhas")
+    args = parser.parse_args()
+
+    inicio = time.monotonic()
+    try:
+        if args.comando == "exportar":
+            total = asyncio.run(_exportar_cli(args.arquivo, args.bloco))
+            print(f"{total} linhas em {args.arquivo} ({os.path.getsize(args.arquivo) / 1024 / 1024:.1f} MB)")
+        elif args.comando == "verificar":
+            total = _verificar(args.arquivo)
+        else:
+            total = asyncio.run(_restaurar_cli(args.arquivo, _parse_targets(args.secao), args.processos, args.substituir))
+            print(f"{total} linhas restauradas")
+    except ValueError as e:
+        raise SystemExit(f"Backup inválido: {e}")
+    print(f"{time.monotonic() - inicio:.1f}s")
@@ -0,0 +1,104 @@
+"""
+Benchmark da serialização das listagens `/esbocos/` e `/versiculos/`.
+
+Compara o caminho padrão (ORM + validação do `response_model` linha a linha)
+com o caminho rápido (`FAST_LIST_RESPONSES`, tuplas -> TypeAdapter -> JSON).
+
+Uso (a partir da pasta backend/):
+    python benchmarks/bench_list_serialization.py --rows 2000 --repeat 20
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DB_FILE = os.path.join(tempfile.mkdtemp(prefix="bench_meupastor_"), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_FILE}"
+
+import database  # noqa: E402
+import logging  # noqa: E402
+logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+database.engine.echo = False
+
+from fastapi.testclient import TestClient  # noqa: E402
+from config import settings  # noqa: E402
+from compression import invalidate_cached_response  # noqa: E402
+from esbocos import esbocos_cache_key  # noqa: E402
+from main import app  # noqa: E402
+
+
+def seed(client: TestClient, rows: int) -> dict:
+    response = client.post("/auth/register", json={
+        "nome": "Pastor Benchmark",
+        "email": "bench@example.com",
+        "password": "benchmark",
+        "telefone_contato": "0",
+        "perfil_usuario": "pastor",
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    tema = client.post("/temas/", json={"descricao": "Fé"}, headers=headers).json()
+
+    # Insere em lote direto no banco (a criação via API não é o que está sendo medido)
+    import asyncio
+    from models import CatalogoEsbocos, VersiculoTema
+
+    async def _insert():
+        async with database.AsyncSessionLocal() as db:
+            db.add_all(CatalogoEsbocos(
+                tema_id=tema["id"], titulo=f"Esboço {i}", texto_biblico="João 3:16",
+                resumo="Resumo " * 40, esboco_manual="Tópico\n" * 200, usuario_id=tema["usuario_id"],
+            ) for i in range(rows))
+            db.add_all(VersiculoTema(
+                tema_id=tema["id"], versiculo=f"Salmos 23:{i}",
+                descricao_versiculo="O Senhor é o meu pastor, nada me faltará. " * 3, usuario_id=tema["usuario_id"],
+            ) for i in range(rows))
+            await db.commit()
+
+    asyncio.run(_insert())
+    return headers, tema["usuario_id"]
+
+
+def measure(client: TestClient, path: str, headers: dict, repeat: int, cache_key: str = None) -> tuple:
+    client.get(path, headers=headers)  # aquecimento
+    timings = []
+    body = b""
+    for _ in range(repeat):
+        if cache_key:
+            # A listagem padrão fica em cache: sem descartar, os dois lados mediriam só o cache
+            client.portal.call(invalidate_cached_response, cache_key)
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        timings.append(time.perf_counter() - start)
+        body = response.content
+    timings.sort()
+    return timings[len(timings) // 2], body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with TestClient(app) as client:
+        headers, usuario_id = seed(client, args.rows)
+        # Sem compressão: o que se mede é a serialização
+        headers["Accept-Encoding"] = "identity"
+        print(f"{args.rows} linhas por rota, mediana de {args.repeat} requisições\n")
+        print(f"{'rota':<14}{'padrão (ms)':>14}{'rápido (ms)':>14}{'ganho':>9}")
+        for path, cache_key in (("/esbocos/", esbocos_cache_key(usuario_id)), ("/versiculos/", None)):
+            settings.FAST_LIST_RESPONSES = False
+            slow, slow_body = measure(client, path, headers, args.repeat, cache_key)
+            settings.FAST_LIST_RESPONSES = True
+            fast, fast_body = measure(client, path, headers, args.repeat, cache_key)
+            assert json.loads(slow_body) == json.loads(fast_body), f"JSON divergente em {path}"
+            print(f"{path:<14}{slow * 1000:>14.1f}{fast * 1000:>14.1f}{slow / fast:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
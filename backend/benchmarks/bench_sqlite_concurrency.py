@@ -0,0 +1,169 @@
+"""
+Benchmark do SQLite sob carga concorrente: modo de produção (WAL, pragmas, pool de
+leitores e uma conexão de escrita com fila) contra o engine único de antes (SQLITE_WAL=0).
+
+Cada modo usa um arquivo novo com os mesmos dados. `--processes` processos (como os
+workers do Gunicorn) rodam `--tasks` tarefas concorrentes cada, com `--ops` operações
+por tarefa: `--writes` (fração) são inserções de esboço com commit e o resto listagens
+dos esboços do usuário. Mostra vazão, latências e quantas operações falharam (ex:
+"database is locked").
+
+Uso (a partir da pasta backend/):
+    python benchmarks/bench_sqlite_concurrency.py --processes 2 --tasks 16 --ops 50 --writes 0.2
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# O engine padrão do módulo não é usado; cada modo cria o seu arquivo
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_sqlite_'), 'unused.db')}"
+
+from sqlalchemy.exc import SQLAlchemyError  # noqa: E402
+from sqlalchemy.future import select  # noqa: E402
+from database import Base, create_primary_engines, create_session_factory  # noqa: E402
+from models import CatalogoEsbocos, Tema, Usuario  # noqa: E402
+
+logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+
+
+async def prepare(url: str, wal: bool, rows: int):
+    """Cria as tabelas e os dados iniciais; retorna (usuario_id, tema_id)."""
+    writer, reader = create_primary_engines(url, wal=wal)
+    for engine in {writer, reader}:
+        engine.echo = False
+    try:
+        async with writer.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with create_session_factory(writer)() as db:
+            usuario = Usuario(username="bench", nome="Pastor Benchmark", email="bench@example.com", is_profile_complete="S")
+            db.add(usuario)
+            await db.flush()
+            tema = Tema(descricao="Fé", usuario_id=usuario.id)
+            db.add(tema)
+            await db.flush()
+            db.add_all(
+                CatalogoEsbocos(tema_id=tema.id, titulo=f"Esboço {i}", texto_biblico="João 3:16", resumo="Resumo " * 40, usuario_id=usuario.id)
+                for i in range(rows)
+            )
+            await db.commit()
+            return usuario.id, tema.id
+    finally:
+        for engine in {writer, reader}:
+            await engine.dispose()
+
+
+async def run_tasks(url: str, wal: bool, ids, args, process_index: int) -> dict:
+    """Roda `args.tasks` tarefas concorrentes num processo (como um worker do Gunicorn)."""
+    usuario_id, tema_id = ids
+    writer, reader = create_primary_engines(url, wal=wal)
+    for engine in {writer, reader}:
+        engine.echo = False
+    write_sessions = create_session_factory(writer)
+    read_sessions = write_sessions if reader is writer else create_session_factory(reader)
+    latencies = {"leitura": [], "escrita": []}
+    errors = {}
+
+    async def worker(seed: int):
+        rng = random.Random(seed)
+        for i in range(args.ops):
+            kind = "escrita" if rng.random() < args.writes else "leitura"
+            start = time.perf_counter()
+            try:
+                if kind == "escrita":
+                    async with write_sessions() as db:
+                        db.add(CatalogoEsbocos(
+                            tema_id=tema_id, titulo=f"Novo {seed}-{i}", texto_biblico="Sl 23", resumo="r", usuario_id=usuario_id,
+                        ))
+                        await db.commit()
+                else:
+                    async with read_sessions() as db:
+                        result = await db.execute(
+                            select(CatalogoEsbocos.id, CatalogoEsbocos.titulo)
+                            .filter(CatalogoEsbocos.usuario_id == usuario_id)
+                            .order_by(CatalogoEsbocos.created_at.desc())
+                            .limit(50)
+                        )
+                        result.all()
+            except SQLAlchemyError as e:
+                message = str(getattr(e, "orig", e)).splitlines()[0]
+                errors[message] = errors.get(message, 0) + 1
+                continue
+            latencies[kind].append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker(process_index * args.tasks + seed) for seed in range(args.tasks)))
+    for engine in {writer, reader}:
+        await engine.dispose()
+    return {"latencies": latencies, "errors": errors}
+
+
+def _process_main(params) -> dict:
+    url, wal, ids, args, process_index = params
+    return asyncio.run(run_tasks(url, wal, ids, args, process_index))
+
+
+def run_mode(wal: bool, args) -> dict:
+    url = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_sqlite_'), 'bench.db')}"
+    ids = asyncio.run(prepare(url, wal, args.rows))
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.processes) as pool:
+        results = pool.map(_process_main, [(url, wal, ids, args, index) for index in range(args.processes)])
+    elapsed = time.perf_counter() - start
+
+    merged = {"elapsed": elapsed, "latencies": {"leitura": [], "escrita": []}, "errors": {}}
+    for result in results:
+        for kind, values in result["latencies"].items():
+            merged["latencies"][kind].extend(values)
+        for message, count in result["errors"].items():
+            merged["errors"][message] = merged["errors"].get(message, 0) + count
+    return merged
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=2, help="Processos (workers do Gunicorn) no mesmo arquivo")
+    parser.add_argument("--tasks", type=int, default=16, help="Requisições concorrentes por processo")
+    parser.add_argument("--ops", type=int, default=50, help="Operações por tarefa")
+    parser.add_argument("--writes", type=float, default=0.2, help="Fração de escritas")
+    parser.add_argument("--rows", type=int, default=2000, help="Esboços iniciais")
+    args = parser.parse_args()
+
+    total = args.processes * args.tasks * args.ops
+    print(
+        f"{args.processes} processos x {args.tasks} tarefas x {args.ops} operações "
+        f"({args.writes:.0%} escritas), {args.rows} esboços iniciais\n"
+    )
+    print(f"{'modo':<10}{'ops/s':>9}{'leitura p50/p95 (ms)':>24}{'escrita p50/p95 (ms)':>24}{'falhas':>9}")
+    for label, wal in (("anterior", False), ("wal", True)):
+        result = run_mode(wal, args)
+        reads, writes = result["latencies"]["leitura"], result["latencies"]["escrita"]
+        failures = sum(result["errors"].values())
+        print(
+            f"{label:<10}{(total - failures) / result['elapsed']:>9.0f}"
+            f"{percentile(reads, 0.5) * 1000:>13.1f} / {percentile(reads, 0.95) * 1000:<8.1f}"
+            f"{percentile(writes, 0.5) * 1000:>13.1f} / {percentile(writes, 0.95) * 1000:<8.1f}"
+            f"{failures:>9}"
+        )
+        for message, count in result["errors"].items():
+            print(f"{'':<10}{count} x {message}")
+
+
+if __name__ == "__main__":
+    main()
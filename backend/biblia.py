@@ -0,0 +1,434 @@
+"""
+Acervo offline de textos bíblicos (traduções de domínio público).
+
+Cada tradução é empacotada em um arquivo binário `<BIBLIA_DIR>/<traducao>.bin`,
+aberto com mmap. O arquivo tem três blocos:
+
+    cabeçalho  "<8sHHIQQQ": magic, versão, reservado, quantidade, offset das
+               chaves, offset dos offsets de texto, offset do texto
+    chaves     uint32 ordenados: livro * 1_000_000 + capítulo * 1_000 + versículo
+    offsets    uint32 (quantidade + 1), início de cada versículo no bloco de texto
+    texto      UTF-8 de todos os versículos, em sequência
+
+Uma referência vira uma faixa de chaves, resolvida com bisect direto sobre o
+mmap, sem carregar o texto para a memória. Para gerar um arquivo:
+
+    python biblia.py empacotar almeida.json biblia/almeida.bin
+"""
+import argparse
+import bisect
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import unicodedata
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Query, status
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MPBIBLIA"
+VERSION = 1
+HEADER = struct.Struct("<8sHHIQQQ")
+
+# (id, nome em português, nome em inglês, abreviações aceitas)
+LIVROS: List[Tuple[int, str, str, Tuple[str, ...]]] = [
+    (1, "Gênesis", "Genesis", ("gn", "gen")),
+    (2, "Êxodo", "Exodus", ("ex", "exo")),
+    (3, "Levítico", "Leviticus", ("lv", "lev")),
+    (4, "Números", "Numbers", ("nm", "num")),
+    (5, "Deuteronômio", "Deuteronomy", ("dt", "deut")),
+    (6, "Josué", "Joshua", ("js", "jos", "josh")),
+    (7, "Juízes", "Judges", ("jz", "jui", "judg")),
+    (8, "Rute", "Ruth", ("rt",)),
+    (9, "1 Samuel", "1 Samuel", ("1sm", "1sa", "1sam")),
+    (10, "2 Samuel", "2 Samuel", ("2sm", "2sa", "2sam")),
+    (11, "1 Reis", "1 Kings", ("1rs", "1re", "1kgs")),
+    (12, "2 Reis", "2 Kings", ("2rs", "2re", "2kgs")),
+    (13, "1 Crônicas", "1 Chronicles", ("1cr", "1cro", "1chr")),
+    (14, "2 Crônicas", "2 Chronicles", ("2cr", "2cro", "2chr")),
+    (15, "Esdras", "Ezra", ("ed", "esd")),
+    (16, "Neemias", "Nehemiah", ("ne", "nee", "neh")),
+    (17, "Ester", "Esther", ("et", "est")),
+    (18, "Jó", "Job", ("jb",)),
+    (19, "Salmos", "Psalms", ("sl", "sal", "ps", "psa", "salmo")),
+    (20, "Provérbios", "Proverbs", ("pv", "pr", "prov")),
+    (21, "Eclesiastes", "Ecclesiastes", ("ec", "ecl", "eccl")),
+    (22, "Cânticos", "Song of Solomon", ("ct", "cant", "canticos dos canticos", "cantares", "song")),
+    (23, "Isaías", "Isaiah", ("is", "isa")),
+    (24, "Jeremias", "Jeremiah", ("jr", "jer")),
+    (25, "Lamentações", "Lamentations", ("lm", "lam")),
+    (26, "Ezequiel", "Ezekiel", ("ez", "eze", "ezek")),
+    (27, "Daniel", "Daniel", ("dn", "dan")),
+    (28, "Oséias", "Hosea", ("os", "oseias", "hos")),
+    (29, "Joel", "Joel", ("jl",)),
+    (30, "Amós", "Amos", ("am",)),
+    (31, "Obadias", "Obadiah", ("ob", "obd", "obad")),
+    (32, "Jonas", "Jonah", ("jn", "jon")),
+    (33, "Miquéias", "Micah", ("mq", "miqueias", "mic")),
+    (34, "Naum", "Nahum", ("na", "nah")),
+    (35, "Habacuque", "Habakkuk", ("hc", "hab")),
+    (36, "Sofonias", "Zephaniah", ("sf", "sof", "zeph")),
+    (37, "Ageu", "Haggai", ("ag", "hag")),
+    (38, "Zacarias", "Zechariah", ("zc", "zac", "zech")),
+    (39, "Malaquias", "Malachi", ("ml", "mal")),
+    (40, "Mateus", "Matthew", ("mt", "mat", "matt")),
+    (41, "Marcos", "Mark", ("mc", "mar", "mk", "mrk")),
+    (42, "Lucas", "Luke", ("lc", "luc", "lk", "luk")),
+    (43, "João", "John", ("jo", "joao", "jhn", "joh")),
+    (44, "Atos", "Acts", ("at", "atos dos apostolos", "act")),
+    (45, "Romanos", "Romans", ("rm", "rom")),
+    (46, "1 Coríntios", "1 Corinthians", ("1co", "1cor")),
+    (47, "2 Coríntios", "2 Corinthians", ("2co", "2cor")),
+    (48, "Gálatas", "Galatians", ("gl", "gal")),
+    (49, "Efésios", "Ephesians", ("ef", "efe", "eph")),
+    (50, "Filipenses", "Philippians", ("fp", "fil", "phil")),
+    (51, "Colossenses", "Colossians", ("cl", "col")),
+    (52, "1 Tessalonicenses", "1 Thessalonians", ("1ts", "1tes", "1th", "1thess")),
+    (53, "2 Tessalonicenses", "2 Thessalonians", ("2ts", "2tes", "2th", "2thess")),
+    (54, "1 Timóteo", "1 Timothy", ("1tm", "1tim", "1ti")),
+    (55, "2 Timóteo", "2 Timothy", ("2tm", "2tim", "2ti")),
+    (56, "Tito", "Titus", ("tt", "tit")),
+    (57, "Filemom", "Philemon", ("fm", "flm", "phlm")),
+    (58, "Hebreus", "Hebrews", ("hb", "heb")),
+    (59, "Tiago", "James", ("tg", "jas", "jam")),
+    (60, "1 Pedro", "1 Peter", ("1pe", "1pd", "1pet")),
+    (61, "2 Pedro", "2 Peter", ("2pe", "2pd", "2pet")),
+    (62, "1 João", "1 John", ("1jo", "1joao", "1jn")),
+    (63, "2 João", "2 John", ("2jo", "2joao", "2jn")),
+    (64, "3 João", "3 John", ("3jo", "3joao", "3jn")),
+    (65, "Judas", "Jude", ("jd", "jud")),
+    (66, "Apocalipse", "Revelation", ("ap", "apoc", "rev", "re")),
+]
+
+NOMES_LIVROS: Dict[int, str] = {livro_id: nome for livro_id, nome, _, _ in LIVROS}
+
+
+def fold(texto: str) -> str:
+    """Minúsculas, sem acentos e sem espaços/pontos (para comparar nomes de livros)."""
+    sem_acento = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[\s.]+", "", sem_acento.lower())
+
+
+def _montar_indice_livros() -> Dict[str, int]:
+    indice: Dict[str, int] = {}
+    for livro_id, nome, nome_en, abreviacoes in LIVROS:
+        for alias in (nome, nome_en, *abreviacoes):
+            indice.setdefault(fold(alias), livro_id)
+    # Sem acento "jó" e "jo" colidem: "Jo" é João; Jó só com acento (ver _livro_id)
+    indice[fold("jo")] = 43
+    return indice
+
+
+INDICE_LIVROS = _montar_indice_livros()
+
+
+def _livro_id(nome: str) -> Optional[int]:
+    if re.sub(r"[\s.]+", "", unicodedata.normalize("NFC", nome).lower()) == "jó":
+        return 18
+    return INDICE_LIVROS.get(fold(nome))
+
+
+def chave(livro: int, capitulo: int, versiculo: int) -> int:
+    return livro * 1_000_000 + capitulo * 1_000 + versiculo
+
+
+def decompor_chave(valor: int) -> Tuple[int, int, int]:
+    return valor // 1_000_000, (valor // 1_000) % 1_000, valor % 1_000
+
+
+class Referencia(NamedTuple):
+    """Faixa de versículos, do primeiro ao último (inclusive), em chaves numéricas."""
+    inicio: int
+    fim: int
+
+    @property
+    def canonica(self) -> str:
+        """Forma gravada em `VersiculoTema.referencia_canonica` (ex: 43003016-43003018)."""
+        return f"{self.inicio:08d}-{self.fim:08d}"
+
+    @classmethod
+    def de_canonica(cls, valor: str) -> "Referencia":
+        inicio, _, fim = valor.partition("-")
+        return cls(int(inicio), int(fim or inicio))
+
+    def formatar(self) -> str:
+        livro, capitulo, versiculo = decompor_chave(self.inicio)
+        livro_fim, capitulo_fim, versiculo_fim = decompor_chave(self.fim)
+        texto = f"{NOMES_LIVROS.get(livro, livro)} {capitulo}"
+        if versiculo == 1 and versiculo_fim == 999:
+            # Capítulos inteiros
+            return texto if capitulo == capitulo_fim else f"{texto}-{capitulo_fim}"
+        texto += f":{versiculo}"
+        if self.fim != self.inicio:
+            texto += f"-{capitulo_fim}:{versiculo_fim}" if capitulo_fim != capitulo else f"-{versiculo_fim}"
+        return texto
+
+
+_REFERENCIA_RE = re.compile(
+    r"^\s*(?P<livro>[1-3]?\s*[^\d]+?)\s*"
+    r"(?P<cap>\d+)"
+    r"(?:\s*[:.,]\s*(?P<v1>\d+))?"
+    r"(?:\s*[-–]\s*(?:(?P<cap2>\d+)\s*[:.,]\s*)?(?P<v2>\d+))?\s*$"
+)
+
+
+def parse_referencia(texto: str) -> Optional[Referencia]:
+    """
+    Interpreta referências como "João 3:16", "Jo 3.16-18", "1Co 13", "Sl 23:1-24:2".
+
+    Retorna None quando o livro não é reconhecido ou o formato não bate.
+    """
+    match = _REFERENCIA_RE.match(texto or "")
+    if not match:
+        return None
+    livro = _livro_id(match.group("livro"))
+    if livro is None:
+        return None
+
+    capitulo = int(match.group("cap"))
+    if match.group("v1") is None:
+        # Capítulo inteiro ("Sl 23") ou faixa de capítulos ("Sl 23-24")
+        capitulo_fim = int(match.group("v2")) if match.group("v2") and not match.group("cap2") else capitulo
+        if capitulo_fim < capitulo:
+            return None
+        return Referencia(chave(livro, capitulo, 1), chave(livro, capitulo_fim, 999))
+
+    versiculo = int(match.group("v1"))
+    capitulo_fim = int(match.group("cap2")) if match.group("cap2") else capitulo
+    versiculo_fim = int(match.group("v2")) if match.group("v2") else versiculo
+    inicio, fim = chave(livro, capitulo, versiculo), chave(livro, capitulo_fim, versiculo_fim)
+    if fim < inicio:
+        return None
+    return Referencia(inicio, fim)
+
+
+class BibliaCorpus:
+    """Uma tradução empacotada, lida via mmap."""
+
+    def __init__(self, path: str):
+        if sys.byteorder != "little":  # pragma: no cover
+            raise RuntimeError("O formato do acervo bíblico assume uma plataforma little-endian")
+
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count, keys_at, offsets_at, text_at = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Arquivo de acervo bíblico inválido: {path}")
+
+        view = memoryview(self._mm)
+        self._keys = view[keys_at:keys_at + 4 * count].cast("I")
+        self._offsets = view[offsets_at:offsets_at + 4 * (count + 1)].cast("I")
+        self._text = view[text_at:]
+        self.count = count
+
+    def versiculos(self, referencia: Referencia) -> List[Tuple[int, str]]:
+        """Retorna [(chave, texto)] de todos os versículos da faixa."""
+        inicio = bisect.bisect_left(self._keys, referencia.inicio)
+        fim = bisect.bisect_right(self._keys, referencia.fim, lo=inicio)
+        offsets, text = self._offsets, self._text
+        return [
+            (self._keys[i], str(text[offsets[i]:offsets[i + 1]], "utf-8"))
+            for i in range(inicio, fim)
+        ]
+
+    def texto(self, referencia: Referencia) -> Optional[str]:
+        """Texto corrido da faixa (versículos separados por espaço), ou None se não houver."""
+        inicio = bisect.bisect_left(self._keys, referencia.inicio)
+        fim = bisect.bisect_right(self._keys, referencia.fim, lo=inicio)
+        if inicio == fim:
+            return None
+        if fim - inicio == 1:
+            return str(self._text[self._offsets[inicio]:self._offsets[fim]], "utf-8")
+        return " ".join(texto for _, texto in self.versiculos(referencia))
+
+
+# Só as traduções encontradas: o nome vem da query string, e guardar as ausentes deixaria
+# qualquer cliente crescer o dicionário (e esconderia uma tradução instalada depois)
+_corpora: Dict[str, BibliaCorpus] = {}
+NOME_TRADUCAO = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def traducoes_disponiveis() -> List[str]:
+    if not os.path.isdir(settings.BIBLIA_DIR):
+        return []
+    return sorted(nome[:-4] for nome in os.listdir(settings.BIBLIA_DIR) if nome.endswith(".bin"))
+
+
+def get_corpus(traducao: Optional[str] = None) -> Optional[BibliaCorpus]:
+    """Abre (uma vez por processo) o arquivo da tradução; None se não estiver instalado."""
+    traducao = traducao or settings.BIBLIA_TRADUCAO_PADRAO
+    corpus = _corpora.get(traducao)
+    if corpus is not None:
+        return corpus
+    # O nome vira caminho: nada de "../" ou separadores
+    if not NOME_TRADUCAO.match(traducao):
+        return None
+    path = os.path.join(settings.BIBLIA_DIR, f"{traducao}.bin")
+    if not os.path.isfile(path):
+        return None
+    try:
+        corpus = BibliaCorpus(path)
+    except ValueError as e:
+        logger.warning("Tradução '%s' ignorada: %s", traducao, e)
+        return None
+    _corpora[traducao] = corpus
+    return corpus
+
+
+def texto_canonico(referencia_canonica: Optional[str], traducao: Optional[str]) -> Optional[str]:
+    """Texto do acervo para o valor gravado em `VersiculoTema.referencia_canonica`."""
+    if not referencia_canonica:
+        return None
+    corpus = get_corpus(traducao)
+    if corpus is None:
+        return None
+    return corpus.texto(Referencia.de_canonica(referencia_canonica))
+
+
+def _normalizar_espacos(texto: str) -> str:
+    return " ".join(texto.split())
+
+
+def vincular_versiculo(versiculo: str, descricao: Optional[str], traducao: Optional[str]) -> Dict[str, Optional[str]]:
+    """
+    Decide o que gravar em um `VersiculoTema`.
+
+    Se a referência existe no acervo, grava só a referência canônica; o texto do
+    usuário fica como `descricao_versiculo` apenas quando difere do texto canônico.
+    Sem correspondência no acervo, o texto informado é obrigatório.
+    """
+    traducao = traducao or settings.BIBLIA_TRADUCAO_PADRAO
+    referencia = parse_referencia(versiculo)
+    corpus = get_corpus(traducao) if referencia else None
+    canonico = corpus.texto(referencia) if corpus else None
+
+    if canonico is None:
+        if not descricao:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Referência não encontrada no acervo bíblico; informe o texto do versículo",
+            )
+        return {"referencia_canonica": None, "traducao": None, "descricao_versiculo": descricao}
+
+    sobrescrita = descricao if descricao and _normalizar_espacos(descricao) != _normalizar_espacos(canonico) else None
+    return {"referencia_canonica": referencia.canonica, "traducao": traducao, "descricao_versiculo": sobrescrita}
+
+
+# --- Rotas ---
+
+router = APIRouter(
+    prefix="/biblia",
+    tags=["biblia"],
+)
+
+
+@router.get("/traducoes")
+async def listar_traducoes():
+    """Lista as traduções instaladas no acervo."""
+    return {"traducoes": traducoes_disponiveis(), "padrao": settings.BIBLIA_TRADUCAO_PADRAO}
+
+
+@router.get("/")
+async def resolver_referencia(
+    ref: str = Query(..., min_length=1, description="Referência (ex: João 3:16-18)"),
+    traducao: Optional[str] = Query(None, description="Tradução instalada (padrão: BIBLIA_TRADUCAO_PADRAO)"),
+):
+    """Resolve uma referência (ou faixa) para o texto do acervo offline."""
+    referencia = parse_referencia(ref)
+    if referencia is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Referência bíblica inválida")
+
+    traducao = traducao or settings.BIBLIA_TRADUCAO_PADRAO
+    corpus = get_corpus(traducao)
+    if corpus is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tradução '{traducao}' não instalada")
+
+    versiculos = corpus.versiculos(referencia)
+    if not versiculos:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Versículo não encontrado")
+
+    return {
+        "referencia": referencia.formatar(),
+        "referencia_canonica": referencia.canonica,
+        "traducao": traducao,
+        "texto": " ".join(texto for _, texto in versiculos),
+        "versiculos": [
+            {"capitulo": decompor_chave(valor)[1], "versiculo": decompor_chave(valor)[2], "texto": texto}
+            for valor, texto in versiculos
+        ],
+    }
+
+
+# --- Empacotamento (linha de comando) ---
+
+def _ler_fonte(path: str) -> List[Tuple[int, str]]:
+    """
+    Lê uma tradução de domínio público em um dos formatos:
+
+    - JSON: lista de 66 livros na ordem canônica, cada um com "chapters": [[versículo, ...], ...]
+    - TSV: "livro<TAB>capítulo<TAB>versículo<TAB>texto" (livro por id 1-66 ou nome/abreviação)
+    """
+    registros: List[Tuple[int, str]] = []
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8-sig") as arquivo:
+            livros = json.load(arquivo)
+        for livro_id, livro in enumerate(livros, start=1):
+            for capitulo, versiculos in enumerate(livro["chapters"], start=1):
+                for versiculo, texto in enumerate(versiculos, start=1):
+                    registros.append((chave(livro_id, capitulo, versiculo), texto))
+    else:
+        with open(path, encoding="utf-8-sig") as arquivo:
+            for numero, linha in enumerate(arquivo, start=1):
+                if not linha.strip():
+                    continue
+                livro, capitulo, versiculo, texto = linha.rstrip("\n").split("\t", 3)
+                livro_id = int(livro) if livro.isdigit() else _livro_id(livro)
+                if livro_id is None:
+                    raise ValueError(f"{path}, linha {numero}: livro desconhecido '{livro}'")
+                registros.append((chave(livro_id, int(capitulo), int(versiculo)), texto))
+    return registros
+
+
+def empacotar(origem: str, destino: str) -> int:
+    """Gera o arquivo binário do acervo a partir de uma fonte JSON/TSV. Retorna a quantidade de versículos."""
+    registros = sorted(_ler_fonte(origem))
+    chaves = [valor for valor, _ in registros]
+    if len(set(chaves)) != len(chaves):
+        raise ValueError("A fonte tem versículos repetidos")
+
+    textos = [_normalizar_espacos(texto).encode("utf-8") for _, texto in registros]
+    offsets = [0]
+    for texto in textos:
+        offsets.append(offsets[-1] + len(texto))
+
+    count = len(registros)
+    keys_at = HEADER.size
+    offsets_at = keys_at + 4 * count
+    text_at = offsets_at + 4 * (count + 1)
+
+    os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+    with open(destino, "wb") as arquivo:
+        arquivo.write(HEADER.pack(MAGIC, VERSION, 0, count, keys_at, offsets_at, text_at))
+        arquivo.write(struct.pack(f"<{count}I", *chaves))
+        arquivo.write(struct.pack(f"<{count + 1}I", *offsets))
+        for texto in textos:
+            arquivo.write(texto)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ferramentas do acervo bíblico offline")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    cmd = sub.add_parser("empacotar", help="Gera o arquivo .bin de uma tradução")
+    cmd.add_argument("origem", help="Fonte .json (livros/capítulos/versículos) ou .tsv")
+    cmd.add_argument("destino", help="Arquivo de saída, ex: biblia/almeida.bin")
+    args = parser.parse_args()
+
+    total = empacotar(args.origem, args.destino)
+    print(f"{total} versículos gravados em {args.destino}")
@@ -1,18 +1,71 @@
 import redis.asyncio as redis
-from typing import Optional
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Callable, List, Optional
 from config import settings
 
+logger = logging.getLogger(__name__)
+
 class Cache:
     def __init__(self):
-        self._cache = {} # Cache em memória (fallback)
+        self._cache = {} # Cache em memória (fallback): chave -> (valor, expira_em)
         self._redis_client: Optional[redis.Redis] = None
-        
+        self._redis_bytes_client: Optional[redis.Redis] = None # Para corpos binários (ex: respostas comprimidas)
+
+        # Invalidação entre workers (pub/sub); o id é gerado no worker, depois do fork
+        self._worker_id: Optional[str] = None
+        self._listeners: List[Callable[[Optional[str]], None]] = []
+        self._listener_task: Optional[asyncio.Task] = None
+
         try:
             # Inicializa o cliente, mas a conexão real acontece no primeiro comando
             self._redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+            self._redis_bytes_client = redis.from_url(settings.REDIS_URL, decode_responses=False)
         except Exception as e:
-            print(f"Aviso: Falha na configuração do Redis. Usando memória. Erro: {e}")
+            logger.warning("Falha na configuração do Redis, usando memória: %s", e)
             self._redis_client = None
+            self._redis_bytes_client = None
+
+    # --- Camada em memória ---
+
+    def _local_get(self, key: str):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._cache[key]
+            return None
+        return value
+
+    def _local_set(self, key: str, value, ex: Optional[int] = None):
+        # Sem Redis não há como avisar os outros workers, então a cópia local vive pouco
+        ttl = settings.CACHE_LOCAL_TTL_SECONDS if ex is None else min(ex, settings.CACHE_LOCAL_TTL_SECONDS)
+        self._cache[key] = (value, time.monotonic() + ttl)
+
+    def _local_invalidate(self, key: Optional[str]):
+        """Remove a chave da memória (ou tudo, se key=None) e avisa os caches locais registrados."""
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(key, None)
+        for listener in self._listeners:
+            listener(key)
+
+    def add_invalidation_listener(self, listener: Callable[[Optional[str]], None]):
+        """
+        Registra um cache em processo (ex: principal do usuário) para ser limpo junto.
+
+        O listener recebe a chave invalidada, ou None quando tudo foi limpo, tanto
+        para invalidações deste worker quanto para as recebidas de outros workers.
+        """
+        self._listeners.append(listener)
+
+    # --- Operações ---
 
     async def get(self, key: str) -> Optional[str]:
         # Tenta pegar do Redis se o cliente existir
@@ -21,10 +74,10 @@ class Cache:
                 return await self._redis_client.get(key)
             except Exception as e:
                 # Se der erro de conexão (Connection Refused), ignora e tenta na memória
-                print(f"Erro ao conectar no Redis (get): {e}")
-        
+                logger.warning("Erro ao conectar no Redis (%s): %s", "get", e)
+
         # Fallback para memória
-        return self._cache.get(key)
+        return self._local_get(key)
 
     async def set(self, key: str, value: str, ex: Optional[int] = None):
         if self._redis_client:
@@ -32,20 +85,55 @@ class Cache:
                 await self._redis_client.set(key, value, ex=ex)
                 return # Sucesso no Redis, retorna
             except Exception as e:
-                print(f"Erro ao conectar no Redis (set): {e}")
-        
+                logger.warning("Erro ao conectar no Redis (%s): %s", "set", e)
+
         # Fallback para memória
-        self._cache[key] = value
+        self._local_set(key, value, ex)
+
+    async def get_bytes(self, key: str) -> Optional[bytes]:
+        if self._redis_bytes_client:
+            try:
+                return await self._redis_bytes_client.get(key)
+            except Exception as e:
+                logger.warning("Erro ao conectar no Redis (%s): %s", "get_bytes", e)
+
+        return self._local_get(key)
+
+    async def set_bytes(self, key: str, value: bytes, ex: Optional[int] = None):
+        if self._redis_bytes_client:
+            try:
+                await self._redis_bytes_client.set(key, value, ex=ex)
+                return
+            except Exception as e:
+                logger.warning("Erro ao conectar no Redis (%s): %s", "set_bytes", e)
 
-    async def delete(self, key: str):
+        self._local_set(key, value, ex)
+
+    async def pop(self, key: str) -> Optional[str]:
+        """Lê e remove a chave de uma vez (GETDEL), para valores de uso único."""
+        if self._redis_client:
+            try:
+                return await self._redis_client.getdel(key)
+            except Exception as e:
+                logger.warning("Erro ao conectar no Redis (%s): %s", "pop", e)
+
+        value = self._local_get(key)
+        self._cache.pop(key, None)
+        return value
+
+    async def delete(self, *keys: str):
+        """Remove uma ou mais chaves (um único DEL e uma única mensagem de invalidação)."""
+        if not keys:
+            return
         if self._redis_client:
             try:
-                await self._redis_client.delete(key)
+                await self._redis_client.delete(*keys)
             except Exception:
                 pass
-        
-        if key in self._cache:
-            del self._cache[key]
+
+        for key in keys:
+            self._local_invalidate(key)
+        await self._publish_invalidation(*keys)
 
     async def clear_all(self):
         if self._redis_client:
@@ -53,7 +141,71 @@ class Cache:
                 await self._redis_client.flushdb()
             except Exception:
                 pass
-        self._cache.clear()
+        self._local_invalidate(None)
+        await self._publish_invalidation(None)
+
+    # --- Invalidação entre workers ---
+
+    async def invalidate_other_workers(self, *keys: str):
+        """Avisa só os outros workers (para caches locais que este worker já atualizou)."""
+        await self._publish_invalidation(*keys)
+
+    async def _publish_invalidation(self, *keys: Optional[str]):
+        if not self._redis_client:
+            return
+        message = json.dumps({"origin": self._worker_id, "keys": list(keys)})
+        try:
+            await self._redis_client.publish(settings.CACHE_INVALIDATION_CHANNEL, message)
+        except Exception:
+            # Sem Redis os outros workers dependem do TTL curto da memória
+            pass
+
+    async def _listen_invalidations(self):
+        """Aplica as invalidações publicadas pelos outros workers; reconecta se o Redis cair."""
+        reconnecting = False
+        retry_delay = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._redis_client.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(settings.CACHE_INVALIDATION_CHANNEL)
+                if reconnecting:
+                    # Mensagens perdidas enquanto o canal estava fora: descarta a memória local
+                    self._local_invalidate(None)
+                    reconnecting = False
+                retry_delay = 1
+                async for message in pubsub.listen():
+                    data = json.loads(message["data"])
+                    if data.get("origin") != self._worker_id:
+                        for key in data.get("keys", []):
+                            self._local_invalidate(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Erro no canal de invalidação do Redis, tentando novamente: %s", e)
+                reconnecting = True
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+
+    def start_invalidation_listener(self):
+        self._worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        if self._redis_client and self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen_invalidations())
+
+    async def stop_invalidation_listener(self):
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
 
 cache = Cache()
 
@@ -0,0 +1,231 @@
+import asyncio
+import gzip
+from typing import Awaitable, Callable, Dict, List, Optional
+from fastapi import Request, Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from config import settings
+from cache import cache
+
+# brotli e zstandard são opcionais: sem eles a negociação cai para gzip
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# Ordem de preferência quando o cliente aceita várias codificações com o mesmo peso
+SUPPORTED_ENCODINGS: List[str] = (
+    (["zstd"] if zstandard else [])
+    + (["br"] if brotli else [])
+    + ["gzip"]
+)
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+UNCOMPRESSIBLE_TYPES = ("text/event-stream",)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Escolhe a melhor codificação suportada a partir do header Accept-Encoding."""
+    if not accept_encoding:
+        return None
+
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[token] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+    """
+    Comprime `data` na codificação escolhida.
+
+    `best=True` usa níveis mais altos: vale a pena para conteúdo que vai para o
+    cache e será servido muitas vezes; respostas dinâmicas usam níveis rápidos. O
+    zstd para em 9: acima disso o tempo cresce muito mais que o ganho (o 19 leva
+    segundos numa listagem grande, e toda escrita invalida o cache).
+    """
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=9 if best else 3).compress(data)
+    if encoding == "br":
+        return brotli.compress(data, quality=9 if best else 4)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+    raise ValueError(f"Codificação não suportada: {encoding}")
+
+
+async def compress_async(data: bytes, encoding: str, best: bool = False) -> bytes:
+    """`compress` fora do event loop para corpos grandes (zlib, brotli e zstd liberam o GIL)."""
+    if len(data) >= settings.COMPRESSION_THREAD_MIN_SIZE:
+        return await asyncio.to_thread(compress, data, encoding, best)
+    return compress(data, encoding, best)
+
+
+def _is_compressible(headers: Headers) -> bool:
+    content_type = headers.get("content-type", "")
+    if content_type.startswith(UNCOMPRESSIBLE_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    Comprime as respostas com gzip/brotli/zstd conforme o Accept-Encoding.
+
+    Respostas menores que `minimum_size`, que já vêm com Content-Encoding (ex:
+    corpos pré-comprimidos do cache), parciais (206), que aceitam Range (downloads
+    de arquivos) ou de tipos binários/streaming passam direto, sem buffer.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send: Send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message: Optional[Message] = None
+        self.passthrough = False
+        self.chunks: List[bytes] = []
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.passthrough = (
+                message["status"] in (204, 206, 304)
+                or "content-encoding" in headers
+                # Respostas com Range (arquivos) são servidas como estão, sem buffer
+                or "accept-ranges" in headers
+                or not _is_compressible(headers)
+            )
+            if self.passthrough:
+                await self._send(message)
+            else:
+                self.start_message = message
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        self.chunks.append(message.get("body", b""))
+        if message.get("more_body", False):
+            return
+
+        body = b"".join(self.chunks)
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        headers.add_vary_header("Accept-Encoding")
+        if len(body) >= self.minimum_size:
+            body = await compress_async(body, self.encoding)
+            headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(body))
+
+        await self._send(self.start_message)
+        await self._send({"type": "http.response.body", "body": body})
+
+
+# --- Respostas do cache já comprimidas ---
+
+def _variant_key(cache_key: str, encoding: Optional[str]) -> str:
+    return f"{cache_key}:body:{encoding or 'identity'}"
+
+
+async def _load_or_build(
+    cache_key: str,
+    encoding: Optional[str],
+    build: Callable[[], Awaitable[bytes]],
+    ex: Optional[int],
+) -> bytes:
+    key = _variant_key(cache_key, encoding)
+    stored = await cache.get_bytes(key)
+    if stored is None:
+        body = await build()
+        stored_encoding = encoding if encoding and len(body) >= settings.COMPRESSION_MINIMUM_SIZE else "identity"
+        if stored_encoding != "identity":
+            body = await compress_async(body, stored_encoding, best=True)
+        stored = stored_encoding.encode() + b"\n" + body
+        await cache.set_bytes(key, stored, ex=ex)
+    return stored
+
+
+async def cached_json_response(
+    request: Request,
+    cache_key: str,
+    build: Callable[[], Awaitable[bytes]],
+    ex: Optional[int] = None,
+) -> Response:
+    """
+    Serve um JSON guardado no cache já na codificação negociada com o cliente.
+
+    Cada codificação é guardada como uma variante da chave; na primeira vez o corpo
+    é gerado por `build()` e comprimido com nível alto, nas seguintes os bytes
+    armazenados são enviados direto, sem recomprimir. O middleware não toca em
+    respostas que já têm Content-Encoding.
+    """
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    stored = await _load_or_build(cache_key, encoding, build, ex)
+
+    stored_encoding, _, body = stored.partition(b"\n")
+    headers = {"Vary": "Accept-Encoding"}
+    if stored_encoding != b"identity":
+        headers["Content-Encoding"] = stored_encoding.decode()
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def warm_cached_response(
+    cache_key: str,
+    build: Callable[[], Awaitable[bytes]],
+    accept_encoding: str = "",
+    ex: Optional[int] = None,
+):
+    """
+    Preenche a variante que `cached_json_response` serviria para um cliente com este
+    Accept-Encoding (aquecimento do cache); não faz nada se ela já estiver no cache.
+    """
+    await _load_or_build(cache_key, negotiate_encoding(accept_encoding), build, ex)
+
+
+async def invalidate_cached_response(*cache_keys: str):
+    """Remove todas as variantes (identity e comprimidas) das respostas em cache."""
+    await cache.delete(*[
+        _variant_key(cache_key, encoding)
+        for cache_key in cache_keys
+        for encoding in [None, *SUPPORTED_ENCODINGS]
+    ])
@@ -17,10 +17,100 @@ class Settings(BaseSettings):
 
     # Configurações de Cache (Redis)
     REDIS_URL: str = Field(default="redis://localhost:6379/0")
+    # Canal pub/sub usado para propagar invalidações entre os workers
+    CACHE_INVALIDATION_CHANNEL: str = Field(default="app_meu_pastor:cache_invalidation")
+    # TTL máximo das entradas em memória (usadas quando o Redis está fora do ar)
+    CACHE_LOCAL_TTL_SECONDS: int = Field(default=10)
+    # Tempo do usuário autenticado em cache (alterações feitas fora da API levam até isso para valer)
+    PRINCIPAL_CACHE_SECONDS: int = Field(default=300)
+    # Aquecimento do cache no login: quantos rodam ao mesmo tempo e quantos podem esperar na fila
+    WARMUP_MAX_CONCURRENCY: int = Field(default=4)
+    WARMUP_MAX_PENDING: int = Field(default=200)
+    # Idade máxima do índice de autocomplete em memória de cada worker (remontado do primário depois disso)
+    AUTOCOMPLETE_TTL_SECONDS: int = Field(default=300)
     
     # Configurações CORS
     CORS_ORIGINS: str = Field(default="https://meupastor.rrsolucoesia.cloud,http://localhost:5173,http://localhost:5174,http://localhost:3000,http://72.61.40.223:8005")
     
+    # Serialização rápida das listagens (tuplas -> JSON sem validar linha a linha)
+    FAST_LIST_RESPONSES: bool = Field(default=True)
+
+    # Compressão de respostas (gzip/brotli/zstd), só acima deste tamanho em bytes
+    COMPRESSION_MINIMUM_SIZE: int = Field(default=1024)
+    # Corpos a partir deste tamanho são comprimidos numa thread, sem travar o event loop
+    COMPRESSION_THREAD_MIN_SIZE: int = Field(default=64 * 1024)
+
+    # Acervo bíblico offline (arquivos .bin gerados com `python biblia.py empacotar`)
+    BIBLIA_DIR: str = Field(default="biblia")
+    BIBLIA_TRADUCAO_PADRAO: str = Field(default="almeida")
+
+    # Índice de esboços relacionados (matriz TF-IDF com hashing, um arquivo por usuário)
+    RELATED_INDEX_DIR: str = Field(default="data/relacionados")
+    RELATED_FEATURES: int = Field(default=2048)
+
+    # Arquivos de sermões enviados pelos usuários (blobs endereçados por SHA-256)
+    STORAGE_DIR: str = Field(default="data/arquivos")
+    STORAGE_MAX_FILE_BYTES: int = Field(default=100 * 1024 * 1024)
+    STORAGE_QUOTA_BYTES: int = Field(default=1024 * 1024 * 1024)
+    # Atrás do nginx: prefixo de um location "internal" apontando para STORAGE_DIR/blobs,
+    # para o download sair por X-Accel-Redirect (sendfile no nginx) em vez do Python
+    STORAGE_ACCEL_REDIRECT_PREFIX: str = Field(default="")
+
+    # Sincronização incremental (/sync): retenção das remoções e margem para commits em andamento
+    SYNC_TOMBSTONE_DAYS: int = Field(default=90)
+    SYNC_COMMIT_MARGIN_SECONDS: int = Field(default=5)
+
+    # Profiler sob demanda (header X-Profile com este token); vazio desliga e o middleware nem é instalado
+    PROFILER_TOKEN: str = Field(default="")
+    PROFILER_DIR: str = Field(default="data/perfis")
+    PROFILER_INTERVAL_MS: float = Field(default=1.0)
+
+    # Logs (JSON em stdout, escritos por uma thread); níveis por módulo como "sqlalchemy.engine=INFO,cache=DEBUG"
+    LOG_LEVEL: str = Field(default="INFO")
+    LOG_LEVELS: str = Field(default="sqlalchemy.engine=WARNING")
+    LOG_FORMAT: str = Field(default="json")  # "json" ou "text"
+    # Avisos/erros repetidos saem no máximo uma vez por janela (0 desliga)
+    LOG_SAMPLING_SECONDS: float = Field(default=60)
+
+    # Controle de admissão: limite adaptativo de requisições simultâneas por classe de rota (por worker)
+    ADMISSION_CONTROL: bool = Field(default=True)
+    ADMISSION_INITIAL_LIMIT: int = Field(default=20)
+    ADMISSION_MIN_LIMIT: int = Field(default=2)
+    ADMISSION_MAX_LIMIT: int = Field(default=200)
+    # Quanto a latência recente pode passar da habitual antes de o limite encolher
+    ADMISSION_LATENCY_TOLERANCE: float = Field(default=2.0)
+    ADMISSION_MAX_QUEUE_WAIT_MS: float = Field(default=250)
+
+    # Monitor do event loop: amostra o atraso a cada intervalo (0 desliga) e registra a pilha
+    # quando o loop fica bloqueado por mais que o limiar; slow callback > 0 liga o modo debug do asyncio
+    LOOP_MONITOR_INTERVAL_MS: float = Field(default=100)
+    LOOP_LAG_THRESHOLD_MS: float = Field(default=200)
+    LOOP_MONITOR_WINDOW: int = Field(default=3000)
+    LOOP_SLOW_CALLBACK_MS: float = Field(default=0)
+    # GET /stats (header X-Stats-Token com este token); vazio desliga
+    STATS_TOKEN: str = Field(default="")
+
+    # Stream de alterações (SSE em /eventos): canal do Redis entre workers, ping de keep-alive,
+    # eventos pendentes por conexão antes de desistir dela, eventos guardados por usuário para
+    # retomada (Last-Event-ID), limites de conexões por worker e validade do ticket de abertura
+    EVENTS_CHANNEL: str = Field(default="app_meu_pastor:eventos")
+    SSE_HEARTBEAT_SECONDS: float = Field(default=15)
+    SSE_QUEUE_SIZE: int = Field(default=100)
+    SSE_REPLAY_SIZE: int = Field(default=200)
+    SSE_MAX_CONNECTIONS: int = Field(default=1000)
+    SSE_MAX_CONNECTIONS_PER_USER: int = Field(default=5)
+    SSE_TICKET_SECONDS: int = Field(default=30)
+
+    # Catálogo público de esboços (snapshots JSON/HTML imutáveis, servidos sem banco):
+    # cache das URLs estáveis /publico/{usuario_id} e snapshots guardados em memória por worker
+    PUBLIC_CATALOG_DIR: str = Field(default="data/publico")
+    PUBLIC_CATALOG_MAX_AGE_SECONDS: int = Field(default=60)
+    PUBLIC_CATALOG_MEMORY_ITEMS: int = Field(default=256)
+
+    # Impressão dos esboços (HTML/PDF): processos de renderização por worker e cache em disco
+    PRINT_PROCESSES: int = Field(default=2)
+    PRINT_CACHE_DIR: str = Field(default="data/impressao")
+
     # Configurações da Aplicação
     APP_NAME: str = Field(default="App Meu Pastor")
     DEBUG: bool = Field(default=False)
@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import json
+from datetime import date, datetime, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func
-from database import get_db
-from models import CatalogoEsbocos, VersiculoTema, Tema, Usuario
+from sqlalchemy import func, literal, union_all
+from database import ReadSessionLocal, get_read_db
+from models import CatalogoEsbocos, VersiculoTema, Tema, Subtema, Usuario
 from security import get_current_complete_user
-from cache import cache
+from compression import cached_json_response, invalidate_cached_response, warm_cached_response
+from atividade import GRANULARIDADES, serie_atividade
 
 router = APIRouter(
     prefix="/dashboard",
@@ -13,22 +17,65 @@ router = APIRouter(
     dependencies=[Depends(get_current_complete_user)]
 )
 
+# Limite do intervalo por granularidade, para a série não crescer sem controle
+MAX_ACTIVITY_DAYS = {"day": 366 * 2, "week": 366 * 10, "month": 366 * 50}
+
+# As rotas de escrita invalidam as chaves, então o TTL é só uma rede de segurança
+INDICATORS_CACHE_SECONDS = 300
+FACETS_CACHE_SECONDS = 3600
+
+def indicators_cache_key(user_id: int) -> str:
+    return f"dashboard_indicators:{user_id}"
+
+def facets_cache_key(user_id: int) -> str:
+    return f"dashboard_facets:{user_id}"
+
+async def invalidar_dashboard(user_id: int, *outras_chaves: str):
+    """
+    Descarta os indicadores e facets em cache do usuário (chamado pelas rotas de escrita).
+
+    `outras_chaves` são outras respostas em cache afetadas pela mesma escrita (ex: a
+    listagem de esboços), removidas no mesmo comando.
+    """
+    await invalidate_cached_response(indicators_cache_key(user_id), facets_cache_key(user_id), *outras_chaves)
+
 @router.get("/indicators")
 async def get_indicators(
-    db: AsyncSession = Depends(get_db), 
+    request: Request,
     current_user: Usuario = Depends(get_current_complete_user)
 ):
     """Retorna os indicadores do dashboard."""
     
     user_id = current_user.id
-    cache_key = f"dashboard_indicators:{user_id}"
-    
-    # Tenta buscar do cache
-    cached_data = await cache.get(cache_key)
-    if cached_data:
-        return {"data": cached_data, "source": "cache"}
+    cache_key = indicators_cache_key(user_id)
+    fresh = {}
+
+    async def build() -> bytes:
+        # O cache é preenchido pelo primário: uma réplica atrasada ficaria presa nele até o TTL
+        async with ReadSessionLocal() as primario:
+            fresh["data"] = await count_indicators(primario, user_id)
+        # O corpo guardado no cache já sai marcado como vindo do cache
+        return json.dumps({"data": fresh["data"], "source": "cache"}).encode()
+
+    # Armazena no cache por 5 minutos, já comprimido
+    response = await cached_json_response(request, cache_key, build, ex=INDICATORS_CACHE_SECONDS)
+    if "data" in fresh:
+        return {"data": fresh["data"], "source": "database"}
+    return response
+
+async def aquecer_dashboard(db: AsyncSession, user_id: int, accept_encoding: str = ""):
+    """Preenche os indicadores e facets em cache, se ainda não estiverem lá (aquecimento no login)."""
+    async def indicadores() -> bytes:
+        return json.dumps({"data": await count_indicators(db, user_id), "source": "cache"}).encode()
+
+    async def facets() -> bytes:
+        return json.dumps({"data": await count_facets(db, user_id), "source": "cache"}).encode()
 
-    # Busca no banco de dados
+    await warm_cached_response(indicators_cache_key(user_id), indicadores, accept_encoding, ex=INDICATORS_CACHE_SECONDS)
+    await warm_cached_response(facets_cache_key(user_id), facets, accept_encoding, ex=FACETS_CACHE_SECONDS)
+
+async def count_indicators(db: AsyncSession, user_id: int) -> dict:
+    """Conta esboços, versículos e temas ativos do usuário."""
     try:
         # 1. Quantidade de esboços
         esbocos_count_result = await db.execute(
@@ -55,20 +102,130 @@ async def get_indicators(
         )
         temas_count = temas_count_result.scalar_one()
         
-        indicators = {
+        return {
             "quantidade_esbocos": esbocos_count,
             "quantidade_versiculos": versiculos_count,
             "quantidade_temas": temas_count
         }
         
-        # Armazena no cache por 5 minutos (300 segundos)
-        import json
-        await cache.set(cache_key, json.dumps(indicators), ex=300)
-        
-        return {"data": indicators, "source": "database"}
-        
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao buscar indicadores: {str(e)}"
         )
+
+@router.get("/facets")
+async def get_facets(
+    request: Request,
+    current_user: Usuario = Depends(get_current_complete_user)
+):
+    """Retorna a quantidade de esboços e versículos por tema e subtema."""
+
+    user_id = current_user.id
+    fresh = {}
+
+    async def build() -> bytes:
+        async with ReadSessionLocal() as primario:
+            fresh["data"] = await count_facets(primario, user_id)
+        return json.dumps({"data": fresh["data"], "source": "cache"}).encode()
+
+    response = await cached_json_response(request, facets_cache_key(user_id), build, ex=FACETS_CACHE_SECONDS)
+    if "data" in fresh:
+        return {"data": fresh["data"], "source": "database"}
+    return response
+
+@router.get("/activity")
+async def get_activity(
+    start: Optional[date] = Query(None, description="Data inicial (padrão: dois anos antes do fim)"),
+    end: Optional[date] = Query(None, description="Data final (padrão: hoje)"),
+    granularity: str = Query("month", description="day, week ou month"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Usuario = Depends(get_current_complete_user)
+):
+    """Retorna esboços e versículos criados por dia, semana ou mês, a partir do resumo de atividade."""
+    if granularity not in GRANULARIDADES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Granularidade inválida (use day, week ou month)")
+
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end.replace(year=end.year - 2, day=1)
+    if start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="A data inicial deve ser anterior à final")
+    if (end - start).days > MAX_ACTIVITY_DAYS[granularity]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Intervalo muito grande para a granularidade escolhida")
+
+    serie = await serie_atividade(db, current_user.id, start, end, granularity)
+    return {"data": {"start": start, "end": end, "granularity": granularity, "series": serie}}
+
+async def count_facets(db: AsyncSession, user_id: int) -> list:
+    """
+    Conta esboços e versículos por (tema, subtema) em uma única consulta: as duas
+    tabelas entram num UNION ALL com um GROUP BY só, coberto pelos índices
+    (usuario_id, tema_id, subtema_id), e os nomes vêm no mesmo SELECT.
+    """
+    try:
+        itens = union_all(
+            select(
+                CatalogoEsbocos.tema_id, CatalogoEsbocos.subtema_id,
+                literal(1).label("esboco"), literal(0).label("versiculo")
+            ).filter(CatalogoEsbocos.usuario_id == user_id),
+            select(
+                VersiculoTema.tema_id, VersiculoTema.subtema_id,
+                literal(0).label("esboco"), literal(1).label("versiculo")
+            ).filter(VersiculoTema.usuario_id == user_id),
+        ).subquery()
+
+        contagens = (
+            select(
+                itens.c.tema_id, itens.c.subtema_id,
+                func.sum(itens.c.esboco).label("esbocos"),
+                func.sum(itens.c.versiculo).label("versiculos"),
+            )
+            .group_by(itens.c.tema_id, itens.c.subtema_id)
+            .subquery()
+        )
+
+        result = await db.execute(
+            select(
+                Tema.id, Tema.descricao, Tema.ativo,
+                contagens.c.subtema_id, Subtema.descricao,
+                contagens.c.esbocos, contagens.c.versiculos,
+            )
+            .select_from(Tema)
+            .outerjoin(contagens, contagens.c.tema_id == Tema.id)
+            .outerjoin(Subtema, Subtema.id == contagens.c.subtema_id)
+            .filter(Tema.usuario_id == user_id)
+            .order_by(Tema.descricao, Tema.id, Subtema.descricao)
+        )
+
+        temas = {}
+        for tema_id, descricao, ativo, subtema_id, subtema_descricao, esbocos, versiculos in result.all():
+            tema = temas.get(tema_id)
+            if tema is None:
+                tema = temas[tema_id] = {
+                    "tema_id": tema_id,
+                    "descricao": descricao,
+                    "ativo": ativo,
+                    "quantidade_esbocos": 0,
+                    "quantidade_versiculos": 0,
+                    "subtemas": [],
+                }
+            if esbocos is None:
+                # Tema sem esboços nem versículos
+                continue
+            tema["quantidade_esbocos"] += esbocos
+            tema["quantidade_versiculos"] += versiculos
+            if subtema_id is not None:
+                tema["subtemas"].append({
+                    "subtema_id": subtema_id,
+                    "descricao": subtema_descricao,
+                    "quantidade_esbocos": esbocos,
+                    "quantidade_versiculos": versiculos,
+                })
+
+        return list(temas.values())
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao buscar facets: {str(e)}"
+        )
@@ -1,38 +1,301 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import MetaData
+from sqlalchemy import MetaData, event, inspect, text
+from sqlalchemy.engine import make_url
+from fastapi import Request
+import hashlib
+import itertools
+import logging
+import math
 import os
+import time
+from cache import cache
+from sharding import ShardRoutingSession, shard_map, shard_metadata
+
+logger = logging.getLogger(__name__)
 
 # Configuração do banco de dados (usaremos SQLite para simplicidade no ambiente sandbox)
 # Em um ambiente de produção, o usuário deve configurar para PostgreSQL (pg_catalog)
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./app_meu_pastor.db")
 
-metadata_obj = MetaData(schema="app_meu_pastor")
+# Réplicas de leitura (opcional), separadas por vírgula. Sem réplicas, tudo vai para o primário.
+READ_REPLICA_URLS = [url.strip() for url in os.getenv("READ_REPLICA_URLS", "").split(",") if url.strip()]
+# Janela em que as leituras de quem acabou de escrever continuam no primário (read-your-writes)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+# Tempo que uma réplica com falha fica fora da rotação antes de ser tentada de novo
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+
+# Modo de produção do SQLite: WAL, pragmas ajustados, um pool de conexões só de leitura e
+# uma única conexão de escrita (as escritas esperam a vez na fila do pool em vez de
+# disputarem o lock do arquivo e falharem com "database is locked"). SQLITE_WAL=0 volta
+# ao engine único de antes.
+SQLITE_WAL = os.getenv("SQLITE_WAL", "1") == "1"
+SQLITE_READER_POOL_SIZE = int(os.getenv("SQLITE_READER_POOL_SIZE", "8"))
+# Quanto uma conexão espera pelo lock de outro processo (ex: outros workers do Gunicorn)
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Quanto uma escrita espera na fila pela conexão de escrita antes de desistir
+SQLITE_WRITE_QUEUE_TIMEOUT = float(os.getenv("SQLITE_WRITE_QUEUE_TIMEOUT", "30"))
+SQLITE_PRAGMAS = {
+    "synchronous": "NORMAL",  # com WAL, só o checkpoint faz fsync; um commit perdido no pior caso, sem corromper
+    "cache_size": "-32000",  # 32 MB de páginas em cache por conexão
+    "mmap_size": str(256 * 1024 * 1024),
+}
+
+SCHEMA_NAME = "app_meu_pastor"
+metadata_obj = MetaData(schema=SCHEMA_NAME)
+
+def _sqlite_file(url: str):
+    """Arquivo do banco SQLite da URL (None se não for SQLite ou se for em memória)."""
+    if "sqlite" not in url:
+        return None
+    database_file = make_url(url).database
+    return None if not database_file or database_file == ":memory:" else database_file
+
+def _apply_sqlite_pragmas(dbapi_connection, readonly: bool):
+    dbapi_connection.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    # O arquivo também está anexado como o schema: os pragmas valem por banco
+    for database_name in ("main", SCHEMA_NAME):
+        dbapi_connection.execute(f"PRAGMA {database_name}.journal_mode = WAL")
+        for pragma, value in SQLITE_PRAGMAS.items():
+            dbapi_connection.execute(f"PRAGMA {database_name}.{pragma} = {value}")
+    if readonly:
+        dbapi_connection.execute("PRAGMA query_only = 1")
+
+def create_engine_for(url: str, readonly: bool = False, wal: bool = False, **engine_kwargs):
+    """
+    Cria o engine assíncrono; no SQLite anexa o próprio arquivo com o nome do schema e,
+    com `wal`, aplica os pragmas do modo de produção (`readonly` bloqueia escritas).
+    """
+    is_sqlite = "sqlite" in url
+    new_engine = create_async_engine(
+        url,
+        connect_args={"check_same_thread": False} if is_sqlite else {},
+        **engine_kwargs
+    )
+
+    if is_sqlite:
+        database_file = make_url(url).database or ":memory:"
+
+        @event.listens_for(new_engine.sync_engine, "connect")
+        def _attach_schema(dbapi_connection, connection_record):
+            # O SQLite não tem schemas: as tabelas "app_meu_pastor.x" ficam no banco anexado
+            dbapi_connection.execute(f"ATTACH DATABASE '{database_file}' AS {SCHEMA_NAME}")
+            if wal:
+                _apply_sqlite_pragmas(dbapi_connection, readonly)
+
+    return new_engine
+
+def create_primary_engines(url: str, wal: bool = SQLITE_WAL):
+    """
+    Retorna (engine de escrita, engine de leitura) do banco principal. Fora do modo WAL
+    do SQLite (ou no PostgreSQL) os dois são o mesmo engine.
+    """
+    if not (wal and _sqlite_file(url)):
+        primary = create_engine_for(url)
+        return primary, primary
 
-engine = create_async_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    echo=True, 
-    connect_args={"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
-)
+    writer = create_engine_for(url, wal=True, pool_size=1, max_overflow=0, pool_timeout=SQLITE_WRITE_QUEUE_TIMEOUT)
+    reader = create_engine_for(url, readonly=True, wal=True, pool_size=SQLITE_READER_POOL_SIZE, max_overflow=0)
+    return writer, reader
 
-AsyncSessionLocal = sessionmaker(
-    autocommit=False,
-    autoflush=False,
-    bind=engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-)
+def create_session_factory(bind, shards=None):
+    """`shards` (nome -> engine) manda as tabelas de conteúdo para o shard do usuário (ver sharding.py)."""
+    return sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        bind=bind,
+        class_=AsyncSession,
+        sync_session_class=ShardRoutingSession,
+        shards=shards,
+        expire_on_commit=False,
+    )
+
+engine, read_engine = create_primary_engines(SQLALCHEMY_DATABASE_URL)
+
+# Shards do conteúdo (SHARD_URLS): nome -> (engine de escrita, engine de leitura). Um shard
+# com a mesma URL do principal reaproveita os engines dele.
+shard_engines = {
+    name: (engine, read_engine) if url == SQLALCHEMY_DATABASE_URL else create_primary_engines(url)
+    for name, url in shard_map.urls.items()
+}
+shard_writers = {name: writer for name, (writer, _) in shard_engines.items()} or None
+shard_readers = {name: reader for name, (_, reader) in shard_engines.items()} or None
+
+AsyncSessionLocal = create_session_factory(engine, shard_writers)
+# Sessões só de leitura no banco principal (no SQLite em WAL, o pool de leitores)
+if read_engine is engine and not shard_engines:
+    ReadSessionLocal = AsyncSessionLocal
+else:
+    ReadSessionLocal = create_session_factory(read_engine, shard_readers)
 
 Base = declarative_base(metadata=metadata_obj)
 
-async def get_db():
+# --- Roteamento de leitura para réplicas ---
+
+class ReplicaRouter:
+    """
+    Escolhe a sessão de leitura: réplicas em round-robin, com volta ao primário
+    quando o cliente escreveu há pouco ou quando nenhuma réplica está saudável.
+
+    O "escreveu há pouco" fica no cache (Redis), porque sem sessão fixa a leitura
+    seguinte pode cair em outro worker; uma cópia local evita a ida ao Redis quando cai
+    no mesmo. Sem Redis, só o worker que recebeu a escrita sabe dela.
+    """
+
+    def __init__(self, urls):
+        # As réplicas servem a tabela de usuários; com sharding, o conteúdo é lido nos shards
+        self.replicas = [(url, create_session_factory(create_engine_for(url), shard_readers)) for url in urls]
+        self._cycle = itertools.cycle(range(len(self.replicas))) if self.replicas else None
+        self._unhealthy_until = {}
+        self._recent_writes = {}
+
+    @staticmethod
+    def client_key(request: Request) -> str:
+        cliente = request.headers.get("authorization") or (request.client.host if request.client else "anon")
+        # Hash: o token não vai parar nas chaves do Redis
+        return f"escrita_recente:{hashlib.sha256(cliente.encode()).hexdigest()[:32]}"
+
+    async def mark_write(self, request: Request):
+        if not self.replicas:
+            return
+        now = time.monotonic()
+        key = self.client_key(request)
+        self._recent_writes[key] = now + READ_YOUR_WRITES_SECONDS
+        # Limpeza preguiçosa para o dicionário não crescer sem limite
+        if len(self._recent_writes) > 10000:
+            self._recent_writes = {k: v for k, v in self._recent_writes.items() if v > now}
+        await cache.set(key, "1", ex=max(1, math.ceil(READ_YOUR_WRITES_SECONDS)))
+
+    async def wrote_recently(self, request: Request) -> bool:
+        if not self.replicas:
+            return False
+        key = self.client_key(request)
+        until = self._recent_writes.get(key)
+        if until is not None and until > time.monotonic():
+            return True
+        return await cache.get(key) is not None
+
+    def mark_unhealthy(self, index: int):
+        self._unhealthy_until[index] = time.monotonic() + REPLICA_RETRY_SECONDS
+
+    def candidates(self):
+        """Réplicas saudáveis, a partir da próxima do round-robin."""
+        if not self.replicas:
+            return []
+        start = next(self._cycle)
+        now = time.monotonic()
+        order = [(start + i) % len(self.replicas) for i in range(len(self.replicas))]
+        return [i for i in order if self._unhealthy_until.get(i, 0) <= now]
+
+replica_router = ReplicaRouter(READ_REPLICA_URLS)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+async def get_db(request: Request):
+    # Quem escreve passa a ler do primário por alguns segundos (read-your-writes)
+    if request.method not in SAFE_METHODS:
+        await replica_router.mark_write(request)
     async with AsyncSessionLocal() as session:
         yield session
 
+async def get_read_db(request: Request):
+    """Sessão para rotas somente leitura: usa uma réplica saudável ou cai para o primário."""
+    if not await replica_router.wrote_recently(request):
+        for index in replica_router.candidates():
+            _, session_factory = replica_router.replicas[index]
+            async with session_factory() as session:
+                try:
+                    # Abre a conexão já aqui para detectar réplica fora do ar antes da rota
+                    await session.connection()
+                except Exception as e:
+                    logger.warning("Réplica de leitura %s indisponível, usando outra/primário: %s", index, e)
+                    replica_router.mark_unhealthy(index)
+                    continue
+                yield session
+                return
+
+    async with ReadSessionLocal() as session:
+        yield session
+
+def _default_sql(column, dialect) -> str:
+    default = column.server_default.arg
+    if isinstance(default, str):
+        return f"'{default}'"
+    return str(default.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+def _rebuild_sqlite_table(sync_conn, table, existing_columns):
+    """O SQLite não altera restrições de colunas: recria a tabela e copia os dados."""
+    inspector = inspect(sync_conn)
+    for index in inspector.get_indexes(table.name, schema=table.schema):
+        sync_conn.execute(text(f"DROP INDEX {table.schema}.{index['name']}"))
+    old_name = f"{table.name}__old"
+    sync_conn.execute(text(f"ALTER TABLE {table.schema}.{table.name} RENAME TO {old_name}"))
+    table.create(sync_conn)
+    columns = ", ".join(column.name for column in table.columns if column.name in existing_columns)
+    sync_conn.execute(text(f"INSERT INTO {table.schema}.{table.name} ({columns}) SELECT {columns} FROM {table.schema}.{old_name}"))
+    sync_conn.execute(text(f"DROP TABLE {table.schema}.{old_name}"))
+
+def sync_schema(sync_conn):
+    """
+    Ajusta tabelas já existentes ao modelo, já que o create_all só cria tabelas novas:
+    adiciona colunas que faltam, cria índices novos e remove o NOT NULL de colunas
+    que passaram a ser opcionais (no SQLite, recriando a tabela).
+    """
+    inspector = inspect(sync_conn)
+    dialect = sync_conn.dialect
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name, schema=table.schema):
+            continue
+        existing = {column["name"]: column for column in inspector.get_columns(table.name, schema=table.schema)}
+        full_name = f"{table.schema}.{table.name}" if table.schema else table.name
+
+        relaxed = [
+            column for column in table.columns
+            if column.name in existing and column.nullable and not column.primary_key and not existing[column.name]["nullable"]
+        ]
+        if relaxed and dialect.name == "sqlite":
+            _rebuild_sqlite_table(sync_conn, table, existing)
+            continue
+
+        for column in relaxed:
+            sync_conn.execute(text(f"ALTER TABLE {full_name} ALTER COLUMN {column.name} DROP NOT NULL"))
+
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = f"ALTER TABLE {full_name} ADD COLUMN {column.name} {column.type.compile(dialect=dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {_default_sql(column, dialect)}"
+                sync_conn.execute(text(ddl))
+
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+# Com o Gunicorn, o mestre ajusta o schema uma vez antes de criar os workers (ver
+# gunicorn.conf.py) e os workers, que herdam este módulo no fork, não repetem o DDL
+_schema_pronto = False
+
 async def init_db():
+    global _schema_pronto
+    if _schema_pronto:
+        return
     # Cria as tabelas no banco de dados
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(sync_schema)
+
+    # Nos shards, só as tabelas de conteúdo
+    for writer, _ in shard_engines.values():
+        if writer is engine:
+            continue
+        async with writer.begin() as conn:
+            await conn.run_sync(shard_metadata(Base.metadata).create_all)
+            await conn.run_sync(sync_schema)
+    _schema_pronto = True
+
+async def dispose_engines():
+    """Fecha os pools do principal e dos shards (fim das CLIs)."""
+    for pool_engine in {engine, read_engine, *(e for pair in shard_engines.values() for e in pair)}:
+        await pool_engine.dispose()
 
 # Dependência para obter a sessão do banco de dados
 def get_db_session():
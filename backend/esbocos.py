@@ -1,12 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import delete, update
-from typing import List
-from database import get_db
-from models import CatalogoEsbocos, Tema, Subtema, Usuario
-from schemas import CatalogoEsbocos as EsbocoSchema, CatalogoEsbocosCreate, CatalogoEsbocosUpdate
+from typing import List, Optional
+from pydantic import TypeAdapter
+from config import settings
+from database import ReadSessionLocal, get_db, get_read_db
+from models import CatalogoEsbocos, Tema, Subtema, Usuario, VersiculoTema
+from schemas import CatalogoEsbocos as EsbocoSchema, CatalogoEsbocosCreate, CatalogoEsbocosUpdate, CatalogoEsbocosResumo, EsbocoRelacionado
 from security import get_current_complete_user
+from dashboard import invalidar_dashboard
+from compression import cached_json_response
+from atividade import registrar_atividade
+from remocoes import registrar_remocoes
+from eventos import canal_eventos
+from publico import renderizar_catalogo
+from impressao import MEDIA_TYPES as IMPRESSAO_MEDIA_TYPES, chave_documento, impressora
+from biblia import texto_canonico
+from serialization import FastListSerializer
+from relacionados import PESOS_CAMPOS, campos_do_esboco, indice_relacionados
 
 router = APIRouter(
     prefix="/esbocos",
@@ -14,6 +27,38 @@ router = APIRouter(
     dependencies=[Depends(get_current_complete_user)] # Protege todas as rotas com autenticação e perfil completo
 )
 
+# Serializador da listagem (montado uma vez, reaproveitado em todas as requisições)
+esboco_list_serializer = FastListSerializer(CatalogoEsbocos, EsbocoSchema)
+esboco_summary_serializer = FastListSerializer(CatalogoEsbocos, CatalogoEsbocosResumo)
+esboco_list_adapter = TypeAdapter(List[EsbocoSchema])
+
+# A listagem padrão (sem `fields`/`view`) fica em cache; as rotas de escrita invalidam a chave
+ESBOCOS_CACHE_SECONDS = 300
+
+# Leituras do banco para montar o índice de relacionados enquanto chegam escritas
+TENTATIVAS_INDICE_RELACIONADOS = 3
+
+def esbocos_cache_key(user_id: int) -> str:
+    return f"esbocos_lista:{user_id}"
+
+async def listar_esbocos_json(db: AsyncSession, user_id: int) -> bytes:
+    if settings.FAST_LIST_RESPONSES:
+        # Caminho rápido: busca só as colunas do schema e gera o JSON direto das tuplas
+        result = await db.execute(
+            esboco_list_serializer.select().filter(CatalogoEsbocos.usuario_id == user_id).order_by(CatalogoEsbocos.created_at.desc())
+        )
+        return esboco_list_serializer.dump(result.all())
+
+    result = await db.execute(
+        select(CatalogoEsbocos).filter(CatalogoEsbocos.usuario_id == user_id).order_by(CatalogoEsbocos.created_at.desc())
+    )
+    return esboco_list_adapter.dump_json(esboco_list_adapter.validate_python(result.scalars().all(), from_attributes=True))
+
+async def listar_esbocos_json_primario(user_id: int) -> bytes:
+    # O cache é preenchido pelo primário: uma réplica atrasada ficaria presa nele até o TTL
+    async with ReadSessionLocal() as primario:
+        return await listar_esbocos_json(primario, user_id)
+
 async def check_tema_subtema_ownership(db: AsyncSession, tema_id: int, subtema_id: int | None, user_id: int):
     """Verifica se o tema e subtema (se fornecido) pertencem ao usuário."""
     # Verifica o Tema
@@ -34,7 +79,7 @@ async def check_tema_subtema_ownership(db: AsyncSession, tema_id: int, subtema_i
 # --- Rotas para Catálogo de Esboços ---
 
 @router.post("/", response_model=EsbocoSchema, status_code=status.HTTP_201_CREATED)
-async def create_esboco(esboco: CatalogoEsbocosCreate, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
+async def create_esboco(esboco: CatalogoEsbocosCreate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
     """Cria um novo esboço."""
     await check_tema_subtema_ownership(db, esboco.tema_id, esboco.subtema_id, current_user.id)
     
@@ -43,21 +88,39 @@ async def create_esboco(esboco: CatalogoEsbocosCreate, db: AsyncSession = Depend
         usuario_id=current_user.id
     )
     db.add(new_esboco)
+    await registrar_atividade(db, current_user.id, "esboco")
     await db.commit()
+    await invalidar_dashboard(current_user.id, esbocos_cache_key(current_user.id))
     await db.refresh(new_esboco)
+    background_tasks.add_task(indice_relacionados.atualizar, current_user.id, new_esboco.id, campos_do_esboco(new_esboco))
+    await canal_eventos.publicar(current_user.id, "esboco", "criado", new_esboco.id, EsbocoSchema.model_validate(new_esboco))
     return new_esboco
 
 @router.get("/", response_model=List[EsbocoSchema])
-async def read_esbocos(db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
-    """Lista todos os esboços do usuário logado."""
+async def read_esbocos(
+    request: Request,
+    fields: Optional[str] = Query(None, description="Campos a retornar, separados por vírgula (ex: id,titulo). O id sempre é incluído."),
+    view: str = Query("full", pattern="^(full|summary)$", description="'summary' omite resumo, esboco_manual e links"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Usuario = Depends(get_current_complete_user)
+):
+    """Lista todos os esboços do usuário logado (aceita `?fields=` e `?view=summary`)."""
+    if not fields and view == "full":
+        user_id = current_user.id
+        return await cached_json_response(
+            request, esbocos_cache_key(user_id), lambda: listar_esbocos_json_primario(user_id), ex=ESBOCOS_CACHE_SECONDS
+        )
+
+    # Busca só as colunas pedidas (os textos longos nem saem do banco) e gera o JSON direto das tuplas
+    serializer = esboco_summary_serializer if view == "summary" else esboco_list_serializer
+    serializer = serializer.project(fields)
     result = await db.execute(
-        select(CatalogoEsbocos).filter(CatalogoEsbocos.usuario_id == current_user.id).order_by(CatalogoEsbocos.created_at.desc())
+        serializer.select().filter(CatalogoEsbocos.usuario_id == current_user.id).order_by(CatalogoEsbocos.created_at.desc())
     )
-    esbocos = result.scalars().all()
-    return esbocos
+    return serializer.response(result.all())
 
 @router.get("/{esboco_id}", response_model=EsbocoSchema)
-async def read_esboco(esboco_id: int, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
+async def read_esboco(esboco_id: int, db: AsyncSession = Depends(get_read_db), current_user: Usuario = Depends(get_current_complete_user)):
     """Retorna um esboço específico."""
     result = await db.execute(
         select(CatalogoEsbocos).filter(CatalogoEsbocos.id == esboco_id, CatalogoEsbocos.usuario_id == current_user.id)
@@ -67,8 +130,114 @@ async def read_esboco(esboco_id: int, db: AsyncSession = Depends(get_db), curren
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Esboço não encontrado ou não pertence ao usuário")
     return esboco
 
+@router.get("/{esboco_id}/related", response_model=List[EsbocoRelacionado])
+async def read_related_esbocos(
+    esboco_id: int,
+    limit: int = Query(5, ge=1, le=50),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Usuario = Depends(get_current_complete_user)
+):
+    """Lista esboços anteriores do usuário com conteúdo parecido (índice TF-IDF, sem varrer o banco)."""
+    result = await db.execute(
+        select(CatalogoEsbocos).filter(CatalogoEsbocos.id == esboco_id, CatalogoEsbocos.usuario_id == current_user.id)
+    )
+    esboco = result.scalars().first()
+    if not esboco:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Esboço não encontrado ou não pertence ao usuário")
+
+    if not indice_relacionados.existe(current_user.id):
+        # Primeiro uso do usuário: monta o índice a partir do primário uma única vez; se uma
+        # escrita chegou enquanto o banco era lido, a leitura é refeita (ou fica para a próxima)
+        colunas = [CatalogoEsbocos.id] + [getattr(CatalogoEsbocos, campo) for campo in PESOS_CAMPOS]
+        for _ in range(TENTATIVAS_INDICE_RELACIONADOS):
+            pendencias = await asyncio.to_thread(indice_relacionados.pendencias, current_user.id)
+            async with ReadSessionLocal() as primario:
+                result = await primario.execute(select(*colunas).filter(CatalogoEsbocos.usuario_id == current_user.id))
+                esbocos = [(row[0], dict(zip(PESOS_CAMPOS, row[1:]))) for row in result.all()]
+            if await asyncio.to_thread(indice_relacionados.reconstruir, current_user.id, esbocos, pendencias):
+                break
+
+    similares = await asyncio.to_thread(
+        indice_relacionados.similares, current_user.id, campos_do_esboco(esboco), limit, esboco_id
+    )
+    if not similares:
+        return []
+
+    # Busca só os esboços escolhidos, pela chave primária
+    scores = dict(similares)
+    result = await db.execute(
+        esboco_summary_serializer.select().filter(CatalogoEsbocos.id.in_(scores), CatalogoEsbocos.usuario_id == current_user.id)
+    )
+    relacionados = [
+        {**row, "similaridade": round(scores[row["id"]], 4)}
+        for row in esboco_summary_serializer.to_dicts(result.all())
+    ]
+    relacionados.sort(key=lambda item: item["similaridade"], reverse=True)
+    return relacionados
+
+async def fonte_impressao(db: AsyncSession, usuario_id: int, esboco_id: int) -> Optional[dict]:
+    """Campos de origem do documento impresso do esboço (None se não for do usuário)."""
+    result = await db.execute(
+        select(
+            CatalogoEsbocos.titulo, CatalogoEsbocos.texto_biblico, CatalogoEsbocos.resumo, CatalogoEsbocos.esboco_manual,
+            CatalogoEsbocos.tema_id, CatalogoEsbocos.subtema_id, Tema.descricao, Subtema.descricao,
+        )
+        .join(Tema, Tema.id == CatalogoEsbocos.tema_id)
+        .outerjoin(Subtema, Subtema.id == CatalogoEsbocos.subtema_id)
+        .filter(CatalogoEsbocos.id == esboco_id, CatalogoEsbocos.usuario_id == usuario_id)
+    )
+    esboco = result.first()
+    if not esboco:
+        return None
+    titulo, texto_biblico, resumo, esboco_manual, tema_id, subtema_id, tema, subtema = esboco
+
+    # Versículos do tema (sem subtema) e, se o esboço tiver, os do subtema dele
+    result = await db.execute(
+        select(VersiculoTema.versiculo, VersiculoTema.descricao_versiculo, VersiculoTema.referencia_canonica, VersiculoTema.traducao)
+        .filter(
+            VersiculoTema.usuario_id == usuario_id,
+            VersiculoTema.tema_id == tema_id,
+            (VersiculoTema.subtema_id.is_(None) | (VersiculoTema.subtema_id == subtema_id)) if subtema_id else VersiculoTema.subtema_id.is_(None),
+        )
+        .order_by(VersiculoTema.id)
+    )
+    versiculos = [
+        {"referencia": versiculo, "texto": descricao if descricao is not None else (texto_canonico(referencia, traducao) or ""), "traducao": traducao}
+        for versiculo, descricao, referencia, traducao in result.all()
+    ]
+    return {
+        "titulo": titulo, "texto_biblico": texto_biblico, "resumo": resumo, "esboco": esboco_manual,
+        "tema": tema, "subtema": subtema, "versiculos": versiculos,
+    }
+
+@router.get("/{esboco_id}/impressao")
+async def imprimir_esboco(
+    esboco_id: int,
+    request: Request,
+    formato: str = Query("pdf", pattern="^(pdf|html)$"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Usuario = Depends(get_current_complete_user)
+):
+    """Esboço pronto para imprimir (PDF ou HTML), com os versículos do tema/subtema."""
+    fonte = await fonte_impressao(db, current_user.id, esboco_id)
+    if fonte is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Esboço não encontrado ou não pertence ao usuário")
+    # Devolve a conexão ao pool enquanto o documento é lido do cache ou renderizado
+    await db.rollback()
+
+    # A chave sai só dos campos de origem: o 304 não precisa ler nem renderizar o documento
+    chave = chave_documento(fonte, formato)
+    etag = f'"{chave}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    _, conteudo = await impressora.documento(fonte, formato, chave)
+    headers["Content-Disposition"] = f'inline; filename="esboco-{esboco_id}.{formato}"'
+    return Response(conteudo, media_type=IMPRESSAO_MEDIA_TYPES[formato], headers=headers)
+
 @router.put("/{esboco_id}", response_model=EsbocoSchema)
-async def update_esboco(esboco_id: int, esboco: CatalogoEsbocosUpdate, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
+async def update_esboco(esboco_id: int, esboco: CatalogoEsbocosUpdate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
     """Atualiza um esboço existente."""
     await check_tema_subtema_ownership(db, esboco.tema_id, esboco.subtema_id, current_user.id)
     
@@ -80,20 +249,65 @@ async def update_esboco(esboco_id: int, esboco: CatalogoEsbocosUpdate, db: Async
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Esboço não encontrado ou não pertence ao usuário")
     
     await db.commit()
+    await invalidar_dashboard(current_user.id, esbocos_cache_key(current_user.id))
     
     # Busca o esboço atualizado para retornar
     result = await db.execute(select(CatalogoEsbocos).filter(CatalogoEsbocos.id == esboco_id))
     updated_esboco = result.scalars().first()
+    background_tasks.add_task(indice_relacionados.atualizar, current_user.id, esboco_id, campos_do_esboco(updated_esboco))
+    if updated_esboco.publicado == "S":
+        await renderizar_catalogo(current_user.id, db)
+    await canal_eventos.publicar(current_user.id, "esboco", "atualizado", esboco_id, EsbocoSchema.model_validate(updated_esboco))
     return updated_esboco
 
 @router.delete("/{esboco_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_esboco(esboco_id: int, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
+async def delete_esboco(esboco_id: int, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
     """Deleta um esboço."""
-    stmt = delete(CatalogoEsbocos).where(CatalogoEsbocos.id == esboco_id, CatalogoEsbocos.usuario_id == current_user.id)
+    stmt = delete(CatalogoEsbocos).where(CatalogoEsbocos.id == esboco_id, CatalogoEsbocos.usuario_id == current_user.id).returning(
+        CatalogoEsbocos.created_at, CatalogoEsbocos.publicado
+    )
     result = await db.execute(stmt)
+    removido = result.first()
     
-    if result.rowcount == 0:
+    if removido is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Esboço não encontrado ou não pertence ao usuário")
     
+    created_at, publicado = removido
+    await registrar_atividade(db, current_user.id, "esboco", -1, created_at)
+    await registrar_remocoes(db, current_user.id, "esboco", [esboco_id])
     await db.commit()
+    await invalidar_dashboard(current_user.id, esbocos_cache_key(current_user.id))
+    background_tasks.add_task(indice_relacionados.remover, current_user.id, esboco_id)
+    if publicado == "S":
+        await renderizar_catalogo(current_user.id, db)
+    await canal_eventos.publicar(current_user.id, "esboco", "removido", esboco_id)
     return {"message": "Esboço deletado com sucesso"}
+
+# --- Catálogo público ---
+
+async def alterar_publicacao(db: AsyncSession, user_id: int, esboco_id: int, publicado: str) -> CatalogoEsbocos:
+    stmt = update(CatalogoEsbocos).where(CatalogoEsbocos.id == esboco_id, CatalogoEsbocos.usuario_id == user_id).values(
+        publicado=publicado
+    )
+    result = await db.execute(stmt)
+    if result.rowcount == 0:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Esboço não encontrado ou não pertence ao usuário")
+
+    await db.commit()
+    await invalidar_dashboard(user_id, esbocos_cache_key(user_id))
+    await renderizar_catalogo(user_id, db)
+
+    result = await db.execute(select(CatalogoEsbocos).filter(CatalogoEsbocos.id == esboco_id))
+    esboco = result.scalars().first()
+    await canal_eventos.publicar(user_id, "esboco", "atualizado", esboco_id, EsbocoSchema.model_validate(esboco))
+    return esboco
+
+@router.post("/{esboco_id}/publicacao", response_model=EsbocoSchema)
+async def publicar_esboco(esboco_id: int, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
+    """Publica o esboço no catálogo público do usuário (`/publico/{usuario_id}`)."""
+    return await alterar_publicacao(db, current_user.id, esboco_id, "S")
+
+@router.delete("/{esboco_id}/publicacao", response_model=EsbocoSchema)
+async def retirar_publicacao(esboco_id: int, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
+    """Retira o esboço do catálogo público."""
+    return await alterar_publicacao(db, current_user.id, esboco_id, "N")
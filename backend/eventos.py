@@ -0,0 +1,320 @@
+"""
+Stream de alterações: `GET /eventos/` (Server-Sent Events).
+
+As rotas de escrita de temas, subtemas, esboços e versículos publicam um evento por
+registro alterado, e cada aba aberta recebe os do seu usuário e atualiza o estado local
+sem recarregar as listas:
+
+    id: 42
+    event: alteracao
+    data: {"entidade": "esboco", "acao": "atualizado", "id": 7, "dados": {...}}
+
+`acao` é "criado", "atualizado" ou "removido" (sem `dados`); um `/batch` gera um só
+evento `{"entidade": "lote", "acao": "sincronizar"}` (mesclar/mover temas e subtemas,
+`{"entidade": "tema", "acao": "sincronizar"}`) e o cliente busca as mudanças pelo
+`/sync` incremental. Os ids crescem por usuário (contador no Redis), então o `Last-Event-ID` que o navegador reenvia ao reconectar
+retoma o stream de onde parou, em qualquer worker. Quando a retomada não é possível
+(eventos mais antigos que os guardados, ou a conexão não acompanhou o ritmo) sai
+`event: reset` e o cliente deve se atualizar pelo `/sync`.
+
+Entre workers os eventos passam pelo pub/sub do Redis; cada worker entrega aos seus
+streams e guarda os últimos `SSE_REPLAY_SIZE` de cada usuário para as retomadas. Sem
+Redis, o stream só recebe o que foi escrito no mesmo worker.
+
+O `EventSource` do navegador não envia headers, e um JWT na query string ficaria nos
+logs de acesso do nginx e do gunicorn. Por isso o cliente pede antes um ticket
+(`POST /eventos/ticket`, com o header Authorization) e abre o stream com `?ticket=`: o
+ticket vale uma vez só e por `SSE_TICKET_SECONDS`, então a reconexão automática do
+navegador é recusada: o cliente pede outro ticket e reabre com `?last_event_id=`.
+"""
+import asyncio
+import bisect
+import json
+import logging
+import os
+import secrets
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+import redis.asyncio as redis
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from cache import cache
+from config import settings
+from database import ReadSessionLocal
+from models import Usuario
+from security import carregar_principal, decode_access_token, get_current_complete_user
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/eventos",
+    tags=["eventos"],
+)
+
+# Usuários com eventos guardados para retomada (os menos recentes saem primeiro)
+MAX_USUARIOS_REPLAY = 10000
+RECONNECT_MS = 3000
+
+Evento = Tuple[int, dict]
+
+
+class Assinatura:
+    """Um stream aberto: fila limitada; se encher, o stream recebe reset e é encerrado."""
+
+    ESTOURO = (0, None)
+
+    def __init__(self, usuario_id: int, tamanho: int):
+        self.usuario_id = usuario_id
+        self.fila: asyncio.Queue = asyncio.Queue(maxsize=tamanho)
+
+
+class CanalEventos:
+    def __init__(self, tamanho_fila: int, tamanho_replay: int, max_conexoes: int, max_por_usuario: int):
+        self.tamanho_fila = tamanho_fila
+        self.tamanho_replay = tamanho_replay
+        self.max_conexoes = max_conexoes
+        self.max_por_usuario = max_por_usuario
+        self.conexoes = 0
+        self._assinaturas: Dict[int, Set[Assinatura]] = {}
+        self._recentes: "OrderedDict[int, List[Evento]]" = OrderedDict()
+        self._ultimo_local: Dict[int, int] = {}
+        self._worker_id: Optional[str] = None
+        self._listener_task: Optional[asyncio.Task] = None
+        try:
+            self._redis: Optional[redis.Redis] = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        except Exception as e:
+            logger.warning("Falha na configuração do Redis, eventos só neste worker: %s", e)
+            self._redis = None
+
+    @staticmethod
+    def _chave_sequencia(usuario_id: int) -> str:
+        return f"eventos_seq:{usuario_id}"
+
+    # --- Publicação ---
+
+    async def publicar(self, usuario_id: int, entidade: str, acao: str, registro_id: Optional[int] = None, dados=None):
+        """Publica a alteração de um registro (chamado depois do commit)."""
+        evento = {"entidade": entidade, "acao": acao}
+        if registro_id is not None:
+            evento["id"] = registro_id
+        if dados is not None:
+            evento["dados"] = jsonable_encoder(dados)
+
+        seq = None
+        if self._redis is not None:
+            try:
+                seq = await self._redis.incr(self._chave_sequencia(usuario_id))
+                mensagem = {"origin": self._worker_id, "usuario_id": usuario_id, "seq": seq, "evento": evento}
+                await self._redis.publish(settings.EVENTS_CHANNEL, json.dumps(mensagem))
+            except Exception as e:
+                logger.warning("Erro ao publicar evento no Redis, entregando só neste worker: %s", e)
+        if seq is None:
+            seq = self._ultimo_local.get(usuario_id, 0) + 1
+        # Os streams deste worker recebem direto; os dos outros, pelo pub/sub
+        self._entregar(usuario_id, seq, evento)
+
+    def _entregar(self, usuario_id: int, seq: int, evento: dict):
+        self._ultimo_local[usuario_id] = max(seq, self._ultimo_local.get(usuario_id, 0))
+
+        recentes = self._recentes.setdefault(usuario_id, [])
+        self._recentes.move_to_end(usuario_id)
+        bisect.insort(recentes, (seq, evento), key=lambda item: item[0])
+        del recentes[:-self.tamanho_replay]
+        if len(self._recentes) > MAX_USUARIOS_REPLAY:
+            usuario_antigo, _ = self._recentes.popitem(last=False)
+            self._ultimo_local.pop(usuario_antigo, None)
+
+        for assinatura in list(self._assinaturas.get(usuario_id, ())):
+            try:
+                assinatura.fila.put_nowait((seq, evento))
+            except asyncio.QueueFull:
+                # Cliente lento: descarta o que está na fila e encerra o stream com reset
+                while not assinatura.fila.empty():
+                    assinatura.fila.get_nowait()
+                assinatura.fila.put_nowait(Assinatura.ESTOURO)
+                self.cancelar(assinatura)
+
+    # --- Assinaturas ---
+
+    def assinar(self, usuario_id: int) -> Assinatura:
+        if self.conexoes >= self.max_conexoes:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Muitas conexões abertas. Tente novamente em instantes.",
+                headers={"Retry-After": "5"},
+            )
+        assinaturas = self._assinaturas.setdefault(usuario_id, set())
+        if len(assinaturas) >= self.max_por_usuario:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Muitas abas abertas recebendo alterações")
+        assinatura = Assinatura(usuario_id, self.tamanho_fila)
+        assinaturas.add(assinatura)
+        self.conexoes += 1
+        return assinatura
+
+    def cancelar(self, assinatura: Assinatura):
+        assinaturas = self._assinaturas.get(assinatura.usuario_id)
+        if assinaturas is None or assinatura not in assinaturas:
+            return
+        assinaturas.discard(assinatura)
+        if not assinaturas:
+            del self._assinaturas[assinatura.usuario_id]
+        self.conexoes -= 1
+
+    async def _ultimo_id(self, usuario_id: int) -> int:
+        if self._redis is not None:
+            try:
+                return int(await self._redis.get(self._chave_sequencia(usuario_id)) or 0)
+            except Exception:
+                pass
+        return self._ultimo_local.get(usuario_id, 0)
+
+    async def desde(self, usuario_id: int, ultimo_id: int) -> Optional[List[Evento]]:
+        """Eventos depois de `ultimo_id`, ou None se algum deles não está mais guardado."""
+        atual = await self._ultimo_id(usuario_id)
+        if ultimo_id >= atual:
+            return []
+        recentes = self._recentes.get(usuario_id, [])
+        pendentes = [item for item in recentes if item[0] > ultimo_id]
+        if len(pendentes) < atual - ultimo_id:
+            return None
+        return pendentes
+
+    # --- Stream ---
+
+    async def stream(self, assinatura: Assinatura, ultimo_id: Optional[int]):
+        try:
+            yield f"retry: {RECONNECT_MS}\n\n"
+            reenviados = set()
+            if ultimo_id is not None:
+                pendentes = await self.desde(assinatura.usuario_id, ultimo_id)
+                if pendentes is None:
+                    yield "event: reset\ndata: {}\n\n"
+                    return
+                for seq, evento in pendentes:
+                    reenviados.add(seq)
+                    yield _formatar(seq, evento)
+
+            while True:
+                try:
+                    seq, evento = await asyncio.wait_for(assinatura.fila.get(), settings.SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Mantém a conexão viva atrás de proxies com timeout de inatividade
+                    yield ": ping\n\n"
+                    continue
+                if evento is None:
+                    yield "event: reset\ndata: {}\n\n"
+                    return
+                if seq not in reenviados:
+                    yield _formatar(seq, evento)
+        finally:
+            self.cancelar(assinatura)
+
+    # --- Pub/sub entre workers ---
+
+    async def _ouvir(self):
+        retry_delay = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(settings.EVENTS_CHANNEL)
+                retry_delay = 1
+                async for message in pubsub.listen():
+                    data = json.loads(message["data"])
+                    if data.get("origin") != self._worker_id:
+                        self._entregar(data["usuario_id"], data["seq"], data["evento"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Erro no canal de eventos do Redis, tentando novamente: %s", e)
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+
+    def iniciar(self):
+        self._worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        if self._redis is not None and self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._ouvir())
+
+    async def parar(self):
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+
+def _formatar(seq: int, evento: dict) -> str:
+    return f"id: {seq}\nevent: alteracao\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+
+
+canal_eventos = CanalEventos(
+    settings.SSE_QUEUE_SIZE,
+    settings.SSE_REPLAY_SIZE,
+    settings.SSE_MAX_CONNECTIONS,
+    settings.SSE_MAX_CONNECTIONS_PER_USER,
+)
+
+
+def _chave_ticket(ticket: str) -> str:
+    return f"eventos_ticket:{ticket}"
+
+
+@router.post("/ticket")
+async def criar_ticket(current_user: Usuario = Depends(get_current_complete_user)):
+    """Ticket de uso único para abrir o stream (`GET /eventos/?ticket=...`) sem expor o token na URL."""
+    ticket = secrets.token_urlsafe(32)
+    await cache.set(_chave_ticket(ticket), current_user.email, ex=settings.SSE_TICKET_SECONDS)
+    return {"ticket": ticket, "expires_in": settings.SSE_TICKET_SECONDS}
+
+
+@router.get("/")
+async def stream_eventos(
+    request: Request,
+    ticket: Optional[str] = Query(None, max_length=100, description="Ticket de `POST /eventos/ticket` (o EventSource não envia o header Authorization)"),
+    last_event_id: Optional[str] = Header(None),
+    ultimo_evento: Optional[str] = Query(None, alias="last_event_id", description="Retomada ao reabrir o stream com um ticket novo"),
+):
+    """Stream (SSE) das alterações nos temas, subtemas, esboços e versículos do usuário."""
+    autorizacao = request.headers.get("authorization", "")
+    if autorizacao.lower().startswith("bearer "):
+        email = decode_access_token(autorizacao[7:]).email
+    elif ticket:
+        email = await cache.pop(_chave_ticket(ticket))
+        if email is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Ticket inválido ou expirado")
+    else:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Não autenticado", headers={"WWW-Authenticate": "Bearer"})
+
+    # A sessão fecha antes do stream: a conexão fica aberta por horas
+    async with ReadSessionLocal() as db:
+        user = await carregar_principal(db, email)
+        if user is None or user.ativo != "S":
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Usuário não encontrado ou inativo")
+        if user.is_profile_complete != "S":
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Perfil incompleto. Por favor, complete seu cadastro.")
+        usuario_id = user.id
+
+    # O navegador só reenvia o header na reconexão automática (que falha: o ticket já foi usado);
+    # ao abrir outro EventSource com um ticket novo, o cliente passa o último id na query
+    last_event_id = last_event_id or ultimo_evento
+    ultimo_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    assinatura = canal_eventos.assinar(usuario_id)
+    return StreamingResponse(
+        canal_eventos.stream(assinatura, ultimo_id),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: o nginx repassa cada evento em vez de acumular
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Garante a liberação da vaga mesmo se o stream nem chegar a começar
+        background=BackgroundTask(canal_eventos.cancelar, assinatura),
+    )
@@ -0,0 +1,54 @@
+# Configuração do Gunicorn para produção: vários workers Uvicorn por container
+# Uso: gunicorn -c gunicorn.conf.py main:app
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8003')}"
+
+# Um worker por núcleo (+1), ajustável por WEB_CONCURRENCY
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() + 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Carrega a aplicação uma vez no processo mestre e compartilha a memória com os workers (fork)
+preload_app = True
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+# Recicla workers aos poucos para conter vazamentos de memória
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = 1000
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # Cria/ajusta as tabelas uma vez, no mestre, antes dos workers: N workers rodando o
+    # mesmo ALTER TABLE no boot disputariam o DDL (no PostgreSQL, só um passaria)
+    import asyncio
+    from database import dispose_engines, init_db
+
+    async def sincronizar_schema():
+        try:
+            await init_db()
+        finally:
+            await dispose_engines()
+
+    asyncio.run(sincronizar_schema())
+
+
+def post_fork(server, worker):
+    # A thread que escreve os logs ficou no mestre; o worker precisa da sua
+    from log import restart_after_fork
+
+    restart_after_fork()
+
+    # Com preload_app o engine foi criado no mestre: cada worker abre seu próprio pool
+    from database import engine, read_engine, replica_router, shard_engines
+
+    for pool_engine in {engine, read_engine, *(e for pair in shard_engines.values() for e in pair)}:
+        pool_engine.sync_engine.dispose(close=False)
+    for _, session_factory in replica_router.replicas:
+        session_factory.kw["bind"].sync_engine.dispose(close=False)
@@ -0,0 +1,361 @@
+"""
+Impressão dos esboços: `GET /esbocos/{id}/impressao?formato=pdf|html`.
+
+O documento (título, texto bíblico, resumo, esboço e os versículos do tema/subtema) é
+gerado num pool de processos (`PRINT_PROCESSES` por worker), fora do event loop, e
+guardado em `PRINT_CACHE_DIR` com o SHA-256 dos campos de origem no nome: imprimir de
+novo um esboço que não mudou só lê o arquivo, e editar um esboço só gera de novo o
+documento dele. Ao mudar o layout, incremente `VERSAO_LAYOUT`.
+
+O PDF é montado aqui mesmo (A4, fontes padrão Helvetica com WinAnsiEncoding, texto
+quebrado pela largura dos glifos), sem dependências externas. Este módulo só importa a
+biblioteca padrão e o config: é o que os processos do pool carregam.
+
+Documentos não lidos há mais de N dias são removidos com:
+
+    python impressao.py coletar [--dias 30] [--simular]
+"""
+import argparse
+import asyncio
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import unicodedata
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+from config import settings
+
+VERSAO_LAYOUT = 1
+MEDIA_TYPES = {"html": "text/html; charset=utf-8", "pdf": "application/pdf"}
+
+
+def chave_documento(fonte: dict, formato: str) -> str:
+    """Hash dos campos de origem: muda quando (e só quando) o documento impresso muda."""
+    conteudo = json.dumps({"layout": VERSAO_LAYOUT, "formato": formato, "fonte": fonte}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+# --- HTML ---
+
+def renderizar_html(fonte: dict) -> bytes:
+    partes = [f"<h1>{html.escape(fonte['titulo'])}</h1>"]
+    tema = fonte["tema"] if not fonte.get("subtema") else f"{fonte['tema']} › {fonte['subtema']}"
+    partes.append(f"<p class=\"tema\">{html.escape(tema)}</p>")
+    partes.append(f"<p class=\"texto-biblico\">{html.escape(fonte['texto_biblico'])}</p>")
+    partes.append(f"<h2>Resumo</h2><p>{html.escape(fonte['resumo'])}</p>")
+    if fonte.get("esboco"):
+        partes.append(f"<h2>Esboço</h2><div class=\"esboco\">{html.escape(fonte['esboco'])}</div>")
+    if fonte.get("versiculos"):
+        partes.append("<h2>Versículos</h2><ul>")
+        for versiculo in fonte["versiculos"]:
+            referencia = versiculo["referencia"] + (f" ({versiculo['traducao']})" if versiculo.get("traducao") else "")
+            partes.append(f"<li><strong>{html.escape(referencia)}</strong> {html.escape(versiculo['texto'])}</li>")
+        partes.append("</ul>")
+
+    return (
+        "<!DOCTYPE html>\n<html lang=\"pt-BR\"><head><meta charset=\"utf-8\">"
+        f"<title>{html.escape(fonte['titulo'])}</title><style>"
+        "@page{size:A4;margin:2cm}"
+        "body{font-family:Georgia,serif;font-size:12pt;line-height:1.45;color:#000;max-width:17cm;margin:0 auto}"
+        "h1{font-size:20pt;margin:0 0 .2em}h2{font-size:14pt;margin:1.2em 0 .3em;break-after:avoid}"
+        ".tema{color:#555;margin:0}.texto-biblico{font-style:italic}"
+        "p,.esboco{white-space:pre-line}li{margin-bottom:.4em;break-inside:avoid}"
+        f"</style></head><body>{''.join(partes)}</body></html>\n"
+    ).encode()
+
+# --- PDF ---
+
+LARGURA_PAGINA, ALTURA_PAGINA = 595.28, 841.89  # A4 em pontos
+MARGEM = 56.7  # 2 cm
+ENTRELINHA = 1.35
+
+# Larguras (1/1000 do corpo) dos caracteres 32-126 nas fontes padrão do PDF (AFM da Adobe)
+_LARGURAS_HELVETICA = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_LARGURAS_HELVETICA_BOLD = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+# Fora do ASCII: pontuação tipográfica; letras acentuadas têm a largura da letra base
+_LARGURAS_EXTRAS = {"—": 1000, "–": 556, "…": 1000, "•": 350, "“": 333, "”": 333, "‘": 222, "’": 222, "º": 365, "ª": 370, "°": 400, "›": 333}
+
+FONTES = {
+    "F1": ("Helvetica", _LARGURAS_HELVETICA),
+    "F2": ("Helvetica-Bold", _LARGURAS_HELVETICA_BOLD),
+    "F3": ("Helvetica-Oblique", _LARGURAS_HELVETICA),
+}
+
+
+def _largura_caractere(caractere: str, larguras: List[int]) -> int:
+    codigo = ord(caractere)
+    if 32 <= codigo <= 126:
+        return larguras[codigo - 32]
+    if caractere in _LARGURAS_EXTRAS:
+        return _LARGURAS_EXTRAS[caractere]
+    base = unicodedata.normalize("NFD", caractere)[0]
+    if 32 <= ord(base) <= 126:
+        return larguras[ord(base) - 32]
+    return 556
+
+
+def _largura(texto: str, fonte: str, tamanho: float) -> float:
+    larguras = FONTES[fonte][1]
+    return sum(_largura_caractere(caractere, larguras) for caractere in texto) * tamanho / 1000
+
+
+def _quebrar(texto: str, fonte: str, tamanho: float, largura_maxima: float) -> List[str]:
+    """Quebra o parágrafo em linhas que cabem na largura (palavras longas demais são cortadas)."""
+    linhas: List[str] = []
+    for paragrafo in texto.replace("\r\n", "\n").replace("\t", "    ").split("\n"):
+        atual = ""
+        for palavra in paragrafo.split(" "):
+            candidata = f"{atual} {palavra}" if atual else palavra
+            if _largura(candidata, fonte, tamanho) <= largura_maxima:
+                atual = candidata
+                continue
+            if atual:
+                linhas.append(atual)
+            atual = ""
+            while _largura(palavra, fonte, tamanho) > largura_maxima:
+                corte = len(palavra) - 1
+                while corte > 1 and _largura(palavra[:corte], fonte, tamanho) > largura_maxima:
+                    corte -= 1
+                linhas.append(palavra[:corte])
+                palavra = palavra[corte:]
+            atual = palavra
+        linhas.append(atual)
+    return linhas
+
+
+def _texto_pdf(texto: str) -> bytes:
+    """String literal do PDF em WinAnsiEncoding (o que não existe no cp1252 vira '?')."""
+    dados = "".join(c for c in texto if c >= " ").encode("cp1252", errors="replace")
+    return b"(" + dados.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _blocos(fonte: dict) -> List[Tuple[str, float, str, float]]:
+    """(fonte, tamanho, texto, espaço antes) de cada parágrafo, na ordem da página."""
+    tema = fonte["tema"] if not fonte.get("subtema") else f"{fonte['tema']} › {fonte['subtema']}"
+    blocos = [
+        ("F2", 20, fonte["titulo"], 0),
+        ("F1", 10, tema, 4),
+        ("F3", 12, fonte["texto_biblico"], 10),
+        ("F2", 14, "Resumo", 16),
+        ("F1", 11, fonte["resumo"], 4),
+    ]
+    if fonte.get("esboco"):
+        blocos += [("F2", 14, "Esboço", 16), ("F1", 11, fonte["esboco"], 4)]
+    if fonte.get("versiculos"):
+        blocos.append(("F2", 14, "Versículos", 16))
+        for versiculo in fonte["versiculos"]:
+            referencia = versiculo["referencia"] + (f" ({versiculo['traducao']})" if versiculo.get("traducao") else "")
+            blocos += [("F2", 11, referencia, 8), ("F1", 11, versiculo["texto"], 0)]
+    return blocos
+
+
+def renderizar_pdf(fonte: dict) -> bytes:
+    largura_util = LARGURA_PAGINA - 2 * MARGEM
+    paginas: List[List[bytes]] = [[]]
+    y = ALTURA_PAGINA - MARGEM
+    for nome_fonte, tamanho, texto, espaco_antes in _blocos(fonte):
+        altura_linha = tamanho * ENTRELINHA
+        y -= espaco_antes
+        for linha in _quebrar(texto, nome_fonte, tamanho, largura_util):
+            if y - altura_linha < MARGEM and paginas[-1]:
+                paginas.append([])
+                y = ALTURA_PAGINA - MARGEM
+            y -= altura_linha
+            if linha:
+                paginas[-1].append(
+                    b"BT /%s %g Tf %.2f %.2f Td %s Tj ET" % (nome_fonte.encode(), tamanho, MARGEM, y, _texto_pdf(linha))
+                )
+
+    total = len(paginas)
+    objetos: Dict[int, bytes] = {}
+    fontes_ids = {nome: 3 + indice for indice, nome in enumerate(FONTES)}
+    for nome, id_fonte in fontes_ids.items():
+        objetos[id_fonte] = b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % FONTES[nome][0].encode()
+    recursos = b"<< /Font << " + b" ".join(b"/%s %d 0 R" % (nome.encode(), id_) for nome, id_ in fontes_ids.items()) + b" >> >>"
+
+    proximo_id = 3 + len(FONTES)
+    paginas_ids = []
+    for numero, comandos in enumerate(paginas, start=1):
+        rodape = f"{numero} / {total}"
+        comandos = comandos + [
+            b"BT /F1 9 Tf %.2f %.2f Td %s Tj ET"
+            % (LARGURA_PAGINA - MARGEM - _largura(rodape, "F1", 9), MARGEM / 2, _texto_pdf(rodape))
+        ]
+        conteudo = zlib.compress(b"\n".join(comandos))
+        id_pagina, id_conteudo = proximo_id, proximo_id + 1
+        proximo_id += 2
+        objetos[id_conteudo] = b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(conteudo) + conteudo + b"\nendstream"
+        objetos[id_pagina] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Resources %s /Contents %d 0 R >>"
+            % (LARGURA_PAGINA, ALTURA_PAGINA, recursos, id_conteudo)
+        )
+        paginas_ids.append(id_pagina)
+
+    objetos[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objetos[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % id_ for id_ in paginas_ids), total)
+    id_info = proximo_id
+    # Título em UTF-16BE (string de texto do PDF), para aparecer com acentos no leitor
+    objetos[id_info] = b"<< /Title <FEFF%s> /Producer (App Meu Pastor) >>" % fonte["titulo"].encode("utf-16-be").hex().upper().encode()
+
+    saida = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    posicoes = {}
+    for id_ in sorted(objetos):
+        posicoes[id_] = len(saida)
+        saida += b"%d 0 obj\n" % id_ + objetos[id_] + b"\nendobj\n"
+    inicio_xref = len(saida)
+    saida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    for id_ in sorted(objetos):
+        saida += b"%010d 00000 n \n" % posicoes[id_]
+    saida += b"trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, id_info, inicio_xref)
+    return bytes(saida)
+
+
+RENDERIZADORES = {"html": renderizar_html, "pdf": renderizar_pdf}
+
+
+def renderizar(formato: str, fonte: dict) -> bytes:
+    """Executada nos processos do pool."""
+    return RENDERIZADORES[formato](fonte)
+
+# --- Cache em disco e pool de processos ---
+
+class Impressora:
+    def __init__(self, diretorio: str, processos: int):
+        self.diretorio = diretorio
+        self.processos = processos
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._em_andamento: Dict[str, asyncio.Future] = {}
+
+    def caminho(self, chave: str, formato: str) -> str:
+        return os.path.join(self.diretorio, chave[:2], f"{chave}.{formato}")
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # Criado no primeiro uso, já dentro do worker. "spawn": o worker tem threads
+        # (logs, monitor) e um fork copiaria locks presos por elas
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.processos, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def documento(self, fonte: dict, formato: str, chave: Optional[str] = None) -> Tuple[str, bytes]:
+        """(chave, conteúdo) do documento, do cache em disco ou renderizado no pool."""
+        chave = chave or chave_documento(fonte, formato)
+        caminho = self.caminho(chave, formato)
+        try:
+            return chave, await asyncio.to_thread(_ler_e_tocar, caminho)
+        except FileNotFoundError:
+            pass
+
+        # Pedidos simultâneos do mesmo documento aguardam a mesma renderização
+        andamento = self._em_andamento.get(chave)
+        if andamento is not None:
+            return chave, await asyncio.shield(andamento)
+
+        andamento = asyncio.get_running_loop().create_future()
+        self._em_andamento[chave] = andamento
+        try:
+            conteudo = await asyncio.get_running_loop().run_in_executor(self._executor(), renderizar, formato, fonte)
+            await asyncio.to_thread(_gravar, caminho, conteudo)
+            andamento.set_result(conteudo)
+            return chave, conteudo
+        except BrokenProcessPool:
+            # Um processo do pool morreu (ex: OOM): o próximo pedido cria outro pool
+            self._pool = None
+            andamento.cancel()
+            raise
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                andamento.cancel()
+            else:
+                andamento.set_exception(e)
+                # Evita o aviso de exceção nunca lida quando ninguém mais esperava
+                andamento.exception()
+            raise
+        finally:
+            del self._em_andamento[chave]
+
+    def fechar(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def descartar(self, fonte: dict):
+        """Apaga os documentos (em todos os formatos) gerados a partir destes campos."""
+        for formato in RENDERIZADORES:
+            try:
+                os.unlink(self.caminho(chave_documento(fonte, formato), formato))
+            except FileNotFoundError:
+                pass
+
+    def coletar(self, dias: float, simular: bool = False) -> Tuple[int, int]:
+        """Remove documentos não lidos (o mtime é renovado a cada leitura) há mais de `dias`."""
+        limite = time.time() - dias * 86400
+        removidos, liberados = 0, 0
+        for raiz, _, nomes in os.walk(self.diretorio):
+            for nome in nomes:
+                caminho = os.path.join(raiz, nome)
+                try:
+                    info = os.stat(caminho)
+                    if info.st_mtime > limite:
+                        continue
+                    if not simular:
+                        os.unlink(caminho)
+                except FileNotFoundError:
+                    continue
+                removidos += 1
+                liberados += info.st_size
+        return removidos, liberados
+
+
+def _ler_e_tocar(caminho: str) -> bytes:
+    with open(caminho, "rb") as entrada:
+        conteudo = entrada.read()
+    os.utime(caminho)
+    return conteudo
+
+
+def _gravar(caminho: str, conteudo: bytes):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), prefix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as saida:
+            saida.write(conteudo)
+        os.replace(temporario, caminho)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.unlink(temporario)
+        raise
+
+
+impressora = Impressora(settings.PRINT_CACHE_DIR, settings.PRINT_PROCESSES)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenção do cache de impressão dos esboços")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    cmd = sub.add_parser("coletar", help="Remove documentos não lidos há muito tempo")
+    cmd.add_argument("--dias", type=float, default=30, help="Remove o que não foi lido neste intervalo")
+    cmd.add_argument("--simular", action="store_true", help="Só mostra quanto seria removido")
+    args = parser.parse_args()
+
+    removidos, liberados = impressora.coletar(args.dias, args.simular)
+    acao = "seriam removidos" if args.simular else "removidos"
+    print(f"{removidos} documentos {acao} ({liberados / 1024 / 1024:.1f} MB)")
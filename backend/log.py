@@ -0,0 +1,202 @@
+"""
+Logs da aplicação sem bloquear o event loop.
+
+Os loggers só colocam o registro numa fila (`QueueHandler`); uma thread
+(`QueueListener`) formata e escreve em stdout, então uma escrita lenta no terminal ou
+no coletor de logs não trava as requisições. Cada registro sai como uma linha JSON
+com o `request_id` da requisição em andamento (header `X-Request-ID`, recebido do
+proxy ou gerado aqui e devolvido na resposta).
+
+Avisos e erros repetidos (mesmo logger e mesma mensagem-modelo, ex: o Redis fora do
+ar em toda chamada ao cache) saem no máximo uma vez a cada `LOG_SAMPLING_SECONDS`; o
+registro seguinte informa quantos foram suprimidos em `suppressed`. Registros que já
+são limitados na origem e cujo conteúdo muda a cada vez (ex: a pilha de um bloqueio do
+event loop) passam `extra={"sem_amostragem": True}` e saem sempre.
+
+Níveis: `LOG_LEVEL` para tudo e `LOG_LEVELS` por módulo, ex:
+`LOG_LEVELS="sqlalchemy.engine=INFO,cache=DEBUG"` (o SQL das consultas sai em INFO).
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from config import settings
+
+REQUEST_ID_HEADER = "x-request-id"
+SERVER_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# Atributos que todo LogRecord tem; o resto veio de `extra=` e vai para o JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "suppressed", "sem_amostragem"}
+
+
+class RequestIdFilter(logging.Filter):
+    """Anota o registro com o request id (roda na thread de quem loga, onde o contexto existe)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Deixa passar um aviso/erro repetido por janela e conta os que foram descartados."""
+
+    MAX_KEYS = 1000
+
+    def __init__(self, window_seconds: float):
+        super().__init__()
+        self.window = window_seconds
+        self._seen: Dict[Tuple[str, int, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.window <= 0 or getattr(record, "sem_amostragem", False):
+            return True
+
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        entry = self._seen.get(key)
+        if entry is not None and now - entry[0] < self.window:
+            entry[1] += 1
+            return False
+
+        if len(self._seen) >= self.MAX_KEYS:
+            self._seen.clear()
+        if entry is not None and entry[1]:
+            record.suppressed = entry[1]
+        self._seen[key] = [now, 0]
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            data["request_id"] = request_id
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            data["suppressed"] = suppressed
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRS:
+                data[name] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _LogQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A mensagem é montada na thread do listener, não no event loop
+        return record
+
+
+_queue_handler: Optional[_LogQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_output_handler: Optional[logging.Handler] = None
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _route_server_loggers():
+    # O uvicorn (e o Gunicorn, no worker) instalam handlers próprios que escrevem direto em stdout
+    for name in SERVER_LOGGERS:
+        server_logger = logging.getLogger(name)
+        server_logger.handlers = []
+        server_logger.propagate = True
+
+
+def _start_listener():
+    global _listener
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, _output_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def configure_logging():
+    """Instala a fila de logs no logger raiz (idempotente) e aplica os níveis do Settings."""
+    global _queue_handler, _output_handler
+    if _queue_handler is not None:
+        return
+
+    _output_handler = logging.StreamHandler(sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        _output_handler.setFormatter(JsonFormatter())
+    else:
+        _output_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    _queue_handler = _LogQueueHandler(queue.SimpleQueue())
+    _queue_handler.addFilter(RequestIdFilter())
+    _queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLING_SECONDS))
+
+    root = logging.getLogger()
+    root.handlers = [_queue_handler]
+    root.setLevel(settings.LOG_LEVEL.upper())
+    for name, level in _parse_levels(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _route_server_loggers()
+    _start_listener()
+    atexit.register(stop_logging)
+
+
+def restart_after_fork():
+    """A thread do listener não sobrevive ao fork (preload_app do Gunicorn): cada worker abre a sua."""
+    if _queue_handler is not None:
+        _route_server_loggers()
+        _start_listener()
+
+
+def stop_logging():
+    """Escreve o que ainda estiver na fila e para a thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RequestIdMiddleware:
+    """Define o request id da requisição (do header `X-Request-ID` ou novo) e o devolve na resposta."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        token = request_id_var.set(request_id[:64])
+
+        async def send_with_request_id(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(raw=message["headers"])["X-Request-ID"] = request_id_var.get()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
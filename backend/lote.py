@@ -0,0 +1,340 @@
+"""
+Lote de operações (POST /batch): vários create/update/delete de temas, subtemas,
+esboços e versículos em uma requisição e uma transação.
+
+O usuário é resolvido uma vez (dependência da rota) e a posse de todos os ids citados
+no lote é verificada com uma única consulta (UNION ALL das quatro tabelas). Daí em
+diante as checagens são feitas em memória e atualizadas conforme o lote cria, move ou
+deleta registros. Se qualquer operação falhar, nada é aplicado e a resposta indica qual.
+Dashboard, listagens em cache, autocomplete, índice de relacionados e catálogo público são
+atualizados uma vez, no fim, e os streams de /eventos recebem um único aviso para sincronizar.
+"""
+from typing import Any, Dict, Iterable, Optional, Set, Tuple, Type
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import Integer, delete, literal, union_all, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from database import get_db
+from models import CatalogoEsbocos, Subtema, Tema, Usuario, VersiculoTema
+from schemas import (
+    CatalogoEsbocosCreate, CatalogoEsbocosUpdate, LoteRequest, LoteResposta, OperacaoLote,
+    SubtemaCreate, SubtemaUpdate, TemaCreate, TemaUpdate, VersiculoTemaCreate, VersiculoTemaUpdate,
+)
+from security import get_current_complete_user
+from atividade import registrar_atividade
+from autocomplete import autocomplete
+from biblia import vincular_versiculo
+from dashboard import invalidar_dashboard
+from esbocos import esbocos_cache_key
+from eventos import canal_eventos
+from publico import catalogo_publico, renderizar_catalogo
+from relacionados import PESOS_CAMPOS, indice_relacionados
+from remocoes import registrar_remocoes
+from temas import mover_subtema_e_conteudo, temas_cache_key
+from versiculos import revincular_versiculo
+
+TEMA_NAO_ENCONTRADO = "Tema não encontrado ou não pertence ao usuário"
+SUBTEMA_NAO_ENCONTRADO = "Subtema não encontrado ou não pertence ao tema"
+
+
+def _nao_encontrado(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+
+def _validar(schema: Type[BaseModel], dados: Dict[str, Any]) -> BaseModel:
+    try:
+        return schema.model_validate(dados)
+    except ValidationError as e:
+        erros = "; ".join(f"{'.'.join(map(str, erro['loc']))}: {erro['msg']}" for erro in e.errors())
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=erros)
+
+
+class ExecutorLote:
+    """Aplica as operações na sessão, com a posse dos registros mantida em memória."""
+
+    def __init__(self, db: AsyncSession, usuario_id: int):
+        self.db = db
+        self.usuario_id = usuario_id
+        self.temas: Set[int] = set()
+        self.subtemas: Dict[int, int] = {}  # subtema -> tema
+        self.esbocos: Dict[int, Tuple[int, Optional[int]]] = {}  # esboço -> (tema, subtema)
+        self.versiculos: Dict[int, Tuple[int, Optional[int]]] = {}
+        self.criados: Dict[int, Tuple[str, int]] = {}  # índice da operação -> (entidade, id)
+        self.esbocos_alterados: Set[int] = set()
+        self.esbocos_removidos: Set[int] = set()
+
+    async def carregar_donos(self, operacoes: Iterable[OperacaoLote]):
+        """Uma consulta para todos os ids citados no lote que pertencem ao usuário."""
+        ids: Dict[str, Set[int]] = {"tema": set(), "subtema": set(), "esboco": set(), "versiculo": set()}
+        for operacao in operacoes:
+            if operacao.id is not None:
+                ids[operacao.entidade].add(operacao.id)
+            for campo, entidade in (("tema_id", "tema"), ("subtema_id", "subtema")):
+                valor = operacao.dados.get(campo)
+                if isinstance(valor, int):
+                    ids[entidade].add(valor)
+
+        sem_subtema = literal(None, Integer)
+        consultas = []
+        if ids["tema"]:
+            consultas.append(
+                select(literal("tema"), Tema.id, Tema.id, sem_subtema)
+                .filter(Tema.usuario_id == self.usuario_id, Tema.id.in_(ids["tema"]))
+            )
+        if ids["subtema"]:
+            consultas.append(
+                select(literal("subtema"), Subtema.id, Subtema.tema_id, sem_subtema)
+                .join(Tema, Subtema.tema_id == Tema.id)
+                .filter(Tema.usuario_id == self.usuario_id, Subtema.id.in_(ids["subtema"]))
+            )
+        for entidade, modelo in (("esboco", CatalogoEsbocos), ("versiculo", VersiculoTema)):
+            if ids[entidade]:
+                consultas.append(
+                    select(literal(entidade), modelo.id, modelo.tema_id, modelo.subtema_id)
+                    .filter(modelo.usuario_id == self.usuario_id, modelo.id.in_(ids[entidade]))
+                )
+        if not consultas:
+            return
+
+        result = await self.db.execute(union_all(*consultas) if len(consultas) > 1 else consultas[0])
+        for entidade, registro_id, tema_id, subtema_id in result.all():
+            if entidade == "tema":
+                self.temas.add(registro_id)
+            elif entidade == "subtema":
+                self.subtemas[registro_id] = tema_id
+            else:
+                registros = self.esbocos if entidade == "esboco" else self.versiculos
+                registros[registro_id] = (tema_id, subtema_id)
+                # Tema/subtema atuais de um esboço/versículo do usuário também são dele
+                self.temas.add(tema_id)
+                if subtema_id:
+                    self.subtemas.setdefault(subtema_id, tema_id)
+
+    # --- Checagens em memória ---
+
+    def _resolver_referencias(self, dados: Dict[str, Any]) -> Dict[str, Any]:
+        """Troca "$N" em tema_id/subtema_id pelo id criado pela operação N."""
+        dados = dict(dados)
+        for campo, entidade in (("tema_id", "tema"), ("subtema_id", "subtema")):
+            valor = dados.get(campo)
+            if isinstance(valor, str) and valor.startswith("$"):
+                criado = self.criados.get(int(valor[1:])) if valor[1:].isdigit() else None
+                if criado is None or criado[0] != entidade:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"{valor} não se refere a um {entidade} criado antes no lote"
+                    )
+                dados[campo] = criado[1]
+        return dados
+
+    def _checar_tema_subtema(self, tema_id: int, subtema_id: Optional[int]):
+        if tema_id not in self.temas:
+            raise _nao_encontrado(TEMA_NAO_ENCONTRADO)
+        if subtema_id and self.subtemas.get(subtema_id) != tema_id:
+            raise _nao_encontrado(SUBTEMA_NAO_ENCONTRADO)
+
+    def _checar_conteudo(self, registros: Dict[int, Tuple[int, Optional[int]]], registro_id: int, valores: Dict[str, Any], detail: str):
+        if registro_id not in registros:
+            raise _nao_encontrado(detail)
+        tema_id, subtema_id = registros[registro_id]
+        tema_id = valores.get("tema_id", tema_id)
+        subtema_id = valores.get("subtema_id", subtema_id)
+        self._checar_tema_subtema(tema_id, subtema_id)
+        registros[registro_id] = (tema_id, subtema_id)
+
+    # --- Operações ---
+
+    async def aplicar(self, index: int, operacao: OperacaoLote) -> Tuple[int, int]:
+        dados = self._resolver_referencias(operacao.dados)
+        metodo = getattr(self, f"_{operacao.op}_{operacao.entidade}")
+        status_code, registro_id = await metodo(operacao.id, dados)
+        if operacao.op == "create":
+            self.criados[index] = (operacao.entidade, registro_id)
+        return status_code, registro_id
+
+    async def _inserir(self, registro) -> int:
+        self.db.add(registro)
+        await self.db.flush()
+        return registro.id
+
+    async def _create_tema(self, _, dados):
+        valores = _validar(TemaCreate, dados).model_dump(exclude_unset=True)
+        tema_id = await self._inserir(Tema(**valores, usuario_id=self.usuario_id))
+        self.temas.add(tema_id)
+        return status.HTTP_201_CREATED, tema_id
+
+    async def _update_tema(self, tema_id, dados):
+        valores = _validar(TemaUpdate, dados).model_dump(exclude_unset=True)
+        if tema_id not in self.temas:
+            raise _nao_encontrado(TEMA_NAO_ENCONTRADO)
+        if valores:
+            await self.db.execute(update(Tema).where(Tema.id == tema_id).values(**valores))
+        return status.HTTP_200_OK, tema_id
+
+    async def _delete_tema(self, tema_id, _):
+        if tema_id not in self.temas:
+            raise _nao_encontrado(TEMA_NAO_ENCONTRADO)
+        result = await self.db.execute(delete(Subtema).where(Subtema.tema_id == tema_id).returning(Subtema.id))
+        subtemas_removidos = result.scalars().all()
+        await self.db.execute(delete(Tema).where(Tema.id == tema_id))
+        await registrar_remocoes(self.db, self.usuario_id, "tema", [tema_id])
+        await registrar_remocoes(self.db, self.usuario_id, "subtema", subtemas_removidos)
+        self.temas.discard(tema_id)
+        for subtema_id in subtemas_removidos:
+            self.subtemas.pop(subtema_id, None)
+        return status.HTTP_204_NO_CONTENT, tema_id
+
+    async def _create_subtema(self, _, dados):
+        valores = _validar(SubtemaCreate, dados).model_dump(exclude_unset=True)
+        if valores["tema_id"] not in self.temas:
+            raise _nao_encontrado(TEMA_NAO_ENCONTRADO)
+        subtema_id = await self._inserir(Subtema(**valores))
+        self.subtemas[subtema_id] = valores["tema_id"]
+        return status.HTTP_201_CREATED, subtema_id
+
+    async def _update_subtema(self, subtema_id, dados):
+        valores = _validar(SubtemaUpdate, dados).model_dump(exclude_unset=True)
+        if subtema_id not in self.subtemas:
+            raise _nao_encontrado("Subtema não encontrado ou não pertence ao usuário")
+        novo_tema_id = valores.pop("tema_id", None)
+        if novo_tema_id is not None and novo_tema_id != self.subtemas[subtema_id]:
+            if novo_tema_id not in self.temas:
+                raise _nao_encontrado(TEMA_NAO_ENCONTRADO)
+            # Como no PUT /temas/subtemas/{id}: os esboços e versículos do subtema vão junto
+            await mover_subtema_e_conteudo(self.db, self.usuario_id, subtema_id, novo_tema_id)
+            self.subtemas[subtema_id] = novo_tema_id
+            for registros in (self.esbocos, self.versiculos):
+                for registro_id, (_, registro_subtema) in registros.items():
+                    if registro_subtema == subtema_id:
+                        registros[registro_id] = (novo_tema_id, subtema_id)
+        if valores:
+            await self.db.execute(update(Subtema).where(Subtema.id == subtema_id).values(**valores))
+        return status.HTTP_200_OK, subtema_id
+
+    async def _delete_subtema(self, subtema_id, _):
+        if subtema_id not in self.subtemas:
+            raise _nao_encontrado("Subtema não encontrado ou não pertence ao usuário")
+        await self.db.execute(delete(Subtema).where(Subtema.id == subtema_id))
+        await registrar_remocoes(self.db, self.usuario_id, "subtema", [subtema_id])
+        del self.subtemas[subtema_id]
+        return status.HTTP_204_NO_CONTENT, subtema_id
+
+    async def _create_esboco(self, _, dados):
+        valores = _validar(CatalogoEsbocosCreate, dados).model_dump(exclude_unset=True)
+        self._checar_tema_subtema(valores["tema_id"], valores.get("subtema_id"))
+        esboco_id = await self._inserir(CatalogoEsbocos(**valores, usuario_id=self.usuario_id))
+        await registrar_atividade(self.db, self.usuario_id, "esboco")
+        self.esbocos[esboco_id] = (valores["tema_id"], valores.get("subtema_id"))
+        self.esbocos_alterados.add(esboco_id)
+        return status.HTTP_201_CREATED, esboco_id
+
+    async def _update_esboco(self, esboco_id, dados):
+        valores = _validar(CatalogoEsbocosUpdate, dados).model_dump(exclude_unset=True)
+        self._checar_conteudo(self.esbocos, esboco_id, valores, "Esboço não encontrado ou não pertence ao usuário")
+        if valores:
+            await self.db.execute(update(CatalogoEsbocos).where(CatalogoEsbocos.id == esboco_id).values(**valores))
+            self.esbocos_alterados.add(esboco_id)
+        return status.HTTP_200_OK, esboco_id
+
+    async def _delete_esboco(self, esboco_id, _):
+        if esboco_id not in self.esbocos:
+            raise _nao_encontrado("Esboço não encontrado ou não pertence ao usuário")
+        result = await self.db.execute(
+            delete(CatalogoEsbocos).where(CatalogoEsbocos.id == esboco_id).returning(CatalogoEsbocos.created_at)
+        )
+        await registrar_atividade(self.db, self.usuario_id, "esboco", -1, result.scalar_one())
+        await registrar_remocoes(self.db, self.usuario_id, "esboco", [esboco_id])
+        del self.esbocos[esboco_id]
+        self.esbocos_alterados.discard(esboco_id)
+        self.esbocos_removidos.add(esboco_id)
+        return status.HTTP_204_NO_CONTENT, esboco_id
+
+    async def _create_versiculo(self, _, dados):
+        versiculo = _validar(VersiculoTemaCreate, dados)
+        self._checar_tema_subtema(versiculo.tema_id, versiculo.subtema_id)
+        valores = versiculo.model_dump(exclude={"traducao"})
+        valores.update(vincular_versiculo(versiculo.versiculo, versiculo.descricao_versiculo, versiculo.traducao))
+        versiculo_id = await self._inserir(VersiculoTema(**valores, usuario_id=self.usuario_id))
+        await registrar_atividade(self.db, self.usuario_id, "versiculo")
+        self.versiculos[versiculo_id] = (versiculo.tema_id, versiculo.subtema_id)
+        return status.HTTP_201_CREATED, versiculo_id
+
+    async def _update_versiculo(self, versiculo_id, dados):
+        valores = _validar(VersiculoTemaUpdate, dados).model_dump(exclude_unset=True)
+        self._checar_conteudo(self.versiculos, versiculo_id, valores, "Versículo não encontrado ou não pertence ao usuário")
+        if valores.keys() & {"versiculo", "descricao_versiculo", "traducao"}:
+            valores.update(await revincular_versiculo(self.db, versiculo_id, self.usuario_id, valores))
+        if valores:
+            await self.db.execute(update(VersiculoTema).where(VersiculoTema.id == versiculo_id).values(**valores))
+        return status.HTTP_200_OK, versiculo_id
+
+    async def _delete_versiculo(self, versiculo_id, _):
+        if versiculo_id not in self.versiculos:
+            raise _nao_encontrado("Versículo não encontrado ou não pertence ao usuário")
+        result = await self.db.execute(
+            delete(VersiculoTema).where(VersiculoTema.id == versiculo_id).returning(VersiculoTema.created_at)
+        )
+        await registrar_atividade(self.db, self.usuario_id, "versiculo", -1, result.scalar_one())
+        await registrar_remocoes(self.db, self.usuario_id, "versiculo", [versiculo_id])
+        del self.versiculos[versiculo_id]
+        return status.HTTP_204_NO_CONTENT, versiculo_id
+
+# --- Rotas ---
+
+router = APIRouter(
+    prefix="/batch",
+    tags=["batch"],
+    dependencies=[Depends(get_current_complete_user)]
+)
+
+@router.post("", response_model=LoteResposta)
+async def executar_lote(
+    lote: LoteRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_complete_user)
+):
+    """
+    Aplica as operações em ordem, em uma única transação. Se alguma falhar, nada é
+    gravado e o erro traz o índice da operação (`detail.operacao`).
+    """
+    usuario_id = current_user.id
+    executor = ExecutorLote(db, usuario_id)
+    await executor.carregar_donos(lote.operacoes)
+
+    resultados = []
+    for index, operacao in enumerate(lote.operacoes):
+        try:
+            status_code, registro_id = await executor.aplicar(index, operacao)
+        except HTTPException as e:
+            await db.rollback()
+            raise HTTPException(status_code=e.status_code, detail={"mensagem": e.detail, "operacao": index})
+        except SQLAlchemyError as e:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={"mensagem": f"Erro ao aplicar a operação: {e.__class__.__name__}", "operacao": index}
+            )
+        resultados.append({"index": index, "status": status_code, "id": registro_id})
+
+    await db.commit()
+
+    # Efeitos colaterais uma vez por lote, não por operação
+    await invalidar_dashboard(usuario_id, temas_cache_key(usuario_id), esbocos_cache_key(usuario_id))
+    await autocomplete.descartar(usuario_id)
+    await canal_eventos.publicar(usuario_id, "lote", "sincronizar")
+    if catalogo_publico.tem_catalogo(usuario_id):
+        await renderizar_catalogo(usuario_id, db)
+    if executor.esbocos_alterados or executor.esbocos_removidos:
+        atualizados = {}
+        if executor.esbocos_alterados:
+            colunas = [getattr(CatalogoEsbocos, campo) for campo in PESOS_CAMPOS]
+            result = await db.execute(
+                select(CatalogoEsbocos.id, *colunas).filter(CatalogoEsbocos.id.in_(executor.esbocos_alterados))
+            )
+            atualizados = {linha[0]: dict(zip(PESOS_CAMPOS, linha[1:])) for linha in result.all()}
+        background_tasks.add_task(indice_relacionados.aplicar, usuario_id, atualizados, list(executor.esbocos_removidos))
+
+    return {"resultados": resultados}
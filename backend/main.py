@@ -1,5 +1,11 @@
-from fastapi import FastAPI
+import hmac
+from fastapi import FastAPI, Header, HTTPException
 from contextlib import asynccontextmanager
+from log import RequestIdMiddleware, configure_logging
+
+# Antes dos demais imports, para que os logs emitidos ao importá-los já passem pela fila
+configure_logging()
+
 from fastapi.middleware.cors import CORSMiddleware
 from database import init_db
 from config import settings
@@ -9,13 +15,37 @@ from temas import router as temas_router
 from esbocos import router as esbocos_router
 from versiculos import router as versiculos_router
 from dashboard import router as dashboard_router
+from biblia import router as biblia_router
+from autocomplete import router as autocomplete_router
+from arquivos import router as arquivos_router
+from sincronizacao import router as sincronizacao_router
+from lote import router as lote_router
+from eventos import canal_eventos, router as eventos_router
+from publico import router as publico_router
+from compression import CompressionMiddleware
+from profiler import ProfilerMiddleware
+from admission import AdmissionControlMiddleware
+from monitor import loop_monitor
+from impressao import impressora
+from cache import cache
 from fastapi.middleware.cors import CORSMiddleware
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Inicializa o banco de dados (cria as tabelas)
     await init_db()
+    # Escuta as invalidações de cache publicadas pelos outros workers
+    cache.start_invalidation_listener()
+    # Recebe as alterações publicadas pelos outros workers para os streams de /eventos
+    canal_eventos.iniciar()
+    # Mede o atraso do event loop deste worker (e a pilha quando ele fica bloqueado)
+    loop_monitor.start()
     yield
+    await loop_monitor.stop()
+    await canal_eventos.parar()
+    await cache.stop_invalidation_listener()
+    # Encerra os processos de renderização da impressão (se chegaram a ser criados)
+    impressora.fechar()
 
 app = FastAPI(
     title="App Meu Pastor API",
@@ -24,6 +54,18 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Controle de admissão: 503 + Retry-After quando a classe de rota passa do limite adaptativo.
+# Registrado antes do CORS para ficar por dentro dele (o 503 sai com os headers de CORS).
+if settings.ADMISSION_CONTROL:
+    app.add_middleware(
+        AdmissionControlMiddleware,
+        initial_limit=settings.ADMISSION_INITIAL_LIMIT,
+        min_limit=settings.ADMISSION_MIN_LIMIT,
+        max_limit=settings.ADMISSION_MAX_LIMIT,
+        tolerance=settings.ADMISSION_LATENCY_TOLERANCE,
+        max_queue_wait_ms=settings.ADMISSION_MAX_QUEUE_WAIT_MS,
+    )
+
 # 2. Defina explicitamente as origens permitidas (SEM usar "*")
 origins = [
     "http://72.61.40.223:8005",  # O endereço exato do seu frontend na VPS
@@ -44,6 +86,21 @@ app.add_middleware(
     allow_headers=["*"], 
 )
 
+# Compressão negociada pelo Accept-Encoding (respostas pequenas e já comprimidas passam direto)
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MINIMUM_SIZE)
+
+# Profiler sob demanda, por fora dos demais middlewares (só com PROFILER_TOKEN definido)
+if settings.PROFILER_TOKEN:
+    app.add_middleware(
+        ProfilerMiddleware,
+        token=settings.PROFILER_TOKEN,
+        directory=settings.PROFILER_DIR,
+        interval_ms=settings.PROFILER_INTERVAL_MS,
+    )
+
+# Request id dos logs (X-Request-ID), o mais externo para valer em toda a requisição
+app.add_middleware(RequestIdMiddleware)
+
 # Inclusão das rotas
 app.include_router(auth_router)
 app.include_router(users_router)
@@ -51,7 +108,31 @@ app.include_router(temas_router)
 app.include_router(esbocos_router)
 app.include_router(versiculos_router)
 app.include_router(dashboard_router)
+app.include_router(biblia_router)
+app.include_router(autocomplete_router)
+app.include_router(arquivos_router)
+app.include_router(sincronizacao_router)
+app.include_router(lote_router)
+app.include_router(eventos_router)
+app.include_router(publico_router)
 
 @app.get("/")
 async def root():
     return {"message": "Bem-vindo à API do App Meu Pastor"}
+
+def _admission_control():
+    """Instância do controle de admissão na pilha de middlewares (o Starlette a monta no primeiro request)."""
+    camada = app.middleware_stack
+    while camada is not None:
+        if isinstance(camada, AdmissionControlMiddleware):
+            return camada
+        camada = getattr(camada, "app", None)
+    return None
+
+@app.get("/stats", include_in_schema=False)
+async def stats(x_stats_token: str = Header(default="")):
+    """Métricas do worker que atendeu a requisição (só com o header X-Stats-Token)."""
+    if not settings.STATS_TOKEN or not hmac.compare_digest(x_stats_token.encode(), settings.STATS_TOKEN.encode()):
+        raise HTTPException(status_code=404, detail="Not Found")
+    admission = _admission_control()
+    return {"event_loop": loop_monitor.snapshot(), "admission": admission.snapshot() if admission else None}
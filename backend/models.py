@@ -1,8 +1,19 @@
-from sqlalchemy import Column, Integer, Text, ForeignKey, DateTime, Boolean
+from sqlalchemy import BigInteger, Column, Integer, Text, ForeignKey, Date, DateTime, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from datetime import datetime, timezone
 from database import Base
 
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def updated_at_column():
+    """
+    Última alteração (usada pelo /sync). Preenchida no Python, com microssegundos, em
+    inserts e em qualquer UPDATE (inclusive os feitos com update() nas rotas).
+    """
+    return Column(DateTime(timezone=True), default=utc_now, onupdate=utc_now, nullable=True)
+
 class Usuario(Base):
     __tablename__ = "usuario"
 
@@ -34,12 +45,15 @@ class Tema(Base):
     descricao = Column(Text, nullable=False)
     ativo = Column(Text, default="S")
     usuario_id = Column(Integer, ForeignKey("usuario.id"))
+    updated_at = updated_at_column()
 
     usuario = relationship("Usuario", back_populates="temas")
     subtemas = relationship("Subtema", back_populates="tema")
     esbocos = relationship("CatalogoEsbocos", back_populates="tema")
     versiculos = relationship("VersiculoTema", back_populates="tema")
 
+    __table_args__ = (Index("ix_tema_usuario_updated_at", "usuario_id", "updated_at"),)
+
 class Subtema(Base):
     __tablename__ = "subtema"
 
@@ -47,11 +61,15 @@ class Subtema(Base):
     descricao = Column(Text, nullable=False)
     tema_id = Column(Integer, ForeignKey("tema.id"), nullable=False)
     ativo = Column(Text, default="S")
+    updated_at = updated_at_column()
 
     tema = relationship("Tema", back_populates="subtemas")
     esbocos = relationship("CatalogoEsbocos", back_populates="subtema")
     versiculos = relationship("VersiculoTema", back_populates="subtema")
 
+    # Subtema não tem usuario_id: o /sync filtra pelo tema depois do range scan em updated_at
+    __table_args__ = (Index("ix_subtema_updated_at", "updated_at"),)
+
 class CatalogoEsbocos(Base):
     __tablename__ = "catalogo_esbocos"
 
@@ -65,12 +83,20 @@ class CatalogoEsbocos(Base):
     link_arquivo_esboco = Column(Text, nullable=True)
     link_arquivo_pregacao_completa = Column(Text, nullable=True)
     esboco_manual = Column(Text, nullable=True)
+    publicado = Column(Text, default="N", server_default="N") # 'S' entra no catálogo público (ver publico.py)
     usuario_id = Column(Integer, ForeignKey("usuario.id"), nullable=False)
+    updated_at = updated_at_column()
 
     usuario = relationship("Usuario", back_populates="esbocos")
     tema = relationship("Tema", back_populates="esbocos")
     subtema = relationship("Subtema", back_populates="esbocos")
 
+    # Cobre a contagem por tema/subtema do dashboard (facets) sem ler a tabela
+    __table_args__ = (
+        Index("ix_catalogo_esbocos_usuario_tema", "usuario_id", "tema_id", "subtema_id"),
+        Index("ix_catalogo_esbocos_usuario_updated_at", "usuario_id", "updated_at"),
+    )
+
 class VersiculoTema(Base):
     __tablename__ = "versiculo_tema"
 
@@ -78,10 +104,52 @@ class VersiculoTema(Base):
     tema_id = Column(Integer, ForeignKey("tema.id"), nullable=False)
     subtema_id = Column(Integer, ForeignKey("subtema.id"), nullable=True)
     versiculo = Column(Text, nullable=False)
-    descricao_versiculo = Column(Text, nullable=False)
+    # Texto próprio do usuário; fica nulo quando é igual ao texto canônico do acervo bíblico
+    descricao_versiculo = Column(Text, nullable=True)
+    referencia_canonica = Column(Text, nullable=True) # Faixa de chaves no acervo (ver biblia.Referencia)
+    traducao = Column(Text, nullable=True)
     usuario_id = Column(Integer, ForeignKey("usuario.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = updated_at_column()
 
     usuario = relationship("Usuario", back_populates="versiculos")
     tema = relationship("Tema", back_populates="versiculos")
     subtema = relationship("Subtema", back_populates="versiculos")
+
+    __table_args__ = (
+        Index("ix_versiculo_tema_usuario_tema", "usuario_id", "tema_id", "subtema_id"),
+        Index("ix_versiculo_tema_usuario_updated_at", "usuario_id", "updated_at"),
+    )
+
+class AtividadeResumo(Base):
+    """Quantidade de esboços/versículos criados por usuário e dia (mantida por atividade.py)."""
+    __tablename__ = "atividade_resumo"
+
+    usuario_id = Column(Integer, ForeignKey("usuario.id"), primary_key=True)
+    periodo = Column(Date, primary_key=True)
+    entidade = Column(Text, primary_key=True) # "esboco" ou "versiculo"
+    quantidade = Column(Integer, nullable=False, default=0)
+
+class Arquivo(Base):
+    """Arquivo enviado pelo usuário; o conteúdo fica no blob `sha256` (compartilhado se for igual)."""
+    __tablename__ = "arquivo"
+
+    id = Column(Integer, primary_key=True, index=True)
+    usuario_id = Column(Integer, ForeignKey("usuario.id"), nullable=False, index=True)
+    sha256 = Column(Text, nullable=False, index=True)
+    nome = Column(Text, nullable=False)
+    content_type = Column(Text, nullable=False)
+    tamanho = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+class Remocao(Base):
+    """Registro (tombstone) de um tema/subtema/esboço/versículo deletado, para o /sync."""
+    __tablename__ = "remocao"
+
+    id = Column(Integer, primary_key=True)
+    usuario_id = Column(Integer, ForeignKey("usuario.id"), nullable=False)
+    entidade = Column(Text, nullable=False) # "tema", "subtema", "esboco" ou "versiculo"
+    registro_id = Column(Integer, nullable=False)
+    removido_em = Column(DateTime(timezone=True), default=utc_now, nullable=False)
+
+    __table_args__ = (Index("ix_remocao_usuario_removido_em", "usuario_id", "removido_em"),)
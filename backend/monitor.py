@@ -0,0 +1,144 @@
+"""
+Monitor do event loop.
+
+Trabalho síncrono no event loop (bcrypt em `verify_password`, `jwt.decode`, serializar
+listas grandes) atrasa todas as outras requisições do worker sem aparecer em nenhum log.
+O monitor mede esse atraso continuamente:
+
+- uma task acorda a cada `LOOP_MONITOR_INTERVAL_MS` e registra quanto acordou atrasada
+  (o "lag"); os percentis da janela recente saem em `GET /stats`;
+- uma thread de vigia confere se a task continua acordando. Se o loop ficar parado por
+  mais de `LOOP_LAG_THRESHOLD_MS`, ela registra (log WARNING) a pilha do que está
+  executando naquele momento e a task responsável, enquanto o bloqueio ainda acontece;
+- com `LOOP_SLOW_CALLBACK_MS` > 0 o loop roda em modo debug do asyncio, que registra
+  todo callback que passar desse tempo (logger `asyncio`). Tem custo: só para depuração.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, Optional
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_STACK_FRAMES = 30
+
+
+def _percentile(values, fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class LoopMonitor:
+    def __init__(self, interval_ms: float, threshold_ms: float, window: int, slow_callback_ms: float = 0):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.slow_callback = slow_callback_ms / 1000
+        self.lags: Deque[float] = deque(maxlen=window)
+        self.stalls = 0
+        self._heartbeat = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """Inicia a medição no event loop atual (chamado no lifespan de cada worker)."""
+        if self._task is not None or self.interval <= 0:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        if self.slow_callback > 0:
+            self._loop.set_debug(True)
+            self._loop.slow_callback_duration = self.slow_callback
+
+        self._heartbeat = time.monotonic()
+        self._stop_event.clear()
+        self._task = asyncio.create_task(self._measure(), name="loop-monitor")
+        if self.threshold > 0:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-monitor-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self):
+        self._stop_event.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _measure(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.lags.append(lag)
+            if self.threshold > 0 and lag > self.threshold:
+                self.stalls += 1
+            self._heartbeat = now
+
+    def _watch(self):
+        """Thread de vigia: captura a pilha do loop enquanto ele está bloqueado."""
+        reported = None
+        while not self._stop_event.wait(min(self.threshold / 2, self.interval)):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            # Um relatório por bloqueio: o próximo só depois de a task acordar de novo
+            if stalled > self.threshold and reported != heartbeat:
+                reported = heartbeat
+                self._report(stalled)
+
+    def _report(self, stalled: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        stack = "".join(traceback.format_stack(frame, limit=MAX_STACK_FRAMES))
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        # Já sai um por bloqueio; a amostragem por mensagem-modelo esconderia as pilhas dos seguintes
+        logger.warning(
+            "Event loop bloqueado há %.0f ms",
+            stalled * 1000,
+            extra={
+                "task": task.get_name() if task else None,
+                "coro": repr(task.get_coro()) if task else None,
+                "stack": stack,
+                "sem_amostragem": True,
+            },
+        )
+
+    def snapshot(self) -> Dict:
+        lags = sorted(self.lags)
+        if not lags:
+            return {"samples": 0, "stalls": self.stalls}
+        return {
+            "samples": len(lags),
+            "interval_ms": self.interval * 1000,
+            "lag_ms": {
+                "p50": round(_percentile(lags, 0.5) * 1000, 2),
+                "p95": round(_percentile(lags, 0.95) * 1000, 2),
+                "p99": round(_percentile(lags, 0.99) * 1000, 2),
+                "max": round(lags[-1] * 1000, 2),
+            },
+            "stalls": self.stalls,
+        }
+
+
+loop_monitor = LoopMonitor(
+    settings.LOOP_MONITOR_INTERVAL_MS,
+    settings.LOOP_LAG_THRESHOLD_MS,
+    settings.LOOP_MONITOR_WINDOW,
+    settings.LOOP_SLOW_CALLBACK_MS,
+)
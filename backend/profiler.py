@@ -0,0 +1,148 @@
+"""
+Profiler sob demanda: uma requisição com o header `X-Profile: <PROFILER_TOKEN>` é
+amostrada do início ao fim (dependências de autenticação, rota e serialização) e o
+relatório é gravado em `PROFILER_DIR`; o nome do arquivo volta no header
+`X-Profile-Report`.
+
+O relatório está no formato "folded" (uma pilha por linha com a contagem de amostras),
+aceito por flamegraph.pl, speedscope e inferno. As pilhas começam com `cpu` quando a
+requisição estava executando e com `await` quando estava esperando (banco, Redis, disco),
+então o gráfico mostra também onde a requisição ficou parada.
+
+É amostragem e não cProfile: com asyncio o cProfile mediria junto todas as outras
+requisições do worker. A thread de amostragem só conta a task desta requisição; código
+mandado para outras threads (ex: `asyncio.to_thread`) aparece como `await`.
+
+Sem `PROFILER_TOKEN` o middleware nem é instalado (custo zero).
+"""
+import asyncio
+import hmac
+import os
+import re
+import sys
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PROFILE_HEADER = "x-profile"
+REPORT_HEADER = "X-Profile-Report"
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _awaiting_frames(coro) -> list:
+    """Pilha de uma corrotina suspensa, seguindo a cadeia de `await` até o ponto de espera."""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+
+class _Sampler(threading.Thread):
+    """Amostra, a cada `interval` segundos, a pilha da task da requisição."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, task: asyncio.Task, thread_id: int, root_code, interval: float):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.loop = loop
+        self.task = task
+        self.thread_id = thread_id
+        self.root_code = root_code
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self._sample()
+            except Exception:
+                # A pilha pode mudar durante a leitura; a amostra é só descartada
+                pass
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def _sample(self):
+        if asyncio.current_task(self.loop) is self.task:
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            frames.reverse()
+            state = "cpu"
+        else:
+            frames = _awaiting_frames(self.task.get_coro())
+            state = "await"
+
+        # Só o que está abaixo do middleware (o servidor e o event loop não interessam)
+        for index, frame in enumerate(frames):
+            if frame.f_code is self.root_code:
+                frames = frames[index + 1:]
+                break
+        self.samples[";".join([state, *map(_frame_label, frames)])] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ProfilerMiddleware:
+    """Ativa o profiler para requisições com `X-Profile` igual ao token de administração."""
+
+    def __init__(self, app: ASGIApp, token: str, directory: str, interval_ms: float = 1.0):
+        self.app = app
+        self.token = token.encode()
+        self.directory = directory
+        self.interval = interval_ms / 1000
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        requested = Headers(scope=scope).get(PROFILE_HEADER)
+        if requested is None or not hmac.compare_digest(requested.encode(), self.token):
+            await self.app(scope, receive, send)
+            return
+
+        report_name = self._report_name(scope)
+
+        async def send_with_report(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(raw=message["headers"])[REPORT_HEADER] = report_name
+            await send(message)
+
+        sampler = _Sampler(
+            asyncio.get_running_loop(),
+            asyncio.current_task(),
+            threading.get_ident(),
+            ProfilerMiddleware.__call__.__code__,
+            self.interval,
+        )
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_report)
+        finally:
+            sampler.stop()
+            await asyncio.to_thread(self._write_report, report_name, sampler.folded())
+
+    def _report_name(self, scope: Scope) -> str:
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        path = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "raiz"
+        return f"{timestamp}-{scope['method']}-{path[:60]}-{uuid.uuid4().hex[:8]}.folded"
+
+    def _write_report(self, report_name: str, content: str):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, report_name), "w", encoding="utf-8") as report:
+            report.write(content)
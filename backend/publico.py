@@ -0,0 +1,368 @@
+"""
+Catálogo público de esboços: `GET /publico/{usuario_id}` (página HTML) e
+`GET /publico/{usuario_id}/catalogo.json`, sem login.
+
+O pastor escolhe os esboços publicados (`POST`/`DELETE /esbocos/{id}/publicacao`). A cada
+publicação, retirada ou alteração de um esboço publicado (ou de um tema/subtema usado por
+ele), `renderizar_catalogo` gera o catálogo inteiro uma vez: um JSON e um HTML gravados em
+`<PUBLIC_CATALOG_DIR>/snapshots/` com o SHA-256 do conteúdo no nome, que nunca mudam, e um
+ponteiro `catalogos/<usuario_id>.json` com os nomes atuais.
+
+As rotas públicas não tocam no banco: leem o ponteiro (um stat por requisição) e servem
+o snapshot da memória ou do disco. As URLs estáveis têm cache curto
+(`PUBLIC_CATALOG_MAX_AGE_SECONDS`, com ETag) e indicam em `Content-Location` o snapshot
+em `/publico/snapshots/<hash>`, que pode ficar em cache para sempre (navegador, CDN, nginx).
+
+Snapshots que nenhum ponteiro usa mais são removidos pelo coletor:
+
+    python publico.py coletar [--carencia-horas 24] [--simular]
+    python publico.py renderizar [--usuario 1]   # gera de novo (ex: depois de mudar o HTML)
+"""
+import argparse
+import asyncio
+import hashlib
+import html
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config import settings
+from database import AsyncSessionLocal
+from models import CatalogoEsbocos, Subtema, Tema, Usuario
+from sharding import user_shard
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_NOME = re.compile(r"^[0-9a-f]{64}\.(json|html)$")
+MEDIA_TYPES = {"json": "application/json", "html": "text/html; charset=utf-8"}
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+
+
+class CatalogoPublico:
+    """Snapshots imutáveis (nome = SHA-256 do conteúdo) e o ponteiro atual de cada usuário."""
+
+    def __init__(self, diretorio: str, max_em_memoria: int):
+        self.diretorio = diretorio
+        self.snapshots = os.path.join(diretorio, "snapshots")
+        self.catalogos = os.path.join(diretorio, "catalogos")
+        self.max_em_memoria = max_em_memoria
+        self._conteudos: "OrderedDict[str, bytes]" = OrderedDict()
+        self._ponteiros: Dict[int, Tuple[Tuple[int, int], dict]] = {}
+
+    def _caminho_ponteiro(self, usuario_id: int) -> str:
+        return os.path.join(self.catalogos, f"{usuario_id}.json")
+
+    @staticmethod
+    def _gravar(caminho: str, conteudo: bytes):
+        """Grava num temporário e renomeia: quem lê nunca vê o arquivo pela metade."""
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as saida:
+                saida.write(conteudo)
+            os.replace(temporario, caminho)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.unlink(temporario)
+            raise
+
+    def gravar_snapshot(self, conteudo: bytes, extensao: str) -> str:
+        nome = f"{hashlib.sha256(conteudo).hexdigest()}.{extensao}"
+        caminho = os.path.join(self.snapshots, nome)
+        if os.path.exists(caminho):
+            # Conteúdo repetido (ex: publicou e retirou de novo): renova o mtime para o coletor
+            os.utime(caminho)
+        else:
+            self._gravar(caminho, conteudo)
+        return nome
+
+    def publicar(self, usuario_id: int, conteudo_json: bytes, conteudo_html: bytes, lido_em: float):
+        atual = self.ponteiro(usuario_id)
+        if atual is not None and atual["lido_em"] > lido_em:
+            # Outra renderização leu o banco depois desta: a dela prevalece
+            return
+        ponteiro = {
+            "json": self.gravar_snapshot(conteudo_json, "json"),
+            "html": self.gravar_snapshot(conteudo_html, "html"),
+            "lido_em": lido_em,
+        }
+        self._gravar(self._caminho_ponteiro(usuario_id), json.dumps(ponteiro).encode())
+
+    def retirar(self, usuario_id: int, lido_em: float):
+        atual = self.ponteiro(usuario_id)
+        if atual is None or atual["lido_em"] > lido_em:
+            return
+        try:
+            os.unlink(self._caminho_ponteiro(usuario_id))
+        except FileNotFoundError:
+            pass
+
+    def ponteiro(self, usuario_id: int) -> Optional[dict]:
+        """Snapshots atuais do usuário (relido do disco só quando o arquivo muda)."""
+        caminho = self._caminho_ponteiro(usuario_id)
+        try:
+            info = os.stat(caminho)
+        except FileNotFoundError:
+            self._ponteiros.pop(usuario_id, None)
+            return None
+        versao = (info.st_ino, info.st_mtime_ns)
+        guardado = self._ponteiros.get(usuario_id)
+        if guardado is not None and guardado[0] == versao:
+            return guardado[1]
+        try:
+            with open(caminho, "rb") as entrada:
+                ponteiro = json.loads(entrada.read())
+        except FileNotFoundError:
+            return None
+        self._ponteiros[usuario_id] = (versao, ponteiro)
+        return ponteiro
+
+    def tem_catalogo(self, usuario_id: int) -> bool:
+        return os.path.exists(self._caminho_ponteiro(usuario_id))
+
+    def usuarios(self) -> List[int]:
+        """Usuários com catálogo publicado (pelos ponteiros em disco)."""
+        if not os.path.isdir(self.catalogos):
+            return []
+        return sorted(int(nome[:-5]) for nome in os.listdir(self.catalogos) if nome.endswith(".json") and nome[:-5].isdigit())
+
+    async def conteudo(self, nome: str) -> Optional[bytes]:
+        """Conteúdo de um snapshot; como nunca muda, fica em memória sem invalidação."""
+        conteudo = self._conteudos.get(nome)
+        if conteudo is not None:
+            self._conteudos.move_to_end(nome)
+            return conteudo
+        try:
+            conteudo = await asyncio.to_thread(_ler, os.path.join(self.snapshots, nome))
+        except FileNotFoundError:
+            return None
+        self._conteudos[nome] = conteudo
+        if len(self._conteudos) > self.max_em_memoria:
+            self._conteudos.popitem(last=False)
+        return conteudo
+
+    def coletar(self, carencia_segundos: float, simular: bool = False) -> Tuple[int, int]:
+        """Remove os snapshots que nenhum ponteiro usa, mais antigos que a carência."""
+        referenciados: Set[str] = set()
+        for usuario_id in self.usuarios():
+            ponteiro = self.ponteiro(usuario_id)
+            if ponteiro is not None:
+                referenciados.update((ponteiro["json"], ponteiro["html"]))
+
+        limite = time.time() - carencia_segundos
+        removidos, liberados = 0, 0
+        if not os.path.isdir(self.snapshots):
+            return removidos, liberados
+        for nome in os.listdir(self.snapshots):
+            if nome in referenciados:
+                continue
+            caminho = os.path.join(self.snapshots, nome)
+            try:
+                info = os.stat(caminho)
+                if info.st_mtime > limite:
+                    continue
+                if not simular:
+                    os.unlink(caminho)
+            except FileNotFoundError:
+                continue
+            removidos += 1
+            liberados += info.st_size
+        return removidos, liberados
+
+
+def _ler(caminho: str) -> bytes:
+    with open(caminho, "rb") as entrada:
+        return entrada.read()
+
+
+catalogo_publico = CatalogoPublico(settings.PUBLIC_CATALOG_DIR, settings.PUBLIC_CATALOG_MEMORY_ITEMS)
+
+# --- Renderização ---
+
+def _html(autor: str, esbocos: List[dict]) -> bytes:
+    partes = []
+    tema_atual = None
+    for esboco in esbocos:
+        if esboco["tema"] != tema_atual:
+            if tema_atual is not None:
+                partes.append("</section>")
+            tema_atual = esboco["tema"]
+            partes.append(f"<section><h2>{html.escape(tema_atual)}</h2>")
+        partes.append("<article>")
+        partes.append(f"<h3>{html.escape(esboco['titulo'])}</h3>")
+        detalhes = esboco["texto_biblico"] if not esboco["subtema"] else f"{esboco['subtema']} · {esboco['texto_biblico']}"
+        partes.append(f"<p class=\"detalhes\">{html.escape(detalhes)}</p>")
+        partes.append(f"<p>{html.escape(esboco['resumo'])}</p>")
+        if esboco["esboco"]:
+            partes.append(f"<div class=\"esboco\">{html.escape(esboco['esboco'])}</div>")
+        partes.append("</article>")
+    if tema_atual is not None:
+        partes.append("</section>")
+
+    titulo = html.escape(f"Esboços de {autor}")
+    return (
+        "<!DOCTYPE html>\n<html lang=\"pt-BR\"><head><meta charset=\"utf-8\">"
+        "<meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">"
+        f"<title>{titulo}</title><style>"
+        "body{font-family:system-ui,sans-serif;max-width:48rem;margin:2rem auto;padding:0 1rem;line-height:1.5;color:#222}"
+        "h2{border-bottom:1px solid #ddd;padding-bottom:.25rem}.detalhes{color:#666;margin-top:-.5rem}"
+        "p,.esboco{white-space:pre-line}.esboco{background:#f6f6f6;padding:.75rem;border-radius:4px}"
+        f"</style></head><body><h1>{titulo}</h1>{''.join(partes)}</body></html>\n"
+    ).encode()
+
+
+async def _consultar_catalogo(db: AsyncSession, usuario_id: int):
+    autor = (await db.execute(select(Usuario.nome).filter(Usuario.id == usuario_id))).scalar_one_or_none()
+    result = await db.execute(
+        select(
+            CatalogoEsbocos.id, CatalogoEsbocos.titulo, CatalogoEsbocos.texto_biblico, CatalogoEsbocos.resumo,
+            CatalogoEsbocos.esboco_manual, CatalogoEsbocos.created_at, Tema.descricao, Subtema.descricao,
+        )
+        .join(Tema, Tema.id == CatalogoEsbocos.tema_id)
+        .outerjoin(Subtema, Subtema.id == CatalogoEsbocos.subtema_id)
+        .filter(CatalogoEsbocos.usuario_id == usuario_id, CatalogoEsbocos.publicado == "S")
+        .order_by(Tema.descricao, CatalogoEsbocos.created_at.desc())
+    )
+    return autor, result.all()
+
+
+async def renderizar_catalogo(usuario_id: int, db: Optional[AsyncSession] = None):
+    """
+    Gera de novo o catálogo público do usuário (ou o retira, se não há esboço publicado).
+
+    As rotas passam a própria sessão (de escrita, já com a alteração commitada): a
+    renderização não ocupa outra conexão e a página pública muda antes da resposta.
+    """
+    try:
+        lido_em = time.time()
+        with user_shard(usuario_id):
+            if db is not None:
+                autor, linhas = await _consultar_catalogo(db, usuario_id)
+            else:
+                async with AsyncSessionLocal() as sessao:
+                    autor, linhas = await _consultar_catalogo(sessao, usuario_id)
+
+        if not linhas or autor is None:
+            await asyncio.to_thread(catalogo_publico.retirar, usuario_id, lido_em)
+            return
+
+        esbocos = [
+            {
+                "id": id_, "titulo": titulo, "texto_biblico": texto_biblico, "resumo": resumo, "esboco": esboco,
+                "tema": tema, "subtema": subtema, "created_at": created_at,
+            }
+            for id_, titulo, texto_biblico, resumo, esboco, created_at, tema, subtema in linhas
+        ]
+        # Sem data de geração no conteúdo: o mesmo catálogo gera sempre o mesmo hash
+        conteudo_json = json.dumps(
+            jsonable_encoder({"autor": autor, "esbocos": esbocos}), ensure_ascii=False, separators=(",", ":")
+        ).encode()
+        conteudo_html = _html(autor, esbocos)
+        await asyncio.to_thread(catalogo_publico.publicar, usuario_id, conteudo_json, conteudo_html, lido_em)
+    except Exception as e:
+        # A alteração já foi gravada; o catálogo se corrige na próxima renderização (ou pela CLI)
+        logger.warning("Erro ao renderizar o catálogo público de %s: %s", usuario_id, e)
+
+# --- Rotas (sem autenticação e sem banco) ---
+
+router = APIRouter(
+    prefix="/publico",
+    tags=["publico"],
+)
+
+
+async def _servir(request: Request, nome: Optional[str], cache_control: str, content_location: Optional[str] = None) -> Response:
+    conteudo = await catalogo_publico.conteudo(nome) if nome else None
+    if conteudo is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Catálogo não encontrado")
+
+    etag = f'"{nome.split(".")[0]}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if content_location:
+        headers["Content-Location"] = content_location
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(conteudo, media_type=MEDIA_TYPES[nome.rsplit(".", 1)[1]], headers=headers)
+
+
+@router.get("/snapshots/{nome}")
+async def ler_snapshot(nome: str, request: Request):
+    """Snapshot imutável do catálogo (o nome é o hash do conteúdo)."""
+    if not SNAPSHOT_NOME.match(nome):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Catálogo não encontrado")
+    return await _servir(request, nome, CACHE_IMUTAVEL)
+
+
+def _cache_curto() -> str:
+    return f"public, max-age={settings.PUBLIC_CATALOG_MAX_AGE_SECONDS}"
+
+
+@router.get("/{usuario_id}")
+async def ler_catalogo_html(usuario_id: int, request: Request):
+    """Página com os esboços publicados pelo usuário."""
+    ponteiro = catalogo_publico.ponteiro(usuario_id)
+    nome = ponteiro["html"] if ponteiro else None
+    # Relativo à URL da requisição, funciona também atrás de um prefixo (/api) do proxy
+    return await _servir(request, nome, _cache_curto(), f"snapshots/{nome}")
+
+
+@router.get("/{usuario_id}/catalogo.json")
+async def ler_catalogo_json(usuario_id: int, request: Request):
+    """Os esboços publicados pelo usuário, em JSON."""
+    ponteiro = catalogo_publico.ponteiro(usuario_id)
+    nome = ponteiro["json"] if ponteiro else None
+    return await _servir(request, nome, _cache_curto(), f"../snapshots/{nome}")
+
+# --- Manutenção ---
+
+async def _renderizar_cli(usuario_id: Optional[int]) -> int:
+    from sqlalchemy import distinct
+    from database import dispose_engines, init_db
+    from sharding import pinned_shard, shard_names
+
+    try:
+        await init_db()
+        if usuario_id is not None:
+            usuarios = {usuario_id}
+        else:
+            # Quem tem esboço publicado e quem tinha catálogo (para retirar os que não têm mais)
+            usuarios = set(catalogo_publico.usuarios())
+            for shard in shard_names():
+                with pinned_shard(shard):
+                    async with AsyncSessionLocal() as db:
+                        result = await db.execute(
+                            select(distinct(CatalogoEsbocos.usuario_id)).filter(CatalogoEsbocos.publicado == "S")
+                        )
+                        usuarios.update(result.scalars().all())
+        for usuario in sorted(usuarios):
+            await renderizar_catalogo(usuario)
+    finally:
+        await dispose_engines()
+    return len(usuarios)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenção do catálogo público de esboços")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    cmd = sub.add_parser("coletar", help="Remove snapshots que nenhum catálogo usa mais")
+    cmd.add_argument("--carencia-horas", type=float, default=24, help="Só remove o que não foi tocado neste intervalo")
+    cmd.add_argument("--simular", action="store_true", help="Só mostra quanto seria removido")
+    cmd = sub.add_parser("renderizar", help="Gera de novo os catálogos a partir do banco")
+    cmd.add_argument("--usuario", type=int, help="Só o catálogo deste usuário")
+    args = parser.parse_args()
+
+    if args.comando == "coletar":
+        removidos, liberados = catalogo_publico.coletar(args.carencia_horas * 3600, args.simular)
+        acao = "seriam removidos" if args.simular else "removidos"
+        print(f"{removidos} snapshots {acao} ({liberados / 1024:.1f} KB)")
+    else:
+        total = asyncio.run(_renderizar_cli(args.usuario))
+        print(f"{total} catálogos renderizados")
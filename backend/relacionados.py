@@ -0,0 +1,294 @@
+"""
+Índice de "esboços relacionados" por usuário.
+
+Cada esboço vira um vetor de features com hashing (titulo, texto_biblico, resumo e
+esboco_manual, com pesos diferentes) guardado como uma linha de uma matriz NumPy
+por usuário. A frequência de documentos (df) é mantida junto, então o IDF sai
+na hora da consulta e a similaridade de cosseno com todos os esboços do usuário
+é um único produto matriz-vetor, sem consultar o banco.
+
+As rotas de esbocos.py atualizam a linha do esboço ao criar, editar ou deletar, e
+o índice é gravado em `<RELATED_INDEX_DIR>/<usuario_id>.npz`. Quando o arquivo
+não existe (usuário antigo, ou gravado com outro `RELATED_FEATURES`), ele é montado
+uma vez a partir do banco. Escritas que chegam sem índice gravado só incrementam
+`<usuario_id>.pendente`; se isso acontecer enquanto uma montagem lê o banco, ela não
+grava e lê de novo, para não deixar a escrita de fora.
+"""
+import fcntl
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from config import settings
+
+# Usuários com a matriz mantida em memória em cada worker (os menos recentes saem primeiro)
+MAX_USUARIOS_EM_MEMORIA = 1000
+
+# Peso de cada campo no vetor do esboço
+PESOS_CAMPOS = {"titulo": 3.0, "texto_biblico": 2.0, "resumo": 1.0, "esboco_manual": 1.0}
+
+STOPWORDS = frozenset("""
+    de da do em no na os as um se ao ou me te eu tu lo la ja so nem mas
+    que para com uma por mais como foi ele ela eles elas seu sua seus suas nos nas dos das
+    num numa sao ser esta este isso isto esse essa aos tem ter pelo pela pelos pelas sobre entre
+    quando muito tambem nao sim mesmo porque ate depois sem quem nem lhe lhes onde cada
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]{2,}")
+
+
+def tokenizar(texto: Optional[str]) -> List[str]:
+    if not texto:
+        return []
+    sem_acento = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii").lower()
+    return [token for token in _TOKEN_RE.findall(sem_acento) if token not in STOPWORDS]
+
+
+def vetorizar(campos: Dict[str, Optional[str]], dimensoes: int) -> np.ndarray:
+    """Vetor TF (log) com hashing estável (crc32) dos campos do esboço."""
+    contagens: Dict[int, float] = {}
+    for campo, peso in PESOS_CAMPOS.items():
+        for token in tokenizar(campos.get(campo)):
+            indice = zlib.crc32(token.encode()) % dimensoes
+            contagens[indice] = contagens.get(indice, 0.0) + peso
+
+    vetor = np.zeros(dimensoes, dtype=np.float32)
+    if contagens:
+        indices = np.fromiter(contagens.keys(), dtype=np.int64, count=len(contagens))
+        valores = np.fromiter(contagens.values(), dtype=np.float32, count=len(contagens))
+        vetor[indices] = np.log1p(valores)
+    return vetor
+
+
+class IndiceUsuario:
+    """Matriz TF dos esboços de um usuário, com os ids e a frequência de documentos."""
+
+    def __init__(self, dimensoes: int, ids=None, tf=None, df=None):
+        self.ids = ids if ids is not None else np.zeros(0, dtype=np.int64)
+        self.tf = tf if tf is not None else np.zeros((0, dimensoes), dtype=np.float32)
+        self.df = df if df is not None else np.zeros(dimensoes, dtype=np.int32)
+
+    def _posicao(self, esboco_id: int) -> Optional[int]:
+        encontrados = np.flatnonzero(self.ids == esboco_id)
+        return int(encontrados[0]) if encontrados.size else None
+
+    def upsert(self, esboco_id: int, vetor: np.ndarray):
+        posicao = self._posicao(esboco_id)
+        if posicao is None:
+            self.ids = np.append(self.ids, np.int64(esboco_id))
+            self.tf = np.vstack([self.tf, vetor[np.newaxis, :]])
+        else:
+            self.df -= (self.tf[posicao] > 0)
+            self.tf[posicao] = vetor
+        self.df += (vetor > 0)
+
+    def remover(self, esboco_id: int):
+        posicao = self._posicao(esboco_id)
+        if posicao is None:
+            return
+        self.df -= (self.tf[posicao] > 0)
+        self.ids = np.delete(self.ids, posicao)
+        self.tf = np.delete(self.tf, posicao, axis=0)
+
+    def similares(self, vetor: np.ndarray, limite: int, excluir: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Top-k por similaridade de cosseno com pesos TF-IDF, em uma passada vetorizada."""
+        total = len(self.ids)
+        if total == 0:
+            return []
+        idf = (np.log((1.0 + total) / (1.0 + self.df)) + 1.0).astype(np.float32)
+        pesos = self.tf * idf
+        consulta = vetor * idf
+
+        normas = np.linalg.norm(pesos, axis=1) * np.linalg.norm(consulta)
+        scores = (pesos @ consulta) / np.where(normas == 0, 1.0, normas)
+        if excluir is not None:
+            scores[self.ids == excluir] = -1.0
+
+        k = min(limite, total)
+        melhores = np.argpartition(-scores, k - 1)[:k]
+        melhores = melhores[np.argsort(-scores[melhores])]
+        return [(int(self.ids[i]), float(scores[i])) for i in melhores if scores[i] > 0]
+
+
+class IndiceRelacionados:
+    """Guarda os índices por usuário em disco e em memória (recarrega se outro worker gravou)."""
+
+    def __init__(self, diretorio: str, dimensoes: int, max_usuarios: int = MAX_USUARIOS_EM_MEMORIA):
+        self.diretorio = diretorio
+        self.dimensoes = dimensoes
+        self.max_usuarios = max_usuarios
+        self._memoria: "OrderedDict[int, Tuple[Tuple[int, int], IndiceUsuario]]" = OrderedDict()
+        self._memoria_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def _arquivo(self, usuario_id: int) -> str:
+        return os.path.join(self.diretorio, f"{usuario_id}.npz")
+
+    def _arquivo_pendencias(self, usuario_id: int) -> str:
+        return os.path.join(self.diretorio, f"{usuario_id}.pendente")
+
+    @staticmethod
+    def _versao(arquivo: str) -> Tuple[int, int]:
+        # os.replace troca o inode a cada gravação, inclusive as feitas por outros workers
+        info = os.stat(arquivo)
+        return info.st_ino, info.st_mtime_ns
+
+    def existe(self, usuario_id: int) -> bool:
+        return os.path.exists(self._arquivo(usuario_id))
+
+    @contextmanager
+    def _bloqueio(self, usuario_id: int):
+        """Lock entre threads e entre workers (flock) para o ler-alterar-gravar do arquivo."""
+        os.makedirs(self.diretorio, exist_ok=True)
+        with self._lock, open(self._arquivo(usuario_id) + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _lembrar(self, usuario_id: int, versao: Tuple[int, int], indice: IndiceUsuario):
+        with self._memoria_lock:
+            self._memoria[usuario_id] = (versao, indice)
+            self._memoria.move_to_end(usuario_id)
+            while len(self._memoria) > self.max_usuarios:
+                self._memoria.popitem(last=False)
+
+    def _esquecer(self, usuario_id: int):
+        with self._memoria_lock:
+            self._memoria.pop(usuario_id, None)
+
+    def _carregar(self, usuario_id: int, bloqueado: bool = False) -> Optional[IndiceUsuario]:
+        """Índice gravado do usuário, ou None se ainda não há um válido (deve ser montado do banco)."""
+        arquivo = self._arquivo(usuario_id)
+        try:
+            versao = self._versao(arquivo)
+        except FileNotFoundError:
+            return None
+
+        with self._memoria_lock:
+            em_memoria = self._memoria.get(usuario_id)
+            if em_memoria and em_memoria[0] == versao:
+                self._memoria.move_to_end(usuario_id)
+                return em_memoria[1]
+
+        try:
+            with np.load(arquivo) as dados:
+                indice = IndiceUsuario(self.dimensoes, dados["ids"], dados["tf"], dados["df"])
+        except FileNotFoundError:
+            return None
+        if indice.tf.shape[1] != self.dimensoes:
+            # RELATED_FEATURES mudou: apaga o arquivo para a próxima consulta remontar do banco
+            if bloqueado:
+                self._apagar_versao(usuario_id, versao)
+            else:
+                with self._bloqueio(usuario_id):
+                    self._apagar_versao(usuario_id, versao)
+            return None
+        self._lembrar(usuario_id, versao, indice)
+        return indice
+
+    def _gravar(self, usuario_id: int, indice: IndiceUsuario):
+        arquivo = self._arquivo(usuario_id)
+        fd, temporario = tempfile.mkstemp(dir=self.diretorio, suffix=".npz")
+        with os.fdopen(fd, "wb") as saida:
+            np.savez(saida, ids=indice.ids, tf=indice.tf, df=indice.df)
+        os.replace(temporario, arquivo)
+        self._lembrar(usuario_id, self._versao(arquivo), indice)
+
+    def _apagar_versao(self, usuario_id: int, versao: Tuple[int, int]):
+        """Apaga o arquivo se ele ainda for `versao` (outro worker pode já ter gravado um novo). Com o bloqueio."""
+        try:
+            if self._versao(self._arquivo(usuario_id)) == versao:
+                os.unlink(self._arquivo(usuario_id))
+        except FileNotFoundError:
+            pass
+        self._esquecer(usuario_id)
+
+    def pendencias(self, usuario_id: int) -> int:
+        """Escritas que chegaram sem índice gravado (ver `reconstruir`)."""
+        try:
+            with open(self._arquivo_pendencias(usuario_id)) as entrada:
+                return int(entrada.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    # Operações síncronas (as rotas chamam via asyncio.to_thread / BackgroundTasks)
+
+    def atualizar(self, usuario_id: int, esboco_id: int, campos: Dict[str, Optional[str]]):
+        self.aplicar(usuario_id, atualizados={esboco_id: campos})
+
+    def remover(self, usuario_id: int, esboco_id: int):
+        self.aplicar(usuario_id, removidos=[esboco_id])
+
+    def aplicar(
+        self,
+        usuario_id: int,
+        atualizados: Optional[Dict[int, Dict[str, Optional[str]]]] = None,
+        removidos: Iterable[int] = (),
+    ):
+        """Atualiza/remove vários esboços com uma só leitura e gravação do arquivo."""
+        vetores = {esboco_id: vetorizar(campos, self.dimensoes) for esboco_id, campos in (atualizados or {}).items()}
+        with self._bloqueio(usuario_id):
+            indice = self._carregar(usuario_id, bloqueado=True)
+            if indice is None:
+                # Ainda sem índice: ele será montado do banco (já com estes esboços) na próxima
+                # consulta; uma montagem que esteja lendo o banco agora vê a pendência e relê
+                with open(self._arquivo_pendencias(usuario_id), "w") as saida:
+                    saida.write(str(self.pendencias(usuario_id) + 1))
+                return
+            for esboco_id, vetor in vetores.items():
+                indice.upsert(esboco_id, vetor)
+            for esboco_id in removidos:
+                indice.remover(esboco_id)
+            self._gravar(usuario_id, indice)
+
+    def reconstruir(self, usuario_id: int, esbocos: Iterable[Tuple[int, Dict[str, Optional[str]]]], pendencias: int) -> bool:
+        """
+        Grava o índice montado de `esbocos`, lidos do banco quando `pendencias()` valia
+        `pendencias`. Devolve False, sem gravar, se uma escrita chegou depois disso: a
+        leitura pode não tê-la visto e deve ser refeita.
+        """
+        indice = IndiceUsuario(self.dimensoes)
+        for esboco_id, campos in esbocos:
+            indice.upsert(esboco_id, vetorizar(campos, self.dimensoes))
+        with self._bloqueio(usuario_id):
+            if self.existe(usuario_id):
+                # Outra consulta já montou (e as escritas seguintes já foram aplicadas nele)
+                return True
+            if self.pendencias(usuario_id) != pendencias:
+                return False
+            self._gravar(usuario_id, indice)
+            try:
+                os.unlink(self._arquivo_pendencias(usuario_id))
+            except FileNotFoundError:
+                pass
+        return True
+
+    def descartar(self, usuario_id: int):
+        """Apaga o índice do usuário; ele é montado do banco de novo na próxima consulta."""
+        with self._bloqueio(usuario_id):
+            try:
+                os.unlink(self._arquivo(usuario_id))
+            except FileNotFoundError:
+                pass
+            self._esquecer(usuario_id)
+
+    def similares(self, usuario_id: int, campos: Dict[str, Optional[str]], limite: int, excluir: Optional[int] = None):
+        indice = self._carregar(usuario_id)
+        if indice is None:
+            return []
+        return indice.similares(vetorizar(campos, self.dimensoes), limite, excluir)
+
+
+def campos_do_esboco(esboco) -> Dict[str, Optional[str]]:
+    return {campo: getattr(esboco, campo) for campo in PESOS_CAMPOS}
+
+
+indice_relacionados = IndiceRelacionados(settings.RELATED_INDEX_DIR, settings.RELATED_FEATURES)
@@ -0,0 +1,22 @@
+"""Tombstones dos registros deletados, lidos pelo /sync (ver sincronizacao.py)."""
+from datetime import timedelta
+from typing import Iterable
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from models import Remocao, utc_now
+
+
+async def registrar_remocoes(db: AsyncSession, usuario_id: int, entidade: str, ids: Iterable[int]):
+    """Grava os tombstones dos ids deletados. Deve rodar na mesma transação da deleção."""
+    linhas = [{"usuario_id": usuario_id, "entidade": entidade, "registro_id": registro_id} for registro_id in ids]
+    if linhas:
+        await db.execute(insert(Remocao), linhas)
+
+
+async def limpar_remocoes(db: AsyncSession) -> int:
+    """Apaga os tombstones mais antigos que a retenção (tokens anteriores recebem sync completo)."""
+    limite = utc_now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+    result = await db.execute(delete(Remocao).where(Remocao.removido_em < limite))
+    await db.commit()
+    return result.rowcount
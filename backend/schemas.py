@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr, Field, field_validator
+from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, List, Literal, Optional
+from biblia import texto_canonico
 
 class BaseSchema(BaseModel):
     class Config:
@@ -103,6 +104,23 @@ class Subtema(SubtemaBase):
     id: int
     ativo: str
 
+# ==================== SCHEMAS DE REORGANIZAÇÃO (MESCLAR/MOVER) ====================
+
+class MesclagemRequest(BaseSchema):
+    """Tema (ou subtema) que recebe o conteúdo do que está sendo mesclado"""
+    destino_id: int
+
+class MoverSubtemaRequest(BaseSchema):
+    tema_id: int
+
+class ReorganizacaoResposta(BaseSchema):
+    """Tema de destino e quantos registros foram movidos"""
+    tema_id: int
+    subtemas_movidos: int
+    subtemas_mesclados: int
+    esbocos: int
+    versiculos: int
+
 # ==================== SCHEMAS DE ESBOÇOS ====================
 
 class CatalogoEsbocosBase(BaseSchema):
@@ -132,6 +150,20 @@ class CatalogoEsbocos(CatalogoEsbocosBase):
     id: int
     usuario_id: int
     created_at: datetime
+    publicado: str = "N"
+
+class CatalogoEsbocosResumo(BaseSchema):
+    """Visão resumida para a listagem (sem resumo, esboço manual e links)"""
+    id: int
+    tema_id: int
+    subtema_id: Optional[int] = None
+    titulo: str
+    texto_biblico: str
+    created_at: datetime
+
+class EsbocoRelacionado(CatalogoEsbocosResumo):
+    """Esboço do mesmo usuário com conteúdo parecido"""
+    similaridade: float
 
 # ==================== SCHEMAS DE VERSÍCULOS ====================
 
@@ -139,21 +171,44 @@ class VersiculoTemaBase(BaseSchema):
     tema_id: int
     subtema_id: Optional[int] = None
     versiculo: str = Field(..., min_length=1, max_length=100, description="Referência do versículo (ex: João 3:16)")
-    descricao_versiculo: str = Field(..., min_length=1, description="Texto completo do versículo")
+    descricao_versiculo: Optional[str] = Field(None, min_length=1, description="Texto do versículo (opcional se a referência existir no acervo bíblico)")
 
 class VersiculoTemaCreate(VersiculoTemaBase):
-    pass
+    traducao: Optional[str] = Field(None, max_length=50, description="Tradução do acervo bíblico (padrão do servidor se omitida)")
 
 class VersiculoTemaUpdate(BaseSchema):
     tema_id: Optional[int] = None
     subtema_id: Optional[int] = None
     versiculo: Optional[str] = Field(None, min_length=1, max_length=100)
     descricao_versiculo: Optional[str] = Field(None, min_length=1)
+    traducao: Optional[str] = Field(None, max_length=50)
 
 class VersiculoTema(VersiculoTemaBase):
+    descricao_versiculo: str = Field(..., description="Texto do versículo (do usuário ou do acervo bíblico)")
     id: int
     usuario_id: int
     created_at: datetime
+    referencia_canonica: Optional[str] = None
+    traducao: Optional[str] = None
+
+    @model_validator(mode="before")
+    @classmethod
+    def preencher_texto_canonico(cls, data):
+        """Sem texto próprio gravado, usa o texto do acervo bíblico."""
+        get = data.get if isinstance(data, dict) else lambda name, default=None: getattr(data, name, default)
+        if get("descricao_versiculo") is not None or not get("referencia_canonica"):
+            return data
+        values = {name: get(name) for name in cls.model_fields}
+        values["descricao_versiculo"] = texto_canonico(values["referencia_canonica"], values["traducao"]) or ""
+        return values
+
+class VersiculoTemaResumo(BaseSchema):
+    """Visão resumida para a listagem (sem o texto completo do versículo)"""
+    id: int
+    tema_id: int
+    subtema_id: Optional[int] = None
+    versiculo: str
+    created_at: datetime
 
 # ==================== SCHEMAS DE TOKEN ====================
 
@@ -186,3 +241,60 @@ class ProfileStatus(BaseSchema):
     is_profile_complete: bool
     user_id: int
     email: str
+
+# ==================== SCHEMAS DE ARQUIVOS ====================
+
+class Arquivo(BaseSchema):
+    id: int
+    nome: str
+    content_type: str
+    tamanho: int
+    sha256: str
+    created_at: datetime
+    url: str = Field(..., description="Caminho de download (pode ser usado nos links do esboço)")
+
+class ArquivoUso(BaseSchema):
+    usado: int
+    quota: int
+    disponivel: int
+
+# ==================== SCHEMAS DE SINCRONIZAÇÃO ====================
+
+class SincronizacaoResposta(BaseSchema):
+    """Alterações desde o último token (ou tudo, quando `full` é verdadeiro)"""
+    token: str = Field(..., description="Enviar como `since` na próxima sincronização")
+    full: bool = Field(..., description="Resposta completa: o cliente deve descartar os dados guardados")
+    temas: List[Tema]
+    subtemas: List[Subtema]
+    esbocos: List[CatalogoEsbocos]
+    versiculos: List[VersiculoTema]
+    removidos: Dict[str, List[int]] = Field(..., description="Ids deletados por entidade (aplicar antes dos registros)")
+
+# ==================== SCHEMAS DE LOTE ====================
+
+class OperacaoLote(BaseSchema):
+    """Uma operação do lote; `dados` segue o schema de criação/atualização da entidade"""
+    op: Literal["create", "update", "delete"]
+    entidade: Literal["tema", "subtema", "esboco", "versiculo"]
+    id: Optional[int] = Field(None, description="Obrigatório em update e delete")
+    dados: Dict[str, Any] = Field(
+        default_factory=dict,
+        description='tema_id/subtema_id aceitam "$N" para usar o id criado pela operação N do mesmo lote'
+    )
+
+    @model_validator(mode="after")
+    def validar_id(self):
+        if self.op != "create" and self.id is None:
+            raise ValueError("id é obrigatório em update e delete")
+        return self
+
+class LoteRequest(BaseSchema):
+    operacoes: List[OperacaoLote] = Field(..., min_length=1, max_length=200)
+
+class ResultadoOperacao(BaseSchema):
+    index: int
+    status: int
+    id: Optional[int] = None
+
+class LoteResposta(BaseSchema):
+    resultados: List[ResultadoOperacao]
@@ -1,15 +1,20 @@
+import json
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import DateTime
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.orm import make_transient_to_detached
+from cache import cache
 from config import settings
 from models import Usuario
 from schemas import TokenData
-from database import get_db
+from database import ReadSessionLocal, get_db
+from sharding import use_user_shard
 
 # Configuração de Hashing de Senha
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -54,12 +59,53 @@ def decode_access_token(token: str):
         )
     return token_data
 
+# Principal em cache: a linha do usuário (sem o hash da senha) por email, para não
+# consultar o banco em toda requisição autenticada
+_CAMPOS_PRINCIPAL = [coluna.key for coluna in Usuario.__table__.columns if coluna.key != "password"]
+_CAMPOS_DATA = {coluna.key for coluna in Usuario.__table__.columns if isinstance(coluna.type, DateTime)}
+
+def principal_cache_key(email: str) -> str:
+    return f"principal:{email}"
+
+async def guardar_principal(user: Usuario):
+    dados = {campo: getattr(user, campo) for campo in _CAMPOS_PRINCIPAL}
+    await cache.set(
+        principal_cache_key(user.email),
+        json.dumps(dados, default=datetime.isoformat),
+        ex=settings.PRINCIPAL_CACHE_SECONDS,
+    )
+
+async def descartar_principal(email: str):
+    """Remove o principal do cache (chamado depois de alterar o usuário)."""
+    await cache.delete(principal_cache_key(email))
+
+async def carregar_principal(db: AsyncSession, email: str) -> Optional[Usuario]:
+    """Retorna o usuário do email, do cache ou do banco, já ligado à sessão `db`."""
+    dados = await cache.get(principal_cache_key(email))
+    if dados is not None:
+        valores = json.loads(dados)
+        for campo in _CAMPOS_DATA:
+            if valores.get(campo):
+                valores[campo] = datetime.fromisoformat(valores[campo])
+        user = Usuario(**valores)
+        make_transient_to_detached(user)
+    else:
+        # Pelo pool de leitura do primário: a sessão `db` costuma ser a de escrita e, com a
+        # conexão presa até o fim da resposta, seguraria a única conexão de escrita do SQLite
+        async with ReadSessionLocal() as leitura:
+            result = await leitura.execute(select(Usuario).filter(Usuario.email == email))
+            user = result.scalars().first()
+        if user is None:
+            return None
+        await guardar_principal(user)
+    # Entra na sessão como se tivesse sido lido agora, sem SELECT: as rotas podem alterá-lo e commitar
+    return await db.merge(user, load=False)
+
 # Dependência para obter o usuário logado
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     token_data = decode_access_token(token)
     
-    result = await db.execute(select(Usuario).filter(Usuario.email == token_data.email))
-    user = result.scalars().first()
+    user = await carregar_principal(db, token_data.email)
     
     if user is None:
         raise HTTPException(
@@ -67,6 +113,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
             detail="Usuário não encontrado",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    # O conteúdo do restante da requisição vai para o shard deste usuário
+    use_user_shard(user.id)
     return user
 
 # Dependência para obter o usuário logado e verificar se o perfil está completo
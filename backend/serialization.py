@@ -0,0 +1,102 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+from fastapi import HTTPException, Response, status
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import select
+from typing_extensions import TypedDict
+
+class FastListSerializer:
+    """
+    Serializa listas grandes direto das tuplas do banco, sem instanciar o ORM
+    nem validar cada linha no schema de resposta.
+
+    O TypeAdapter é montado uma única vez a partir dos campos do schema, então o
+    JSON gerado (datas, nulos, nomes dos campos) é o mesmo que o FastAPI produziria
+    com o `response_model`, que continua declarado na rota para o OpenAPI.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        schema: Type[BaseModel],
+        fields: Optional[Iterable[str]] = None,
+        computed: Optional[Dict[str, Tuple[List[Any], Callable[..., Any]]]] = None,
+    ):
+        """
+        `computed` mapeia um campo do schema para (colunas, função): as colunas entram
+        no SELECT e a função monta o valor do campo a partir delas, linha a linha.
+        """
+        self.model = model
+        self.schema = schema
+        self.fields: List[str] = list(fields) if fields is not None else list(schema.model_fields)
+        self.computed = computed or {}
+        self._projections: Dict[tuple, "FastListSerializer"] = {}
+
+        # Posição de cada campo na tupla do banco: (nome, início, fim, função) ou (nome, índice, None, None)
+        self.columns = []
+        self._slots = []
+        for field in self.fields:
+            if field in self.computed:
+                columns, compute = self.computed[field]
+                self._slots.append((field, len(self.columns), len(self.columns) + len(columns), compute))
+                self.columns.extend(columns)
+            else:
+                self._slots.append((field, len(self.columns), None, None))
+                self.columns.append(getattr(model, field))
+        self._has_computed = any(compute for _, _, _, compute in self._slots)
+
+        row_type = TypedDict(
+            f"{schema.__name__}Row",
+            {name: schema.model_fields[name].annotation for name in self.fields},
+        )
+        self._adapter = TypeAdapter(List[row_type])
+
+    def project(self, fields: Optional[str]) -> "FastListSerializer":
+        """
+        Retorna um serializador só com os campos pedidos em `?fields=a,b,c`.
+
+        O `id` sempre vem junto. Campos desconhecidos geram 400. As projeções ficam
+        em memória, já que o conjunto de combinações usadas pelo frontend é pequeno.
+        """
+        if not fields:
+            return self
+
+        requested = [name.strip() for name in fields.split(",") if name.strip()]
+        invalid = [name for name in requested if name not in self.fields]
+        if invalid:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Campos inválidos: {', '.join(invalid)}. Disponíveis: {', '.join(self.fields)}",
+            )
+
+        # Mantém a ordem do schema para que a mesma projeção reaproveite o cache
+        key = tuple(name for name in self.fields if name == "id" or name in requested)
+        projection = self._projections.get(key)
+        if projection is None:
+            projection = FastListSerializer(self.model, self.schema, key, self.computed)
+            self._projections[key] = projection
+        return projection
+
+    def select(self):
+        """Retorna um SELECT apenas com as colunas expostas pelo schema."""
+        return select(*self.columns)
+
+    def to_dicts(self, rows: Sequence[Sequence[Any]]) -> List[Dict[str, Any]]:
+        if not self._has_computed:
+            fields = self.fields
+            return [dict(zip(fields, row)) for row in rows]
+
+        slots = self._slots
+        return [
+            {
+                name: row[start] if compute is None else compute(*row[start:stop])
+                for name, start, stop, compute in slots
+            }
+            for row in rows
+        ]
+
+    def dump(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        """Gera o JSON da lista a partir das tuplas (na ordem de `self.columns`)."""
+        return self._adapter.dump_json(self.to_dicts(rows))
+
+    def response(self, rows: Sequence[Sequence[Any]]) -> Response:
+        return Response(content=self.dump(rows), media_type="application/json")
@@ -0,0 +1,295 @@
+"""
+Sharding do conteúdo por usuário.
+
+Com `SHARD_URLS` definido, os temas, subtemas, esboços, versículos (e o que é do mesmo
+usuário: resumo de atividade, arquivos e remoções) ficam em um de N bancos, escolhido
+por um hash estável do `usuario_id`. A tabela `usuario` continua só no banco principal
+(`DATABASE_URL`).
+
+    SHARD_URLS="s0=postgresql+asyncpg://.../conteudo0,s1=postgresql+asyncpg://.../conteudo1"
+
+O nome antes do `=` é opcional (padrão `shard0`, `shard1`, ...) mas é ele que entra no
+hash: trocar a URL de um shard não move ninguém. A escolha é por rendezvous hashing, então
+acrescentar um shard move só a fração de usuários que passa a pertencer a ele.
+
+As rotas continuam recebendo uma única sessão de `get_db`/`get_read_db`: a sessão decide
+o banco de cada consulta pela tabela (`usuario` no principal, o resto no shard) e o shard
+vem do usuário autenticado, definido em `get_current_user`. Fora de requisição (CLIs,
+aquecimento do cache) use `user_shard(usuario_id)` ou `pinned_shard(nome)`.
+
+Depois de mudar `SHARD_URLS`, com os workers parados, rode o rebalanceamento (move os
+usuários que mudaram de shard; na primeira vez, esvazia o conteúdo do banco principal):
+
+    python sharding.py rebalancear --simular
+    python sharding.py rebalancear
+"""
+import argparse
+import asyncio
+import contextvars
+import hashlib
+import os
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from sqlalchemy import MetaData, delete, insert, select, union
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.util import find_tables
+
+# Tabelas que ficam só no banco principal
+GLOBAL_TABLES = {"usuario"}
+COPY_CHUNK_SIZE = 500
+
+current_shard: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_shard", default=None)
+
+
+class ShardMap:
+    """Nomes e URLs dos shards e a escolha do shard de cada usuário."""
+
+    def __init__(self, urls: Dict[str, str]):
+        self.urls = urls
+
+    @classmethod
+    def parse(cls, spec: str) -> "ShardMap":
+        urls = {}
+        for index, item in enumerate(part.strip() for part in spec.split(",")):
+            if not item:
+                continue
+            name, sep, url = item.partition("=")
+            # "nome=url"; sem nome (ou com "=" só na query string da URL) usa o índice
+            if not sep or ":" in name:
+                name, url = f"shard{index}", item
+            urls[name.strip()] = url.strip()
+        return cls(urls)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.urls)
+
+    def shard_for(self, usuario_id: int) -> str:
+        """Shard do usuário: o de maior peso no rendezvous hashing."""
+        return max(
+            self.urls,
+            key=lambda name: hashlib.blake2b(f"{name}:{usuario_id}".encode(), digest_size=8).digest(),
+        )
+
+
+shard_map = ShardMap.parse(os.getenv("SHARD_URLS", ""))
+
+
+def use_user_shard(usuario_id: int):
+    """Direciona o conteúdo do restante da requisição (ou task) para o shard do usuário."""
+    if shard_map.enabled:
+        current_shard.set(shard_map.shard_for(usuario_id))
+
+
+@contextmanager
+def pinned_shard(name: Optional[str]):
+    """Direciona o conteúdo para o shard `name` dentro do bloco (None: sem sharding)."""
+    token = current_shard.set(name)
+    try:
+        yield
+    finally:
+        current_shard.reset(token)
+
+
+def user_shard(usuario_id: int):
+    return pinned_shard(shard_map.shard_for(usuario_id) if shard_map.enabled else None)
+
+
+def shard_names() -> List[Optional[str]]:
+    """Shards a percorrer em tarefas de manutenção ([None] sem sharding: só o principal)."""
+    return list(shard_map.urls) if shard_map.enabled else [None]
+
+
+def _is_sharded(mapper, clause) -> bool:
+    if mapper is not None:
+        return mapper.local_table.name not in GLOBAL_TABLES
+    if clause is None:
+        return False
+    return any(table.name not in GLOBAL_TABLES for table in find_tables(clause, include_crud=True))
+
+
+class ShardRoutingSession(Session):
+    """Sessão que manda as tabelas de conteúdo para o engine do shard atual."""
+
+    def __init__(self, *args, shards: Optional[Dict] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shards = shards
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.shards and _is_sharded(mapper, clause):
+            name = current_shard.get()
+            if name is None:
+                # Melhor falhar do que ler/gravar o conteúdo no banco errado
+                raise RuntimeError("Consulta ao conteúdo sem shard definido (use user_shard/pinned_shard)")
+            return self.shards[name].sync_engine
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+def shard_metadata(metadata: MetaData) -> MetaData:
+    """Cópia das tabelas de conteúdo para criar nos shards, sem as FKs para `usuario`."""
+    copy = MetaData(schema=metadata.schema)
+    for table in metadata.sorted_tables:
+        if table.name in GLOBAL_TABLES:
+            continue
+        shard_table = table.to_metadata(copy)
+        for constraint in list(shard_table.foreign_key_constraints):
+            if constraint.elements[0].target_fullname.split(".")[-2] in GLOBAL_TABLES:
+                shard_table.constraints.discard(constraint)
+                for foreign_key in constraint.elements:
+                    shard_table.foreign_keys.discard(foreign_key)
+                    foreign_key.parent.foreign_keys.discard(foreign_key)
+    return copy
+
+
+# --- Rebalanceamento ---
+
+# Entidades sincronizadas pelo /sync (ver remocoes.py): ids trocados viram remoção + registro novo
+SYNC_ENTITIES = {"tema": "tema", "subtema": "subtema", "catalogo_esbocos": "esboco", "versiculo_tema": "versiculo"}
+
+
+def _user_filters(models, usuario_id: int):
+    """(tabela, filtro) das linhas do usuário, na ordem de inserção (pais antes dos filhos)."""
+    temas = select(models.Tema.id).where(models.Tema.usuario_id == usuario_id)
+    filters = [
+        (models.Tema.__table__, models.Tema.usuario_id == usuario_id),
+        (models.Subtema.__table__, models.Subtema.tema_id.in_(temas)),
+    ]
+    for model in (models.CatalogoEsbocos, models.VersiculoTema, models.AtividadeResumo, models.Arquivo, models.Remocao):
+        filters.append((model.__table__, model.usuario_id == usuario_id))
+    return filters
+
+
+async def _delete_user(conn, models, usuario_id: int):
+    for table, condition in reversed(_user_filters(models, usuario_id)):
+        await conn.execute(delete(table).where(condition))
+
+
+async def _users_in(conn, models) -> List[int]:
+    query = union(*(
+        select(model.usuario_id).where(model.usuario_id.isnot(None))
+        for model in (models.Tema, models.CatalogoEsbocos, models.VersiculoTema, models.AtividadeResumo, models.Arquivo, models.Remocao)
+    ))
+    return sorted(row[0] for row in await conn.execute(query))
+
+
+async def _taken_ids(conn, table, ids: List[int]) -> bool:
+    for start in range(0, len(ids), COPY_CHUNK_SIZE):
+        chunk = ids[start:start + COPY_CHUNK_SIZE]
+        if (await conn.execute(select(table.c.id).where(table.c.id.in_(chunk)).limit(1))).first():
+            return True
+    return False
+
+
+async def move_user(source_engine, target_engine, models, usuario_id: int) -> int:
+    """
+    Copia as linhas do usuário para o shard de destino e só então apaga da origem; se
+    parar no meio, rodar de novo refaz a cópia. Os ids são mantidos quando estão livres
+    no destino; quando não, a tabela do usuário ganha ids novos (com as referências
+    ajustadas) e os antigos viram remoções, para o /sync dos clientes se atualizar.
+    """
+    async with source_engine.connect() as source:
+        rows = {
+            table.name: [dict(row) for row in (await source.execute(select(table).where(condition))).mappings()]
+            for table, condition in _user_filters(models, usuario_id)
+        }
+
+    now = models.utc_now()
+    remap: Dict[str, Dict[int, int]] = {}
+    tombstones = []
+    async with target_engine.begin() as target:
+        # Sobras de uma execução interrompida
+        await _delete_user(target, models, usuario_id)
+        for table, _ in _user_filters(models, usuario_id):
+            table_rows = rows[table.name]
+            if not table_rows:
+                continue
+            for row in table_rows:
+                for column, parent in (("tema_id", "tema"), ("subtema_id", "subtema")):
+                    if row.get(column) in remap.get(parent, {}):
+                        row[column] = remap[parent][row[column]]
+
+            if "id" not in table.c or not await _taken_ids(target, table, [row["id"] for row in table_rows]):
+                await target.execute(insert(table), table_rows)
+                continue
+
+            old_ids = [row.pop("id") for row in table_rows]
+            if table.name in SYNC_ENTITIES:
+                for row in table_rows:
+                    row["updated_at"] = now
+                tombstones.extend(
+                    {"usuario_id": usuario_id, "entidade": SYNC_ENTITIES[table.name], "registro_id": old_id, "removido_em": now}
+                    for old_id in old_ids
+                )
+            result = await target.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), table_rows)
+            remap[table.name] = dict(zip(old_ids, result.scalars().all()))
+
+        if tombstones:
+            await target.execute(insert(models.Remocao.__table__), tombstones)
+
+    async with source_engine.begin() as source:
+        await _delete_user(source, models, usuario_id)
+    return sum(len(table_rows) for table_rows in rows.values())
+
+
+async def _descartar_derivados(engine, models, usuario_id: int):
+    """Descarta o que foi montado das linhas do usuário (a cópia pode ter trocado os ids)."""
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from autocomplete import autocomplete
+    from dashboard import invalidar_dashboard
+    from esbocos import esbocos_cache_key, fonte_impressao
+    from impressao import impressora
+    from relacionados import indice_relacionados
+    from temas import temas_cache_key
+
+    await invalidar_dashboard(usuario_id, temas_cache_key(usuario_id), esbocos_cache_key(usuario_id))
+    await autocomplete.descartar(usuario_id)
+    await asyncio.to_thread(indice_relacionados.descartar, usuario_id)
+    async with AsyncSession(engine) as db:
+        esbocos = await db.execute(select(models.CatalogoEsbocos.id).where(models.CatalogoEsbocos.usuario_id == usuario_id))
+        for esboco_id in esbocos.scalars().all():
+            fonte = await fonte_impressao(db, usuario_id, esboco_id)
+            if fonte is not None:
+                impressora.descartar(fonte)
+
+
+async def _rebalancear_cli(origens: List[str], simular: bool) -> int:
+    import models
+    from database import SQLALCHEMY_DATABASE_URL, create_engine_for, dispose_engines, init_db
+
+    if not shard_map.enabled:
+        raise SystemExit("SHARD_URLS não está definido")
+
+    urls = list(dict.fromkeys([*shard_map.urls.values(), SQLALCHEMY_DATABASE_URL, *origens]))
+    engines = {url: create_engine_for(url) for url in urls}
+    movidos = 0
+    try:
+        await init_db()
+        for url in urls:
+            async with engines[url].connect() as conn:
+                usuarios = await _users_in(conn, models)
+            for usuario_id in usuarios:
+                destino = shard_map.shard_for(usuario_id)
+                if shard_map.urls[destino] == url:
+                    continue
+                if not simular:
+                    linhas = await move_user(engines[url], engines[shard_map.urls[destino]], models, usuario_id)
+                    await _descartar_derivados(engines[shard_map.urls[destino]], models, usuario_id)
+                    print(f"usuário {usuario_id}: {linhas} linhas movidas para o shard {destino}")
+                movidos += 1
+    finally:
+        for engine in engines.values():
+            await engine.dispose()
+        await dispose_engines()
+    return movidos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenção dos shards de conteúdo")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    cmd = sub.add_parser("rebalancear", help="Move cada usuário para o shard definido por SHARD_URLS")
+    cmd.add_argument("--origem", action="append", default=[], help="Banco antigo a esvaziar (além dos shards e do principal)")
+    cmd.add_argument("--simular", action="store_true", help="Só conta quantos usuários seriam movidos")
+    args = parser.parse_args()
+
+    movidos = asyncio.run(_rebalancear_cli(args.origem, args.simular))
+    print(f"{movidos} usuários {'seriam movidos' if args.simular else 'movidos'}")
@@ -0,0 +1,148 @@
+"""
+Sincronização incremental: `GET /sync?since=<token>`.
+
+Devolve os temas, subtemas, esboços e versículos criados/alterados desde o token
+(range scan nos índices `(usuario_id, updated_at)`) e os ids deletados desde então
+(tabela `remocao`, preenchida pelas rotas de deleção), junto com um token novo.
+Sem token, ou com um token mais antigo que a retenção das remoções, a resposta é
+completa (`full: true`) e o cliente deve substituir o que tem guardado.
+
+O cliente aplica primeiro `removidos` e depois os registros: o SQLite pode reutilizar
+o id do último registro deletado.
+
+O token novo fica `SYNC_COMMIT_MARGIN_SECONDS` antes do momento da consulta, para
+que escritas que ainda estavam sendo commitadas voltem na próxima sincronização
+(registros repetidos são só sobrescritos no cliente). Remoções antigas são apagadas com:
+
+    python sincronizacao.py limpar
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from config import settings
+from database import get_db
+from models import CatalogoEsbocos, Remocao, Subtema, Tema, Usuario, VersiculoTema, utc_now
+from schemas import Subtema as SubtemaSchema, SincronizacaoResposta
+from security import get_current_complete_user
+from serialization import FastListSerializer
+from esbocos import esboco_list_serializer
+from remocoes import limpar_remocoes
+from temas import tema_list_serializer
+from versiculos import versiculo_list_serializer
+
+TOKEN_VERSAO = "v1"
+
+# Chave de cada entidade em `removidos` (e nome usado na coluna remocao.entidade)
+ENTIDADES = {"tema": "temas", "subtema": "subtemas", "esboco": "esbocos", "versiculo": "versiculos"}
+
+subtema_sync_serializer = FastListSerializer(Subtema, SubtemaSchema)
+
+
+def gerar_token(momento: datetime) -> str:
+    return base64.urlsafe_b64encode(f"{TOKEN_VERSAO}:{momento.isoformat()}".encode()).decode().rstrip("=")
+
+
+def ler_token(token: str) -> datetime:
+    try:
+        conteudo = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        versao, _, momento = conteudo.partition(":")
+        if versao != TOKEN_VERSAO:
+            raise ValueError(versao)
+        momento = datetime.fromisoformat(momento)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Token de sincronização inválido")
+    return momento if momento.tzinfo else momento.replace(tzinfo=timezone.utc)
+
+
+# --- Rotas ---
+
+router = APIRouter(
+    prefix="/sync",
+    tags=["sync"],
+    dependencies=[Depends(get_current_complete_user)]
+)
+
+# Lê sempre do primário: numa réplica atrasada o token novo pularia alterações ainda não replicadas
+@router.get("", response_model=SincronizacaoResposta)
+async def sincronizar(
+    since: Optional[str] = Query(None, description="Token devolvido pela sincronização anterior"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Usuario = Depends(get_current_complete_user)
+):
+    """Retorna o que mudou desde o token (ou tudo, na primeira sincronização) e o próximo token."""
+    agora = utc_now()
+    desde = ler_token(since) if since else None
+    completo = desde is None or desde < agora - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+    usuario_id = current_user.id
+
+    consultas = {
+        "temas": (tema_list_serializer, tema_list_serializer.select().filter(Tema.usuario_id == usuario_id), Tema),
+        "subtemas": (
+            subtema_sync_serializer,
+            subtema_sync_serializer.select().join(Tema, Subtema.tema_id == Tema.id).filter(Tema.usuario_id == usuario_id),
+            Subtema,
+        ),
+        "esbocos": (esboco_list_serializer, esboco_list_serializer.select().filter(CatalogoEsbocos.usuario_id == usuario_id), CatalogoEsbocos),
+        "versiculos": (versiculo_list_serializer, versiculo_list_serializer.select().filter(VersiculoTema.usuario_id == usuario_id), VersiculoTema),
+    }
+
+    partes = []
+    for nome, (serializer, stmt, modelo) in consultas.items():
+        if not completo:
+            stmt = stmt.filter(modelo.updated_at >= desde)
+        result = await db.execute(stmt.order_by(modelo.id))
+        partes.append(b'"' + nome.encode() + b'":' + serializer.dump(result.all()))
+
+    removidos = {chave: [] for chave in ENTIDADES.values()}
+    if not completo:
+        result = await db.execute(
+            select(Remocao.entidade, Remocao.registro_id).filter(
+                Remocao.usuario_id == usuario_id,
+                Remocao.removido_em >= desde,
+            )
+        )
+        for entidade, registro_id in result.all():
+            if entidade in ENTIDADES:
+                removidos[ENTIDADES[entidade]].append(registro_id)
+
+    cabecalho = {"token": gerar_token(agora - timedelta(seconds=settings.SYNC_COMMIT_MARGIN_SECONDS)), "full": completo}
+    # Monta o JSON direto com os bytes dos serializadores (listas grandes na sincronização completa)
+    corpo = (
+        json.dumps(cabecalho)[:-1].encode() + b","
+        + b",".join(partes)
+        + b',"removidos":' + json.dumps(removidos).encode()
+        + b"}"
+    )
+    return Response(content=corpo, media_type="application/json")
+
+
+async def _limpar_cli() -> int:
+    from database import AsyncSessionLocal, dispose_engines, init_db
+    from sharding import pinned_shard, shard_names
+
+    await init_db()
+    apagadas = 0
+    try:
+        for shard in shard_names():
+            with pinned_shard(shard):
+                async with AsyncSessionLocal() as db:
+                    apagadas += await limpar_remocoes(db)
+        return apagadas
+    finally:
+        await dispose_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenção da sincronização incremental")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("limpar", help="Apaga remoções mais antigas que SYNC_TOMBSTONE_DAYS")
+    args = parser.parse_args()
+
+    print(f"{asyncio.run(_limpar_cli())} remoções antigas apagadas")
@@ -1,12 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import delete, update
-from typing import List
-from database import get_db
-from models import Tema, Subtema, Usuario
+from sqlalchemy import and_, case, delete, func, update
+from sqlalchemy.orm import aliased
+from typing import Callable, Dict, List
+from database import ReadSessionLocal, get_db, get_read_db
+from models import CatalogoEsbocos, Tema, Subtema, Usuario, VersiculoTema
 from schemas import Tema as TemaSchema, TemaCreate, TemaUpdate, Subtema as SubtemaSchema, SubtemaCreate, SubtemaUpdate
+from schemas import MesclagemRequest, MoverSubtemaRequest, ReorganizacaoResposta
 from security import get_current_complete_user
+from dashboard import invalidar_dashboard
+from esbocos import esbocos_cache_key
+from compression import cached_json_response
+from serialization import FastListSerializer
+from autocomplete import autocomplete
+from remocoes import registrar_remocoes
+from eventos import canal_eventos
+from publico import catalogo_publico, renderizar_catalogo
 
 router = APIRouter(
     prefix="/temas",
@@ -14,6 +24,24 @@ router = APIRouter(
     dependencies=[Depends(get_current_complete_user)] # Protege todas as rotas com autenticação e perfil completo
 )
 
+# Listagem de temas em cache (as rotas de escrita de temas invalidam a chave)
+TEMAS_CACHE_SECONDS = 300
+tema_list_serializer = FastListSerializer(Tema, TemaSchema)
+
+def temas_cache_key(user_id: int) -> str:
+    return f"temas_lista:{user_id}"
+
+async def listar_temas_json(db: AsyncSession, user_id: int) -> bytes:
+    result = await db.execute(
+        tema_list_serializer.select().filter(Tema.usuario_id == user_id).order_by(Tema.descricao)
+    )
+    return tema_list_serializer.dump(result.all())
+
+async def listar_temas_json_primario(user_id: int) -> bytes:
+    # O cache é preenchido pelo primário: uma réplica atrasada ficaria presa nele até o TTL
+    async with ReadSessionLocal() as primario:
+        return await listar_temas_json(primario, user_id)
+
 # --- Rotas para Temas ---
 
 @router.post("/", response_model=TemaSchema, status_code=status.HTTP_201_CREATED)
@@ -25,17 +53,19 @@ async def create_tema(tema: TemaCreate, db: AsyncSession = Depends(get_db), curr
     )
     db.add(new_tema)
     await db.commit()
+    await invalidar_dashboard(current_user.id, temas_cache_key(current_user.id))
     await db.refresh(new_tema)
+    await autocomplete.registrar_tema(current_user.id, new_tema)
+    await canal_eventos.publicar(current_user.id, "tema", "criado", new_tema.id, TemaSchema.model_validate(new_tema))
     return new_tema
 
 @router.get("/", response_model=List[TemaSchema])
-async def read_temas(db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
+async def read_temas(request: Request, current_user: Usuario = Depends(get_current_complete_user)):
     """Lista todos os temas do usuário logado."""
-    result = await db.execute(
-        select(Tema).filter(Tema.usuario_id == current_user.id).order_by(Tema.descricao)
+    user_id = current_user.id
+    return await cached_json_response(
+        request, temas_cache_key(user_id), lambda: listar_temas_json_primario(user_id), ex=TEMAS_CACHE_SECONDS
     )
-    temas = result.scalars().all()
-    return temas
 
 @router.put("/{tema_id}", response_model=TemaSchema)
 async def update_tema(tema_id: int, tema: TemaUpdate, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
@@ -49,10 +79,16 @@ async def update_tema(tema_id: int, tema: TemaUpdate, db: AsyncSession = Depends
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tema não encontrado ou não pertence ao usuário")
     
     await db.commit()
+    await invalidar_dashboard(current_user.id, temas_cache_key(current_user.id))
     
     # Busca o tema atualizado para retornar
     result = await db.execute(select(Tema).filter(Tema.id == tema_id))
     updated_tema = result.scalars().first()
+    await autocomplete.registrar_tema(current_user.id, updated_tema)
+    # O catálogo público mostra a descrição do tema
+    if catalogo_publico.tem_catalogo(current_user.id):
+        await renderizar_catalogo(current_user.id, db)
+    await canal_eventos.publicar(current_user.id, "tema", "atualizado", tema_id, TemaSchema.model_validate(updated_tema))
     return updated_tema
 
 @router.delete("/{tema_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -63,8 +99,8 @@ async def delete_tema(tema_id: int, db: AsyncSession = Depends(get_db), current_
     # No nosso modelo, o FK não tem ON DELETE CASCADE, então vamos deletar os subtemas primeiro.
     
     # 1. Deletar Subtemas relacionados
-    subtema_stmt = delete(Subtema).where(Subtema.tema_id == tema_id)
-    await db.execute(subtema_stmt)
+    subtema_stmt = delete(Subtema).where(Subtema.tema_id == tema_id).returning(Subtema.id)
+    subtemas_removidos = (await db.execute(subtema_stmt)).scalars().all()
     
     # 2. Deletar o Tema
     tema_stmt = delete(Tema).where(Tema.id == tema_id, Tema.usuario_id == current_user.id)
@@ -73,7 +109,14 @@ async def delete_tema(tema_id: int, db: AsyncSession = Depends(get_db), current_
     if result.rowcount == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tema não encontrado ou não pertence ao usuário")
     
+    await registrar_remocoes(db, current_user.id, "tema", [tema_id])
+    await registrar_remocoes(db, current_user.id, "subtema", subtemas_removidos)
     await db.commit()
+    await invalidar_dashboard(current_user.id, temas_cache_key(current_user.id))
+    await autocomplete.remover_tema(current_user.id, tema_id)
+    await canal_eventos.publicar(current_user.id, "tema", "removido", tema_id)
+    for subtema_id in subtemas_removidos:
+        await canal_eventos.publicar(current_user.id, "subtema", "removido", subtema_id)
     return {"message": "Tema e subtemas relacionados deletados com sucesso"}
 
 # --- Rotas para Subtemas ---
@@ -93,11 +136,14 @@ async def create_subtema(subtema: SubtemaCreate, tema_id: int, db: AsyncSession
     )
     db.add(new_subtema)
     await db.commit()
+    await invalidar_dashboard(current_user.id)
     await db.refresh(new_subtema)
+    await autocomplete.registrar_subtema(current_user.id, new_subtema)
+    await canal_eventos.publicar(current_user.id, "subtema", "criado", new_subtema.id, SubtemaSchema.model_validate(new_subtema))
     return new_subtema
 
 @router.get("/{tema_id}/subtemas", response_model=List[SubtemaSchema])
-async def read_subtemas_by_tema(tema_id: int, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
+async def read_subtemas_by_tema(tema_id: int, db: AsyncSession = Depends(get_read_db), current_user: Usuario = Depends(get_current_complete_user)):
     """Lista todos os subtemas de um tema específico do usuário logado."""
     # Verifica se o tema existe e pertence ao usuário
     result = await db.execute(select(Tema).filter(Tema.id == tema_id, Tema.usuario_id == current_user.id))
@@ -121,18 +167,28 @@ async def update_subtema(subtema_id: int, subtema: SubtemaUpdate, db: AsyncSessi
     existing_subtema = result.scalars().first()
     if not existing_subtema:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Subtema não encontrado ou não pertence ao usuário")
-        
-    stmt = update(Subtema).where(Subtema.id == subtema_id).values(
-        descricao=subtema.descricao,
-        tema_id=subtema.tema_id, # Permite mudar o tema pai
-        ativo=subtema.ativo
-    )
-    await db.execute(stmt)
+
+    valores = subtema.model_dump(exclude_unset=True)
+    novo_tema_id = valores.pop("tema_id", None)
+    movido = novo_tema_id is not None and novo_tema_id != existing_subtema.tema_id
+    if movido:
+        # Permite mudar o tema pai; os esboços e versículos do subtema vão junto
+        await tema_do_usuario(db, novo_tema_id, current_user.id)
+        await mover_subtema_e_conteudo(db, current_user.id, subtema_id, novo_tema_id)
+    if valores:
+        await db.execute(update(Subtema).where(Subtema.id == subtema_id).values(**valores))
     await db.commit()
+    await invalidar_dashboard(current_user.id, *([esbocos_cache_key(current_user.id)] if movido else []))
     
     # Busca o subtema atualizado para retornar
     result = await db.execute(select(Subtema).filter(Subtema.id == subtema_id))
     updated_subtema = result.scalars().first()
+    await autocomplete.registrar_subtema(current_user.id, updated_subtema)
+    if catalogo_publico.tem_catalogo(current_user.id):
+        await renderizar_catalogo(current_user.id, db)
+    await canal_eventos.publicar(current_user.id, "subtema", "atualizado", subtema_id, SubtemaSchema.model_validate(updated_subtema))
+    if movido:
+        await canal_eventos.publicar(current_user.id, "tema", "sincronizar")
     return updated_subtema
 
 @router.delete("/subtemas/{subtema_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -148,5 +204,128 @@ async def delete_subtema(subtema_id: int, db: AsyncSession = Depends(get_db), cu
         
     stmt = delete(Subtema).where(Subtema.id == subtema_id)
     await db.execute(stmt)
+    await registrar_remocoes(db, current_user.id, "subtema", [subtema_id])
     await db.commit()
+    await invalidar_dashboard(current_user.id)
+    await autocomplete.remover_subtema(current_user.id, subtema_id)
+    await canal_eventos.publicar(current_user.id, "subtema", "removido", subtema_id)
     return {"message": "Subtema deletado com sucesso"}
+
+# --- Mesclar e mover ---
+# Poucos UPDATEs por conjunto (não um por esboço/versículo) numa única transação; cache,
+# autocomplete, catálogo público e streams de /eventos são atualizados uma vez, no fim.
+
+CONTEUDO = {"esbocos": CatalogoEsbocos, "versiculos": VersiculoTema}
+
+async def tema_do_usuario(db: AsyncSession, tema_id: int, user_id: int) -> Tema:
+    result = await db.execute(select(Tema).filter(Tema.id == tema_id, Tema.usuario_id == user_id))
+    tema = result.scalars().first()
+    if not tema:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tema não encontrado ou não pertence ao usuário")
+    return tema
+
+async def subtema_do_usuario(db: AsyncSession, subtema_id: int, user_id: int) -> Subtema:
+    result = await db.execute(
+        select(Subtema).join(Tema).filter(Subtema.id == subtema_id, Tema.usuario_id == user_id)
+    )
+    subtema = result.scalars().first()
+    if not subtema:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Subtema não encontrado ou não pertence ao usuário")
+    return subtema
+
+async def repontar_conteudo(db: AsyncSession, user_id: int, onde: Callable, valores: Callable) -> Dict[str, int]:
+    """Um UPDATE por tabela nos esboços e versículos do usuário que atendem a `onde(modelo)`."""
+    contagens = {}
+    for nome, modelo in CONTEUDO.items():
+        result = await db.execute(update(modelo).where(modelo.usuario_id == user_id, onde(modelo)).values(**valores(modelo)))
+        contagens[nome] = result.rowcount
+    return contagens
+
+async def mover_subtema_e_conteudo(db: AsyncSession, user_id: int, subtema_id: int, tema_id: int) -> Dict[str, int]:
+    """Leva o subtema, com seus esboços e versículos, para `tema_id` (sem commit)."""
+    contagens = await repontar_conteudo(db, user_id, lambda modelo: modelo.subtema_id == subtema_id, lambda modelo: {"tema_id": tema_id})
+    await db.execute(update(Subtema).where(Subtema.id == subtema_id).values(tema_id=tema_id))
+    return contagens
+
+async def depois_de_reorganizar(db: AsyncSession, user_id: int):
+    await invalidar_dashboard(user_id, temas_cache_key(user_id), esbocos_cache_key(user_id))
+    await autocomplete.descartar(user_id)
+    if catalogo_publico.tem_catalogo(user_id):
+        await renderizar_catalogo(user_id, db)
+    # Muitos registros de uma vez: os clientes buscam as mudanças pelo /sync
+    await canal_eventos.publicar(user_id, "tema", "sincronizar")
+
+@router.post("/{tema_id}/mesclar", response_model=ReorganizacaoResposta)
+async def mesclar_tema(tema_id: int, pedido: MesclagemRequest, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
+    """
+    Junta o tema ao tema `destino_id`: subtemas, esboços e versículos passam para o destino
+    (subtemas com a mesma descrição de um subtema do destino viram um só) e o tema é removido.
+    """
+    user_id = current_user.id
+    if pedido.destino_id == tema_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="O tema de destino deve ser diferente do tema mesclado")
+    await tema_do_usuario(db, tema_id, user_id)
+    destino_id = (await tema_do_usuario(db, pedido.destino_id, user_id)).id
+
+    # Subtemas duplicados (mesma descrição, sem diferenciar maiúsculas): origem -> destino
+    origem, destino = aliased(Subtema), aliased(Subtema)
+    result = await db.execute(
+        select(origem.id, func.min(destino.id))
+        .join(destino, and_(destino.tema_id == destino_id, func.lower(destino.descricao) == func.lower(origem.descricao)))
+        .filter(origem.tema_id == tema_id)
+        .group_by(origem.id)
+    )
+    equivalentes = dict(result.all())
+
+    def valores(modelo):
+        novos = {"tema_id": destino_id}
+        if equivalentes:
+            novos["subtema_id"] = case(equivalentes, value=modelo.subtema_id, else_=modelo.subtema_id)
+        return novos
+
+    contagens = await repontar_conteudo(db, user_id, lambda modelo: modelo.tema_id == tema_id, valores)
+    if equivalentes:
+        await db.execute(delete(Subtema).where(Subtema.id.in_(equivalentes)))
+    movidos = await db.execute(update(Subtema).where(Subtema.tema_id == tema_id).values(tema_id=destino_id))
+    await db.execute(delete(Tema).where(Tema.id == tema_id))
+    await registrar_remocoes(db, user_id, "tema", [tema_id])
+    await registrar_remocoes(db, user_id, "subtema", list(equivalentes))
+    await db.commit()
+
+    await depois_de_reorganizar(db, user_id)
+    return {"tema_id": destino_id, "subtemas_movidos": movidos.rowcount, "subtemas_mesclados": len(equivalentes), **contagens}
+
+@router.post("/subtemas/{subtema_id}/mover", response_model=ReorganizacaoResposta)
+async def mover_subtema(subtema_id: int, pedido: MoverSubtemaRequest, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
+    """Leva o subtema, com todos os seus esboços e versículos, para outro tema."""
+    user_id = current_user.id
+    subtema = await subtema_do_usuario(db, subtema_id, user_id)
+    await tema_do_usuario(db, pedido.tema_id, user_id)
+    if subtema.tema_id == pedido.tema_id:
+        return {"tema_id": pedido.tema_id, "subtemas_movidos": 0, "subtemas_mesclados": 0, "esbocos": 0, "versiculos": 0}
+
+    contagens = await mover_subtema_e_conteudo(db, user_id, subtema_id, pedido.tema_id)
+    await db.commit()
+
+    await depois_de_reorganizar(db, user_id)
+    return {"tema_id": pedido.tema_id, "subtemas_movidos": 1, "subtemas_mesclados": 0, **contagens}
+
+@router.post("/subtemas/{subtema_id}/mesclar", response_model=ReorganizacaoResposta)
+async def mesclar_subtema(subtema_id: int, pedido: MesclagemRequest, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
+    """Junta o subtema ao subtema `destino_id` (de qualquer tema do usuário) e o remove."""
+    user_id = current_user.id
+    if pedido.destino_id == subtema_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="O subtema de destino deve ser diferente do subtema mesclado")
+    await subtema_do_usuario(db, subtema_id, user_id)
+    destino = await subtema_do_usuario(db, pedido.destino_id, user_id)
+    destino_id, destino_tema_id = destino.id, destino.tema_id
+
+    contagens = await repontar_conteudo(
+        db, user_id, lambda modelo: modelo.subtema_id == subtema_id, lambda modelo: {"tema_id": destino_tema_id, "subtema_id": destino_id}
+    )
+    await db.execute(delete(Subtema).where(Subtema.id == subtema_id))
+    await registrar_remocoes(db, user_id, "subtema", [subtema_id])
+    await db.commit()
+
+    await depois_de_reorganizar(db, user_id)
+    return {"tema_id": destino_tema_id, "subtemas_movidos": 0, "subtemas_mesclados": 1, **contagens}
@@ -3,7 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
 from models import Usuario
 from schemas import UsuarioInDB, UsuarioUpdate
-from security import get_current_active_user, get_current_complete_user
+from security import descartar_principal, get_current_active_user, get_current_complete_user
 
 router = APIRouter(
     prefix="/users",
@@ -43,6 +43,7 @@ async def complete_profile(
 
     try:
         await db.commit()
+        await descartar_principal(current_user.email)
         await db.refresh(current_user)
     except Exception as e:
         await db.rollback()
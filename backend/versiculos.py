@@ -1,12 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import delete, update
-from typing import List
-from database import get_db
+from typing import List, Optional
+from database import get_db, get_read_db
 from models import VersiculoTema, Tema, Subtema, Usuario
-from schemas import VersiculoTema as VersiculoSchema, VersiculoTemaCreate, VersiculoTemaUpdate
+from schemas import VersiculoTema as VersiculoSchema, VersiculoTemaCreate, VersiculoTemaUpdate, VersiculoTemaResumo
 from security import get_current_complete_user
+from dashboard import invalidar_dashboard
+from atividade import registrar_atividade
+from remocoes import registrar_remocoes
+from eventos import canal_eventos
+from config import settings
+from serialization import FastListSerializer
+from biblia import texto_canonico, vincular_versiculo
+from autocomplete import autocomplete
 
 router = APIRouter(
     prefix="/versiculos",
@@ -14,6 +22,15 @@ router = APIRouter(
     dependencies=[Depends(get_current_complete_user)] # Protege todas as rotas com autenticação e perfil completo
 )
 
+# Serializador da listagem (montado uma vez, reaproveitado em todas as requisições)
+# O texto sai do acervo bíblico quando o usuário não gravou um texto próprio
+texto_versiculo = (
+    [VersiculoTema.descricao_versiculo, VersiculoTema.referencia_canonica, VersiculoTema.traducao],
+    lambda texto, referencia, traducao: texto if texto is not None else (texto_canonico(referencia, traducao) or ""),
+)
+versiculo_list_serializer = FastListSerializer(VersiculoTema, VersiculoSchema, computed={"descricao_versiculo": texto_versiculo})
+versiculo_summary_serializer = FastListSerializer(VersiculoTema, VersiculoTemaResumo)
+
 async def check_tema_subtema_ownership(db: AsyncSession, tema_id: int, subtema_id: int | None, user_id: int):
     """Verifica se o tema e subtema (se fornecido) pertencem ao usuário."""
     # Verifica o Tema
@@ -31,6 +48,26 @@ async def check_tema_subtema_ownership(db: AsyncSession, tema_id: int, subtema_i
     
     return True
 
+async def revincular_versiculo(db: AsyncSession, versiculo_id: int, user_id: int, valores: dict) -> dict:
+    """Recalcula referência canônica e texto próprio quando a referência, o texto ou a tradução mudam."""
+    result = await db.execute(
+        select(VersiculoTema).filter(VersiculoTema.id == versiculo_id, VersiculoTema.usuario_id == user_id)
+    )
+    atual = result.scalars().first()
+    if not atual:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Versículo não encontrado ou não pertence ao usuário")
+
+    referencia = valores.get("versiculo", atual.versiculo)
+    if "descricao_versiculo" in valores:
+        descricao = valores["descricao_versiculo"]
+    elif referencia != atual.versiculo:
+        # O texto próprio era da referência antiga
+        descricao = None
+    else:
+        descricao = atual.descricao_versiculo
+    traducao = valores.pop("traducao", None) or atual.traducao
+    return vincular_versiculo(referencia, descricao, traducao)
+
 # --- Rotas para Versículos por Tema ---
 
 @router.post("/", response_model=VersiculoSchema, status_code=status.HTTP_201_CREATED)
@@ -38,18 +75,39 @@ async def create_versiculo(versiculo: VersiculoTemaCreate, db: AsyncSession = De
     """Cria um novo versículo por tema."""
     await check_tema_subtema_ownership(db, versiculo.tema_id, versiculo.subtema_id, current_user.id)
     
+    # Aponta para o texto canônico; só guarda o texto do usuário se ele for diferente
+    dados = versiculo.model_dump(exclude={"traducao"})
+    dados.update(vincular_versiculo(versiculo.versiculo, versiculo.descricao_versiculo, versiculo.traducao))
     new_versiculo = VersiculoTema(
-        **versiculo.model_dump(),
+        **dados,
         usuario_id=current_user.id
     )
     db.add(new_versiculo)
+    await registrar_atividade(db, current_user.id, "versiculo")
     await db.commit()
+    await invalidar_dashboard(current_user.id)
     await db.refresh(new_versiculo)
+    await autocomplete.registrar_versiculo(current_user.id, new_versiculo)
+    await canal_eventos.publicar(current_user.id, "versiculo", "criado", new_versiculo.id, VersiculoSchema.model_validate(new_versiculo))
     return new_versiculo
 
 @router.get("/", response_model=List[VersiculoSchema])
-async def read_versiculos(db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
-    """Lista todos os versículos por tema do usuário logado."""
+async def read_versiculos(
+    fields: Optional[str] = Query(None, description="Campos a retornar, separados por vírgula (ex: id,versiculo). O id sempre é incluído."),
+    view: str = Query("full", pattern="^(full|summary)$", description="'summary' omite descricao_versiculo"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Usuario = Depends(get_current_complete_user)
+):
+    """Lista todos os versículos por tema do usuário logado (aceita `?fields=` e `?view=summary`)."""
+    if fields or view == "summary" or settings.FAST_LIST_RESPONSES:
+        # Busca só as colunas pedidas (os textos longos nem saem do banco) e gera o JSON direto das tuplas
+        serializer = versiculo_summary_serializer if view == "summary" else versiculo_list_serializer
+        serializer = serializer.project(fields)
+        result = await db.execute(
+            serializer.select().filter(VersiculoTema.usuario_id == current_user.id).order_by(VersiculoTema.created_at.desc())
+        )
+        return serializer.response(result.all())
+
     result = await db.execute(
         select(VersiculoTema).filter(VersiculoTema.usuario_id == current_user.id).order_by(VersiculoTema.created_at.desc())
     )
@@ -57,7 +115,7 @@ async def read_versiculos(db: AsyncSession = Depends(get_db), current_user: Usua
     return versiculos
 
 @router.get("/{versiculo_id}", response_model=VersiculoSchema)
-async def read_versiculo(versiculo_id: int, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
+async def read_versiculo(versiculo_id: int, db: AsyncSession = Depends(get_read_db), current_user: Usuario = Depends(get_current_complete_user)):
     """Retorna um versículo específico."""
     result = await db.execute(
         select(VersiculoTema).filter(VersiculoTema.id == versiculo_id, VersiculoTema.usuario_id == current_user.id)
@@ -72,28 +130,41 @@ async def update_versiculo(versiculo_id: int, versiculo: VersiculoTemaUpdate, db
     """Atualiza um versículo por tema existente."""
     await check_tema_subtema_ownership(db, versiculo.tema_id, versiculo.subtema_id, current_user.id)
     
+    valores = versiculo.model_dump(exclude_unset=True)
+    if valores.keys() & {"versiculo", "descricao_versiculo", "traducao"}:
+        valores.update(await revincular_versiculo(db, versiculo_id, current_user.id, valores))
+
     stmt = update(VersiculoTema).where(VersiculoTema.id == versiculo_id, VersiculoTema.usuario_id == current_user.id).values(
-        **versiculo.model_dump(exclude_unset=True)
+        **valores
     )
     result = await db.execute(stmt)
     if result.rowcount == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Versículo não encontrado ou não pertence ao usuário")
     
     await db.commit()
+    await invalidar_dashboard(current_user.id)
     
     # Busca o versículo atualizado para retornar
     result = await db.execute(select(VersiculoTema).filter(VersiculoTema.id == versiculo_id))
     updated_versiculo = result.scalars().first()
+    await autocomplete.registrar_versiculo(current_user.id, updated_versiculo)
+    await canal_eventos.publicar(current_user.id, "versiculo", "atualizado", versiculo_id, VersiculoSchema.model_validate(updated_versiculo))
     return updated_versiculo
 
 @router.delete("/{versiculo_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_versiculo(versiculo_id: int, db: AsyncSession = Depends(get_db), current_user: Usuario = Depends(get_current_complete_user)):
     """Deleta um versículo por tema."""
-    stmt = delete(VersiculoTema).where(VersiculoTema.id == versiculo_id, VersiculoTema.usuario_id == current_user.id)
+    stmt = delete(VersiculoTema).where(VersiculoTema.id == versiculo_id, VersiculoTema.usuario_id == current_user.id).returning(VersiculoTema.created_at)
     result = await db.execute(stmt)
+    created_at = result.scalar_one_or_none()
     
-    if result.rowcount == 0:
+    if created_at is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Versículo não encontrado ou não pertence ao usuário")
     
+    await registrar_atividade(db, current_user.id, "versiculo", -1, created_at)
+    await registrar_remocoes(db, current_user.id, "versiculo", [versiculo_id])
     await db.commit()
+    await invalidar_dashboard(current_user.id)
+    await autocomplete.remover_versiculo(current_user.id, versiculo_id)
+    await canal_eventos.publicar(current_user.id, "versiculo", "removido", versiculo_id)
     return {"message": "Versículo deletado com sucesso"}